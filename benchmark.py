@@ -0,0 +1,750 @@
+# coding=UTF-8
+# 本更新脚本以GPL v3.0开源
+# 性能基准：在本机启动模拟镜像和Git远程仓库，测量测速、下载、解压、复制和Git更新各步骤的耗时
+import os
+import io
+import sys
+import json
+import time
+import random
+import shutil
+import hashlib
+import zipfile
+import argparse
+import platform
+import compileall
+import tempfile
+import threading
+import statistics
+import subprocess
+import contextlib
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# 默认的模拟镜像：延迟、带宽（字节/秒）、失败率、是否支持 Range
+DEFAULT_MIRRORS = [
+    {"latency_ms": 20, "bandwidth_bps": 8 * 1024 * 1024, "failure_rate": 0.0, "ranges": True},
+    {"latency_ms": 80, "bandwidth_bps": 2 * 1024 * 1024, "failure_rate": 0.0, "ranges": True},
+    {"latency_ms": 150, "bandwidth_bps": 4 * 1024 * 1024, "failure_rate": 0.2, "ranges": True},
+    {"latency_ms": 50, "bandwidth_bps": 16 * 1024 * 1024, "failure_rate": 0.0, "ranges": False},
+]
+# 中位数比基准慢超过该比例视为性能退化
+DEFAULT_THRESHOLD = 0.2
+DEFAULT_OUTPUT = "bench_results.json"
+# 模拟压缩包的顶层目录和镜像路径，与 get_music_xiaozhi_server.PROXY_URL 的格式一致
+ARCHIVE_TOP = "xiaozhi-esp32-server-music-master"
+ARCHIVE_PATH = "/https://github.com/XuSenfeng/xiaozhi-esp32-server-music/archive/refs/heads/master.zip"
+# 影响被测代码行为的环境变量，基准运行时清除，保证结果可复现
+_ISOLATED_ENV = ["XIAOZHI_GIT_CACHE", "XIAOZHI_FETCH_MODE", "XIAOZHI_FETCH_CALIBRATE", "XIAOZHI_MUSIC_SHA256",
+                 "XIAOZHI_MUSIC_SIZE", "XIAOZHI_BACKUP_CODEC"]
+# 启动导入耗时预算：入口 -> (导入语句, 预算毫秒, 不应加载的模块)
+# 耗时为 -X importtime 测得的导入时间，不含解释器本身的启动；检查更新和交互更新的启动路径不需要下载相关的依赖
+HEAVY_MODULES = ("requests", "urllib3", "tqdm", "mirror_probe", "http_client", "config_backup")
+IMPORT_BUDGETS = {
+    "xiaozhi.py": ("import xiaozhi", 5, HEAVY_MODULES),
+    "check/update": ("import xiaozhi, updater", 40, HEAVY_MODULES),
+    "install-music": ("import xiaozhi, init_music_xiaozhi_server", 40, HEAVY_MODULES),
+}
+_IMPORT_MARKER = "-- xiaozhi import budget --"
+_GIT_ENV = {"GIT_AUTHOR_NAME": "bench", "GIT_AUTHOR_EMAIL": "bench@localhost",
+            "GIT_COMMITTER_NAME": "bench", "GIT_COMMITTER_EMAIL": "bench@localhost"}
+
+
+class LocalMirror:
+    """
+    本机模拟镜像
+
+    任意路径的 GET/HEAD 都返回同一份文件；每个请求先等待 latency_ms，再按 bandwidth_bps 限速发送，
+    并以 failure_rate 的概率失败（一半返回 503，一半发送到一半时断开连接）；
+    ranges 为 False 时忽略 Range 请求头，总是返回完整文件
+    """
+
+    def __init__(self, data, latency_ms=0, bandwidth_bps=None, failure_rate=0.0, ranges=True, seed=0):
+        self.data = data
+        self.latency_ms = latency_ms
+        self.bandwidth_bps = bandwidth_bps
+        self.failure_rate = failure_rate
+        self.ranges = ranges
+        self.etag = f'"{hashlib.sha1(data).hexdigest()}"'
+        self.requests = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    @property
+    def archive_url(self):
+        return self.url + ARCHIVE_PATH
+
+    def start(self):
+        mirror = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_HEAD(self):
+                mirror._wait_latency()
+                self.send_response(200)
+                self._send_headers(len(mirror.data))
+
+            def do_GET(self):
+                mirror._wait_latency()
+                failure = mirror._roll_failure()
+                if failure == "status":
+                    self.send_response(503)
+                    self._send_headers(0)
+                    return
+                start, end = 0, len(mirror.data)
+                range_header = self.headers.get("Range")
+                if range_header and mirror.ranges:
+                    first, _, last = range_header[len("bytes="):].partition("-")
+                    start = int(first)
+                    end = min(int(last) + 1, len(mirror.data)) if last else len(mirror.data)
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {start}-{end - 1}/{len(mirror.data)}")
+                else:
+                    self.send_response(200)
+                self._send_headers(end - start)
+                if failure == "drop":
+                    end = start + (end - start) // 2
+                mirror._send_body(self.wfile, start, end)
+                if failure == "drop":
+                    self.close_connection = True
+
+            def _send_headers(self, length):
+                self.send_header("Content-Length", str(length))
+                self.send_header("ETag", mirror.etag)
+                if mirror.ranges:
+                    self.send_header("Accept-Ranges", "bytes")
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def _wait_latency(self):
+        with self._lock:
+            self.requests += 1
+        time.sleep(self.latency_ms / 1000)
+
+    def _roll_failure(self):
+        with self._lock:
+            if self._random.random() >= self.failure_rate:
+                return None
+            return self._random.choice(["status", "drop"])
+
+    def _send_body(self, wfile, start, end, block_size=64 * 1024):
+        """按带宽限速发送 [start, end) 的数据，客户端提前断开时直接结束"""
+        begin = time.monotonic()
+        sent = 0
+        try:
+            for offset in range(start, end, block_size):
+                block = self.data[offset:min(offset + block_size, end)]
+                wfile.write(block)
+                sent += len(block)
+                if self.bandwidth_bps:
+                    delay = begin + sent / self.bandwidth_bps - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+        except (ConnectionError, OSError):
+            pass
+
+
+def build_archive(size_mb=8, files=200, seed=0):
+    """
+    生成与上游结构相同的模拟压缩包：顶层目录下 main/xiaozhi-server 为服务端代码（含 data 目录），
+    另有 docs 目录用于验证只解压指定目录；一半文件为可压缩的文本，一半为随机数据，
+    注释为40位提交哈希（与 git archive 生成的压缩包相同）
+
+    返回:
+        压缩包内容（bytes）
+    """
+    rng = random.Random(seed)
+    per_file = max(1, size_mb * 1024 * 1024 // files)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+        for index in range(files):
+            if index % 10 == 0:
+                name = f"{ARCHIVE_TOP}/docs/doc{index}.md"
+            elif index % 10 == 1:
+                name = f"{ARCHIVE_TOP}/main/xiaozhi-server/data/conf{index}.yaml"
+            else:
+                name = f"{ARCHIVE_TOP}/main/xiaozhi-server/core/m{index // 50}/f{index}.py"
+            if index % 2:
+                line = f"# line {index} " + "x" * 60 + "\n"
+                content = (line * (per_file // len(line) + 1))[:per_file].encode("utf-8")
+            else:
+                content = rng.randbytes(per_file)
+            zf.writestr(name, content)
+        zf.comment = hashlib.sha1(buffer.getvalue()[:4096]).hexdigest().encode("ascii")
+    return buffer.getvalue()
+
+
+def _git(args, cwd=None):
+    subprocess.run(["git"] + args, cwd=cwd, env=dict(os.environ, **_GIT_ENV), check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def _write_commit(writer, rng, files, message, touched=5):
+    """在 writer 仓库中修改 touched 个文件并提交"""
+    for _ in range(touched):
+        index = rng.randrange(files)
+        path = os.path.join(writer, "main", "xiaozhi-server", "core", f"m{index // 50}", f"f{index}.py")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("".join(f"value_{rng.randrange(10 ** 9)} = {rng.random()}\n" for _ in range(100)))
+    _git(["add", "-A"], writer)
+    _git(["commit", "-q", "-m", message], writer)
+
+
+def build_git_remote(workdir, commits=50, files=100, seed=0):
+    """
+    生成带有 commits 个模拟提交的裸远程仓库（main 分支），以及用于之后推送新提交的工作仓库
+
+    返回:
+        (裸仓库路径, 工作仓库路径)
+    """
+    rng = random.Random(seed)
+    remote = os.path.join(workdir, "remote.git")
+    writer = os.path.join(workdir, "writer")
+    _git(["init", "-q", "--bare", "-b", "main", remote])
+    _git(["init", "-q", "-b", "main", writer])
+    for index in range(commits):
+        _write_commit(writer, rng, files, f"commit {index}")
+    _git(["remote", "add", "origin", remote], writer)
+    _git(["push", "-q", "origin", "main"], writer)
+    return remote, writer
+
+
+def push_commits(writer, count=5, files=100, seed=0):
+    """向远程仓库推送 count 个新提交，供拉取类基准使用"""
+    rng = random.Random(seed)
+    for index in range(count):
+        _write_commit(writer, rng, files, f"update {index}")
+    _git(["push", "-q", "origin", "main"], writer)
+
+
+def make_install(root, remote, config_files=20):
+    """
+    按整合包的目录结构生成模拟安装：runtime/git-2.48.1/cmd/git.exe 指向系统 Git，
+    src 为远程仓库的克隆，并在 data 目录中放入配置文件供备份使用
+    """
+    git_dir = os.path.join(root, "runtime", "git-2.48.1", "cmd")
+    os.makedirs(git_dir, exist_ok=True)
+    git_exe = os.path.join(git_dir, "git.exe")
+    try:
+        os.symlink(shutil.which("git"), git_exe)
+    except OSError:
+        shutil.copy2(shutil.which("git"), git_exe)
+    _git(["clone", "-q", remote, os.path.join(root, "src")])
+    data_dir = os.path.join(root, "src", "main", "xiaozhi-server", "data")
+    os.makedirs(data_dir, exist_ok=True)
+    for index in range(config_files):
+        name = ".config.yaml" if index == 0 else f"conf{index}.yaml"
+        with open(os.path.join(data_dir, name), "w", encoding="utf-8") as f:
+            f.write(f"key_{index}: value\n" * 200)
+    return root
+
+
+class BenchContext:
+    """基准运行期间共用的模拟环境：镜像、压缩包、Git远程仓库和工作目录"""
+
+    def __init__(self, workdir, args):
+        self.workdir = workdir
+        self.args = args
+        self.mirrors = []
+        self.archive = None
+        self.remote = None
+        self.writer = None
+        self.pushes = 0
+        self.git_available = shutil.which("git") is not None
+
+    def path(self, *parts):
+        return os.path.join(self.workdir, *parts)
+
+    def setup(self):
+        self.archive = build_archive(self.args.archive_mb, seed=self.args.seed)
+        for index, spec in enumerate(self.args.mirrors):
+            self.mirrors.append(LocalMirror(self.archive, seed=self.args.seed + index, **spec).start())
+        if self.git_available:
+            self.remote, self.writer = build_git_remote(self.path("git"), self.args.commits, seed=self.args.seed)
+
+    def teardown(self):
+        for mirror in self.mirrors:
+            mirror.stop()
+
+    def reset_state(self):
+        """每次测量前清除镜像健康记录、拉取统计和已建立的连接，使每次测量条件相同"""
+        from http_client import reset_client
+
+        reset_client()
+        for name in (".mirror_health.json", ".fetch_stats.json"):
+            if os.path.exists(self.path(name)):
+                os.remove(self.path(name))
+
+
+def _fresh_dir(path):
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.makedirs(path)
+    return path
+
+
+def _remove(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def _extract_archive(ctx, extract_dir):
+    """解压模拟压缩包（不计时的准备步骤），返回服务端代码目录"""
+    with zipfile.ZipFile(io.BytesIO(ctx.archive)) as zf:
+        zf.extractall(extract_dir)
+    return os.path.join(extract_dir, ARCHIVE_TOP, "main", "xiaozhi-server")
+
+
+# 各项基准：setup 准备环境（不计时），run 为计时部分，返回附加指标或 None；
+# run 返回 False 或抛出异常时记为失败
+
+def _case_select_proxy_url(ctx):
+    import updater
+
+    def setup():
+        updater.get_github_proxy_urls = lambda: [mirror.url for mirror in ctx.mirrors]
+
+    def run():
+        if updater.select_proxy_url(deadline=5.0, use_cache=False) is None:
+            return False
+        return {"mirrors": len(ctx.mirrors)}
+
+    return setup, run
+
+
+def _case_download(ctx, segmented):
+    import get_music_xiaozhi_server as music
+
+    target = ctx.path("download", "master.zip")
+
+    def setup():
+        music.PROXY_URL = [mirror.archive_url for mirror in ctx.mirrors]
+        _fresh_dir(os.path.dirname(target))
+
+    def run():
+        start_time = time.perf_counter()
+        result = music.download_file_with_fallbacks(target, retries=3, segmented=segmented)
+        if not result:
+            return False
+        elapsed = time.perf_counter() - start_time
+        return {"bytes": os.path.getsize(result), "throughput_bps": os.path.getsize(result) / elapsed}
+
+    return setup, run
+
+
+def _case_extract_repo(ctx, incremental):
+    """
+    get_music_xiaozhi_server.main 中的解压步骤，解压目录每次都是新建的（main 结束时会删除它）；
+    incremental 时目标目录已装有同一版本，与其一致的文件硬链接过来而不解压
+    """
+    import get_music_xiaozhi_server as music
+    from dir_sync import sync_tree
+
+    archive = ctx.path("extract", "master.zip")
+    extract_dir = ctx.path("extract", "out")
+    target = ctx.path("extract", "music-xiaozhi-server")
+
+    def setup():
+        _fresh_dir(os.path.dirname(archive))
+        with open(archive, "wb") as f:
+            f.write(ctx.archive)
+        if incremental:
+            sync_tree(_extract_archive(ctx, ctx.path("extract", "previous")), target, preserve=music.PRESERVE_PATHS)
+
+    def run():
+        unpack_dir = music.extract_repo(archive, extract_dir, include=["main/xiaozhi-server"],
+                                        reuse=("main/xiaozhi-server", target))
+        paths = [os.path.join(root, name) for root, _, files in os.walk(unpack_dir) for name in files]
+        return {"files": len(paths), "reused_files": sum(os.stat(path).st_nlink > 1 for path in paths)}
+
+    return setup, run
+
+
+def _case_music_copy(ctx, incremental):
+    """get_music_xiaozhi_server.main 中把解压结果同步到音乐服务端目录的步骤"""
+    import get_music_xiaozhi_server as music
+    from dir_sync import sync_tree
+
+    target = ctx.path("copy", "music-xiaozhi-server")
+    source_root = ctx.path("copy", "unpack")
+
+    def setup():
+        _fresh_dir(ctx.path("copy"))
+        if incremental:
+            sync_tree(_extract_archive(ctx, ctx.path("copy", "previous")), target, preserve=music.PRESERVE_PATHS)
+        _extract_archive(ctx, source_root)
+
+    def run():
+        source = os.path.join(source_root, ARCHIVE_TOP, "main", "xiaozhi-server")
+        stats = sync_tree(source, target, preserve=music.PRESERVE_PATHS, move=True)
+        return {"copied_files": stats["copied_files"], "unchanged_files": stats["unchanged_files"]}
+
+    return setup, run
+
+
+def _case_music_main(ctx, streaming, incremental=False):
+    """
+    get_music_xiaozhi_server.main 完整流程（下载、解压、复制），在独立的工作目录中运行；
+    incremental 时先不计时地完整运行一次，再计时第二次运行（目标目录已是同一版本）
+    """
+    import get_music_xiaozhi_server as music
+
+    workdir = ctx.path("music_main")
+
+    def setup():
+        music.PROXY_URL = [mirror.archive_url for mirror in ctx.mirrors]
+        _fresh_dir(workdir)
+        os.chdir(workdir)
+        if incremental:
+            music.main(streaming=streaming, check_first=False)
+
+    def run():
+        music.main(streaming=streaming, check_first=False)
+        if not os.path.isdir(os.path.join(workdir, "src", "main", "music-xiaozhi-server")):
+            return False
+        return None
+
+    return setup, run
+
+
+def _case_copy_config_and_models(ctx, hardlink):
+    """
+    init_music_xiaozhi_server.copy_config_and_models：配置文件经内容寻址仓库复制，模型文件直接复制，
+    hardlink 时（--hardlink）模型文件经仓库硬链接
+
+    该函数按 Windows 路径拼接目录，其他系统上改为直接执行它所做的仓库导入、生成和复制步骤
+    """
+    import init_music_xiaozhi_server as init_music
+    from blob_store import BlobStore
+    from dir_sync import scan_tree
+    from fast_copy import copy_file
+
+    root = ctx.path("init_music")
+    src_server = os.path.join(root, "src", "main", "xiaozhi-server")
+    dst_server = os.path.join(root, "src", "main", "music-xiaozhi-server")
+    model = "models/SenseVoiceSmall/model.pt"
+
+    def setup():
+        _fresh_dir(root)
+        _remove(ctx.path(".blobs"))
+        os.makedirs(os.path.join(src_server, "models", "SenseVoiceSmall"))
+        os.makedirs(os.path.join(src_server, "data"))
+        os.makedirs(dst_server)
+        with open(os.path.join(src_server, *model.split("/")), "wb") as f:
+            f.write(random.Random(ctx.args.seed).randbytes(ctx.args.model_mb * 1024 * 1024))
+        for index in range(20):
+            with open(os.path.join(src_server, "data", f"conf{index}.yaml"), "w", encoding="utf-8") as f:
+                f.write(f"key_{index}: value\n" * 200)
+
+    def run():
+        if os.name == "nt":
+            init_music.scripts_dir = root
+            return init_music.copy_config_and_models(hardlink=hardlink)
+        store = BlobStore()
+        files, _ = scan_tree(os.path.join(src_server, "data"))
+        store.materialize(store.ingest(src_server, [f"data/{rel}" for rel in files]), dst_server)
+        if hardlink:
+            store.materialize(store.ingest(src_server, [model], immutable=True), dst_server, hardlink=True)
+        else:
+            copy_file(os.path.join(src_server, *model.split("/")), os.path.join(dst_server, *model.split("/")))
+        return {"model_bytes": os.path.getsize(os.path.join(dst_server, *model.split("/")))}
+
+    return setup, run
+
+
+def _case_updater(ctx, mode):
+    """updater.main 的普通拉取/强制同步路径，经 update_install 非交互执行"""
+    import updater
+
+    root = ctx.path(f"install_{mode}")
+
+    def setup():
+        _remove(root)
+        make_install(root, ctx.remote)
+        ctx.pushes += 1
+        push_commits(ctx.writer, ctx.args.new_commits, seed=ctx.args.seed + ctx.pushes)
+        if mode == "force":
+            # 强制同步需要覆盖的本地修改
+            with open(os.path.join(root, "src", "main", "xiaozhi-server", "local_change.py"), "w",
+                      encoding="utf-8") as f:
+                f.write("local = True\n")
+
+    def run():
+        report = updater.update_install(root, mode)
+        if report["status"] != "updated":
+            return False
+        return {"before": report["before"], "after": report["after"]}
+
+    return setup, run
+
+
+CASES = {
+    "select_proxy_url": lambda ctx: _case_select_proxy_url(ctx),
+    "download_segmented": lambda ctx: _case_download(ctx, segmented=True),
+    "download_single": lambda ctx: _case_download(ctx, segmented=False),
+    "extract_repo": lambda ctx: _case_extract_repo(ctx, incremental=False),
+    "extract_repo_incremental": lambda ctx: _case_extract_repo(ctx, incremental=True),
+    "music_copy_fresh": lambda ctx: _case_music_copy(ctx, incremental=False),
+    "music_copy_incremental": lambda ctx: _case_music_copy(ctx, incremental=True),
+    "music_main_streaming": lambda ctx: _case_music_main(ctx, streaming=True),
+    "music_main_fallback": lambda ctx: _case_music_main(ctx, streaming=False),
+    "music_main_fallback_incremental": lambda ctx: _case_music_main(ctx, streaming=False, incremental=True),
+    "copy_config_and_models": lambda ctx: _case_copy_config_and_models(ctx, hardlink=False),
+    "copy_config_and_models_hardlink": lambda ctx: _case_copy_config_and_models(ctx, hardlink=True),
+    "updater_pull": lambda ctx: _case_updater(ctx, "normal"),
+    "updater_force": lambda ctx: _case_updater(ctx, "force"),
+}
+# 需要系统中有 git 命令的基准
+GIT_CASES = {"updater_pull", "updater_force"}
+
+
+def run_case(ctx, name, repeat, log):
+    """
+    运行一项基准 repeat 次
+
+    返回:
+        结果字典: seconds（每次耗时）, median, min, mean, metrics（最后一次的附加指标）,
+        error（失败原因，成功时为 None）
+    """
+    result = {"seconds": [], "median": None, "min": None, "mean": None, "metrics": {}, "error": None}
+    if name in GIT_CASES and not ctx.git_available:
+        result["error"] = "未找到 git 命令，已跳过"
+        return result
+    cwd = os.getcwd()
+    try:
+        setup, run = CASES[name](ctx)
+        for _ in range(repeat):
+            with contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+                ctx.reset_state()
+                setup()
+                start_time = time.perf_counter()
+                metrics = run()
+                elapsed = time.perf_counter() - start_time
+            os.chdir(cwd)
+            if metrics is False:
+                result["error"] = "执行失败，详见日志"
+                break
+            result["seconds"].append(elapsed)
+            result["metrics"] = metrics or {}
+    except BaseException as e:
+        if isinstance(e, KeyboardInterrupt):
+            raise
+        # sys.exit 等也记为该项失败，不中断其余基准
+        result["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        os.chdir(cwd)
+    if result["seconds"]:
+        result["median"] = statistics.median(result["seconds"])
+        result["min"] = min(result["seconds"])
+        result["mean"] = statistics.mean(result["seconds"])
+    return result
+
+
+def run_benchmarks(args):
+    """
+    在临时目录中搭建模拟环境并运行选定的基准
+
+    返回:
+        结果字典: created, platform, python, config, results（各项基准的结果）
+    """
+    workdir = tempfile.mkdtemp(prefix="xiaozhi_bench_")
+    # 被测模块在导入时读取这些路径，必须在导入前设置
+    for name in _ISOLATED_ENV:
+        os.environ.pop(name, None)
+    os.environ["XIAOZHI_MIRROR_HEALTH"] = os.path.join(workdir, ".mirror_health.json")
+    os.environ["XIAOZHI_FETCH_STATS"] = os.path.join(workdir, ".fetch_stats.json")
+    os.environ["XIAOZHI_BLOB_STORE"] = os.path.join(workdir, ".blobs")
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    ctx = BenchContext(workdir, args)
+    report = {
+        "created": time.time(),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "config": {"repeat": args.repeat, "archive_mb": args.archive_mb, "model_mb": args.model_mb,
+                   "commits": args.commits, "new_commits": args.new_commits, "seed": args.seed,
+                   "mirrors": args.mirrors},
+        "results": {},
+    }
+    log_path = os.path.join(workdir, "bench.log")
+    try:
+        print(f"准备模拟环境: {workdir}")
+        ctx.setup()
+        with open(log_path, "w", encoding="utf-8") as log:
+            for name in args.cases:
+                print(f"运行 {name} ...", end="", flush=True)
+                result = run_case(ctx, name, args.repeat, sys.stdout if args.verbose else log)
+                report["results"][name] = result
+                print(f" ❌ {result['error']}" if result["error"] else f" {result['median']:.3f}秒")
+    finally:
+        ctx.teardown()
+        if args.keep:
+            print(f"模拟环境和日志保留在: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return report
+
+
+def compare(report, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    与基准结果比较各项的中位数耗时
+
+    返回:
+        [(名称, 基准中位数, 本次中位数, 变化比例, 状态)]，状态为 regressed/improved/same/new/failed
+    """
+    rows = []
+    base_results = baseline.get("results", {})
+    for name, result in report["results"].items():
+        base = base_results.get(name, {}).get("median")
+        current = result["median"]
+        if current is None:
+            rows.append((name, base, None, None, "failed"))
+        elif base is None:
+            rows.append((name, None, current, None, "new"))
+        else:
+            change = current / base - 1 if base > 0 else 0.0
+            status = "regressed" if change > threshold else "improved" if change < -threshold else "same"
+            rows.append((name, base, current, change, status))
+    return rows
+
+
+def print_comparison(rows):
+    status_text = {"regressed": "❌ 退化", "improved": "🎉 提升", "same": "✅ 持平", "new": "新增", "failed": "❌ 失败"}
+    # 表头为全角字符，按显示宽度手工对齐
+    print("\n基准项" + " " * 20 + "  基准(秒)  本次(秒)     变化  结果")
+    for name, base, current, change, status in rows:
+        base_text = f"{base:.3f}" if base is not None else "-"
+        current_text = f"{current:.3f}" if current is not None else "-"
+        change_text = f"{change * 100:+.1f}%" if change is not None else "-"
+        print(f"{name:<26}{base_text:>10}{current_text:>10}{change_text:>9}  {status_text[status]}")
+
+
+def measure_import(statement, repeat=3):
+    """
+    在新的解释器中用 -X importtime 测量一条导入语句，取 repeat 次中的最小值
+
+    测量前先编译字节码，避免把编译时间算入导入耗时
+
+    返回:
+        (耗时毫秒, 导入的模块名集合)
+    """
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    compileall.compile_dir(script_dir, maxlevels=0, quiet=1)
+    code = f"import sys; sys.stderr.write({_IMPORT_MARKER!r} + '\\n'); {statement}"
+    best, modules = None, set()
+    for _ in range(repeat):
+        process = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=script_dir,
+                                 capture_output=True, text=True, encoding="utf-8", errors="replace")
+        if process.returncode != 0 or _IMPORT_MARKER not in process.stderr:
+            raise RuntimeError(f"导入失败: {process.stderr.strip().splitlines()[-1:]}")
+        total = 0
+        # 每行为 "import time: 自身耗时 | 累计耗时 | 模块名"，模块名前的缩进表示嵌套层级
+        for line in process.stderr.split(_IMPORT_MARKER, 1)[1].splitlines():
+            parts = line.split("|")
+            if not line.startswith("import time:") or len(parts) != 3 or not parts[1].strip().isdigit():
+                continue
+            modules.add(parts[2].strip())
+            if not parts[2].startswith("  "):
+                total += int(parts[1])
+        best = total if best is None else min(best, total)
+    return best / 1000, modules
+
+
+def check_import_budgets(repeat=3):
+    """
+    检查各入口的导入耗时是否超出 IMPORT_BUDGETS，以及是否加载了不应加载的模块
+
+    返回:
+        全部通过时为 True
+    """
+    ok = True
+    print("\n入口" + " " * 14 + "  耗时(毫秒)  预算(毫秒)  结果")
+    for name, (statement, budget_ms, forbidden) in IMPORT_BUDGETS.items():
+        elapsed_ms, modules = measure_import(statement, repeat)
+        loaded = [module for module in forbidden if module in modules]
+        passed = elapsed_ms <= budget_ms and not loaded
+        ok = ok and passed
+        status = "✅ 通过" if passed else "❌ 超出预算" if not loaded else f"❌ 加载了 {', '.join(loaded)}"
+        print(f"{name:<18}{elapsed_ms:>12.1f}{budget_ms:>12}  {status}")
+    return ok
+
+
+def _parse_mirrors(text):
+    """镜像设置：每个镜像为 延迟ms:带宽KB/s:失败率:range或norange，多个镜像以逗号分隔"""
+    mirrors = []
+    for item in text.split(","):
+        latency, bandwidth, failure_rate, ranges = item.split(":")
+        mirrors.append({"latency_ms": float(latency), "bandwidth_bps": float(bandwidth) * 1024,
+                        "failure_rate": float(failure_rate), "ranges": ranges == "range"})
+    return mirrors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="小智AI服务端更新脚本性能基准")
+    parser.add_argument("--cases", default=",".join(CASES),
+                        help=f"要运行的基准，以逗号分隔，可选: {', '.join(CASES)}")
+    parser.add_argument("--repeat", type=int, default=3, help="每项基准的重复次数")
+    parser.add_argument("--archive-mb", type=int, default=8, help="模拟压缩包大小（MB）")
+    parser.add_argument("--model-mb", type=int, default=32, help="模拟模型文件大小（MB）")
+    parser.add_argument("--commits", type=int, default=50, help="模拟远程仓库的历史提交数")
+    parser.add_argument("--new-commits", type=int, default=5, help="每次拉取前推送到远程的新提交数")
+    parser.add_argument("--mirrors", type=_parse_mirrors, default=DEFAULT_MIRRORS,
+                        help="镜像设置，如 20:8192:0:range,150:2048:0.2:norange（延迟ms:带宽KB/s:失败率:是否支持Range）")
+    parser.add_argument("--seed", type=int, default=0, help="随机数种子")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="结果JSON文件")
+    parser.add_argument("--baseline", help="用于比较的基准结果JSON文件")
+    parser.add_argument("--update-baseline", action="store_true", help="把本次结果写入 --baseline 指定的文件")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="判定为退化的变慢比例")
+    parser.add_argument("--keep", action="store_true", help="保留模拟环境和日志")
+    parser.add_argument("--verbose", action="store_true", help="显示被测代码的输出")
+    parser.add_argument("--import-budgets", action="store_true",
+                        help="只检查各入口的启动导入耗时和不应加载的模块（--repeat 为测量次数）")
+    args = parser.parse_args(argv)
+    if args.import_budgets:
+        sys.exit(0 if check_import_budgets(args.repeat) else 1)
+    args.cases = [name.strip() for name in args.cases.split(",") if name.strip()]
+    unknown = [name for name in args.cases if name not in CASES]
+    if unknown:
+        parser.error(f"未知的基准: {', '.join(unknown)}")
+
+    report = run_benchmarks(args)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n📊 结果已保存到: {args.output}")
+
+    regressed = False
+    if args.baseline and os.path.exists(args.baseline) and not args.update_baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            rows = compare(report, json.load(f), args.threshold)
+        print_comparison(rows)
+        regressed = any(row[4] in ("regressed", "failed") for row in rows)
+    elif args.baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"✅ 已写入基准结果: {args.baseline}")
+    failed = any(result["error"] for result in report["results"].values())
+    sys.exit(1 if regressed or failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+# coding=UTF-8
+# 本更新脚本以GPL v3.0开源
+# 按内容寻址的模型与资源仓库，多个服务端目录共享同一份数据
+import os
+import sys
+import json
+import time
+import hashlib
+
+from fast_copy import copy_file, file_sha256
+
+# 默认仓库位置，可通过环境变量覆盖
+DEFAULT_STORE_DIR = os.environ.get(
+    "XIAOZHI_BLOB_STORE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".blobs")
+)
+
+
+class BlobStore:
+    """
+    内容寻址仓库
+
+    objects/<哈希前2位>/<SHA-256> 保存文件内容，manifests/ 下每个服务端目录一份清单，
+    记录该目录中由仓库提供的文件（相对路径 → 哈希、大小、修改时间）；
+    服务端目录通过硬链接或写时复制克隆从仓库生成文件，磁盘占用只与不同内容的数量有关
+    """
+
+    def __init__(self, root=DEFAULT_STORE_DIR):
+        self.root = os.path.abspath(root)
+        self.objects_dir = os.path.join(self.root, "objects")
+        self.manifests_dir = os.path.join(self.root, "manifests")
+
+    def blob_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def manifest_path(self, server_dir):
+        """清单文件名由目录名和绝对路径的哈希组成，不同位置的同名目录互不冲突"""
+        server_dir = os.path.normcase(os.path.abspath(server_dir))
+        key = hashlib.sha1(server_dir.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.manifests_dir, f"{os.path.basename(server_dir)}-{key}.json")
+
+    def on_same_device(self, *paths):
+        """
+        仓库与这些路径在同一文件系统上（尚不存在的路径按最近的已存在上级目录判断）
+
+        不在同一文件系统时无法硬链接，经仓库中转会把文件完整复制两次
+        """
+        return len({_device(path) for path in (self.root,) + paths}) == 1
+
+    def load_manifest(self, server_dir):
+        try:
+            with open(self.manifest_path(server_dir), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"root": os.path.abspath(server_dir), "files": {}}
+
+    def save_manifest(self, server_dir, manifest):
+        os.makedirs(self.manifests_dir, exist_ok=True)
+        path = self.manifest_path(server_dir)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    def ingest(self, server_dir, rel_paths, immutable=False, progress=None):
+        """
+        把服务端目录中的文件放入仓库并记入该目录的清单
+
+        清单中大小和修改时间未变的文件直接沿用记录的哈希，不重新计算
+
+        参数:
+            server_dir: 服务端目录
+            rel_paths: 相对路径列表（使用 / 分隔）
+            immutable: 文件不会被原地修改（如模型文件），可直接硬链接进仓库；
+                配置文件等会被编辑的文件必须为 False，以复制或克隆方式入库
+            progress: 进度回调，参数为新增的字节数，仓库中已有的内容直接计为完成
+
+        返回:
+            {相对路径: 清单条目}
+        """
+        manifest = self.load_manifest(server_dir)
+        entries = {}
+        for rel in rel_paths:
+            path = os.path.join(server_dir, *rel.split("/"))
+            stat = os.stat(path)
+            entry = manifest["files"].get(rel)
+            if not (entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime
+                    and os.path.exists(self.blob_path(entry["sha256"]))):
+                digest = file_sha256(path)
+                entry = {"sha256": digest, "size": stat.st_size, "mtime": stat.st_mtime}
+                blob = self.blob_path(digest)
+                if not os.path.exists(blob):
+                    copy_file(path, blob, progress=progress, hardlink=immutable, skip_same=False)
+                elif progress:
+                    progress(stat.st_size)
+            elif progress:
+                progress(stat.st_size)
+            entries[rel] = entry
+        manifest["files"].update(entries)
+        self.save_manifest(server_dir, manifest)
+        return entries
+
+    def materialize(self, entries, server_dir, hardlink=False, progress=None):
+        """
+        按清单条目从仓库生成服务端目录中的文件并记入该目录的清单
+
+        参数:
+            entries: ingest() 返回的 {相对路径: 清单条目}
+            server_dir: 目标服务端目录
+            hardlink: 用硬链接生成文件（只适用于不会被原地修改的文件），
+                否则优先写时复制克隆，不支持时复制
+            progress: 进度回调，参数为新增的字节数
+
+        返回:
+            {相对路径: 使用的复制方式}
+        """
+        manifest = self.load_manifest(server_dir)
+        methods = {}
+        for rel, entry in entries.items():
+            path = os.path.join(server_dir, *rel.split("/"))
+            current = manifest["files"].get(rel)
+            if current and current["sha256"] == entry["sha256"] and _matches_stat(path, current):
+                # 清单记录的就是这份内容，且文件之后没有被修改过
+                methods[rel] = "skipped"
+                if progress:
+                    progress(current["size"])
+                continue
+            methods[rel] = copy_file(self.blob_path(entry["sha256"]), path, progress=progress, hardlink=hardlink)
+            stat = os.stat(path)
+            manifest["files"][rel] = {"sha256": entry["sha256"], "size": stat.st_size, "mtime": stat.st_mtime}
+        self.save_manifest(server_dir, manifest)
+        return methods
+
+    def gc(self):
+        """
+        清理仓库
+
+        删除目录已不存在的清单、清单中已被删除或修改过的文件记录，
+        再删除没有任何清单引用的内容
+
+        返回:
+            (删除的内容数, 释放的字节数)
+        """
+        referenced = set()
+        if os.path.isdir(self.manifests_dir):
+            for name in os.listdir(self.manifests_dir):
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(self.manifests_dir, name)
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        manifest = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                if not os.path.isdir(manifest.get("root", "")):
+                    os.remove(path)
+                    continue
+                files = {}
+                for rel, entry in manifest["files"].items():
+                    if _matches_stat(os.path.join(manifest["root"], *rel.split("/")), entry):
+                        files[rel] = entry
+                        referenced.add(entry["sha256"])
+                if files != manifest["files"]:
+                    manifest["files"] = files
+                    self.save_manifest(manifest["root"], manifest)
+
+        removed = 0
+        freed = 0
+        if os.path.isdir(self.objects_dir):
+            for prefix in os.listdir(self.objects_dir):
+                prefix_dir = os.path.join(self.objects_dir, prefix)
+                for digest in os.listdir(prefix_dir):
+                    if digest not in referenced:
+                        path = os.path.join(prefix_dir, digest)
+                        freed += os.path.getsize(path)
+                        os.remove(path)
+                        removed += 1
+                if not os.listdir(prefix_dir):
+                    os.rmdir(prefix_dir)
+        return removed, freed
+
+
+def _device(path):
+    """路径所在文件系统的设备号"""
+    path = os.path.abspath(path)
+    while not os.path.exists(path) and os.path.dirname(path) != path:
+        path = os.path.dirname(path)
+    return os.stat(path).st_dev
+
+
+def _matches_stat(path, entry):
+    """文件存在且大小和修改时间与清单条目一致"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return False
+    return stat.st_size == entry["size"] and stat.st_mtime == entry["mtime"]
+
+
+def main():
+    """命令行：python blob_store.py gc [仓库目录]"""
+    if len(sys.argv) < 2 or sys.argv[1] != "gc":
+        print("用法: python blob_store.py gc [仓库目录]")
+        sys.exit(1)
+    store = BlobStore(sys.argv[2] if len(sys.argv) > 2 else DEFAULT_STORE_DIR)
+    start_time = time.time()
+    removed, freed = store.gc()
+    print(f"✅ 已清理 {removed} 个未引用的文件，释放 {freed/(1024 * 1024):.2f} MB，耗时 {time.time()-start_time:.2f}秒")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+# coding=UTF-8
+# 本更新脚本以GPL v3.0开源
+# 配置快照备份：未变化的文件硬链接到上一个快照，只保存变化的文件，按保留策略清理旧快照
+import os
+import sys
+import gzip
+import json
+import time
+import shutil
+import hashlib
+import argparse
+from datetime import datetime
+
+from dir_sync import scan_tree, MTIME_TOLERANCE
+from fast_copy import file_sha256
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+SNAPSHOT_PREFIX = "snapshot_"
+MANIFEST_NAME = "manifest.json"
+# 快照中保存文件的子目录，根目录只放清单，数据文件不会与清单同名
+FILES_DIR = "files"
+# 压缩方式及对应的文件后缀；zstd 需要安装 zstandard，未安装时改用 gzip
+CODECS = {"none": "", "gzip": ".gz", "zstd": ".zst"}
+# 默认保留策略：最近10个，以及最近7天每天、最近4周每周的最后一个快照
+DEFAULT_RETENTION = {"keep_last": 10, "keep_daily": 7, "keep_weekly": 4}
+
+
+def list_snapshots(backup_root):
+    """
+    列出完整的快照（有清单文件的），从新到旧排列
+
+    返回:
+        [(快照目录, 清单)]
+    """
+    snapshots = []
+    if not os.path.isdir(backup_root):
+        return snapshots
+    for name in os.listdir(backup_root):
+        if not name.startswith(SNAPSHOT_PREFIX) or name.endswith(".tmp"):
+            continue
+        path = os.path.join(backup_root, name)
+        try:
+            with open(os.path.join(path, MANIFEST_NAME), "r", encoding="utf-8") as f:
+                snapshots.append((path, json.load(f)))
+        except (OSError, ValueError):
+            continue
+    # 同一秒内创建的快照名称带 _2、_3 等后缀，名称越长越新
+    snapshots.sort(key=lambda s: (s[1]["created"], len(s[0]), s[0]), reverse=True)
+    return snapshots
+
+
+def create_snapshot(data_dir, backup_root, codec="none"):
+    """
+    为 data_dir 创建快照
+
+    与上一个快照相比大小和修改时间都没变的文件直接硬链接，内容与上一个快照中
+    某个文件相同的（如改名）也硬链接，其余文件复制或压缩保存，都放在快照的 files 子目录中；
+    快照先在临时目录中生成，写入清单后才改为正式名称，中途失败不会留下不完整的快照
+
+    参数:
+        data_dir: 要备份的目录
+        backup_root: 快照存放目录
+        codec: 变化文件的保存方式 "none"、"gzip" 或 "zstd"
+
+    返回:
+        (快照目录, 统计字典: stored_files, stored_bytes, linked_files, elapsed)
+    """
+    start_time = time.time()
+    if codec == "zstd" and zstandard is None:
+        print("⚠️ 未安装 zstandard，改用 gzip 压缩")
+        codec = "gzip"
+    if codec not in CODECS:
+        raise ValueError(f"未知的压缩方式: {codec}")
+
+    previous = list_snapshots(backup_root)
+    previous_dir, previous_manifest = previous[0] if previous else (None, {"files": {}})
+    by_hash = {entry["sha256"]: entry for entry in previous_manifest["files"].values()}
+
+    created = datetime.now()
+    name = f"{SNAPSHOT_PREFIX}{created.strftime('%Y%m%d%H%M%S')}"
+    snapshot_dir = os.path.join(backup_root, name)
+    suffix = 1
+    while os.path.exists(snapshot_dir):
+        suffix += 1
+        snapshot_dir = os.path.join(backup_root, f"{name}_{suffix}")
+    tmp_dir = f"{snapshot_dir}.tmp"
+    os.makedirs(tmp_dir)
+
+    files, _ = scan_tree(data_dir)
+    manifest = {"created": created.timestamp(), "source": os.path.abspath(data_dir), "files": {}}
+    stats = {"stored_files": 0, "stored_bytes": 0, "linked_files": 0, "elapsed": 0.0}
+    try:
+        for rel, (size, mtime) in sorted(files.items()):
+            src = os.path.join(data_dir, *rel.split("/"))
+            old = previous_manifest["files"].get(rel)
+            if not (old and old["size"] == size and abs(old["mtime"] - mtime) <= MTIME_TOLERANCE):
+                old = by_hash.get(file_sha256(src))
+            # 链接到当前文件名对应的位置（旧版本的快照把文件直接放在快照根目录）
+            stored = f"{FILES_DIR}/{rel}{CODECS[old['codec']]}" if old else None
+            if old and previous_dir and _link(os.path.join(previous_dir, *old["stored"].split("/")),
+                                               os.path.join(tmp_dir, *stored.split("/"))):
+                entry = dict(old, mtime=mtime, stored=stored)
+                stats["linked_files"] += 1
+            else:
+                entry = _store(src, tmp_dir, rel, codec)
+                entry["mtime"] = mtime
+                stats["stored_files"] += 1
+                stats["stored_bytes"] += entry["stored_size"]
+            manifest["files"][rel] = entry
+        # 先写临时文件再替换，不会打开并截断任何与其他快照共享的文件
+        manifest_path = os.path.join(tmp_dir, MANIFEST_NAME)
+        with open(f"{manifest_path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(f"{manifest_path}.tmp", manifest_path)
+        os.replace(tmp_dir, snapshot_dir)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    stats["elapsed"] = time.time() - start_time
+    return snapshot_dir, stats
+
+
+def restore_snapshot(snapshot_dir, data_dir, delete=False):
+    """
+    把快照恢复到 data_dir
+
+    大小和修改时间与清单一致的文件视为未变化，不重新写入；其余文件先写临时文件再替换
+
+    参数:
+        snapshot_dir: 快照目录
+        data_dir: 恢复到的目录
+        delete: 删除快照中没有的文件
+
+    返回:
+        统计字典: restored_files, unchanged_files, deleted_files, elapsed
+    """
+    start_time = time.time()
+    with open(os.path.join(snapshot_dir, MANIFEST_NAME), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    current, _ = scan_tree(data_dir)
+    stats = {"restored_files": 0, "unchanged_files": 0, "deleted_files": 0, "elapsed": 0.0}
+    for rel, entry in manifest["files"].items():
+        info = current.get(rel)
+        if info and info[0] == entry["size"] and abs(info[1] - entry["mtime"]) <= MTIME_TOLERANCE:
+            stats["unchanged_files"] += 1
+            continue
+        dst = os.path.join(data_dir, *rel.split("/"))
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        tmp_path = f"{dst}.restoring"
+        with _open_stored(os.path.join(snapshot_dir, *entry["stored"].split("/")), entry["codec"]) as fsrc, \
+                open(tmp_path, "wb") as fdst:
+            shutil.copyfileobj(fsrc, fdst, 1024 * 1024)
+        os.utime(tmp_path, (entry["mtime"], entry["mtime"]))
+        os.replace(tmp_path, dst)
+        stats["restored_files"] += 1
+    if delete:
+        for rel in current:
+            if rel not in manifest["files"]:
+                os.remove(os.path.join(data_dir, *rel.split("/")))
+                stats["deleted_files"] += 1
+    stats["elapsed"] = time.time() - start_time
+    return stats
+
+
+def apply_retention(backup_root, keep_last=10, keep_daily=7, keep_weekly=4):
+    """
+    按保留策略删除旧快照：保留最近 keep_last 个，以及最近 keep_daily 天每天、
+    最近 keep_weekly 周每周的最后一个快照
+
+    快照之间只共享硬链接，删除任何一个都不影响其他快照
+
+    返回:
+        删除的快照目录列表
+    """
+    snapshots = list_snapshots(backup_root)
+    keep = set(path for path, _ in snapshots[:keep_last])
+    days = []
+    weeks = []
+    for path, manifest in snapshots:
+        created = datetime.fromtimestamp(manifest["created"])
+        day = created.date()
+        week = created.isocalendar()[:2]
+        if day not in days and len(days) < keep_daily:
+            days.append(day)
+            keep.add(path)
+        if week not in weeks and len(weeks) < keep_weekly:
+            weeks.append(week)
+            keep.add(path)
+    removed = []
+    for path, _ in snapshots:
+        if path not in keep:
+            shutil.rmtree(path, ignore_errors=True)
+            removed.append(path)
+    # 中途失败留下的临时目录
+    for name in os.listdir(backup_root) if os.path.isdir(backup_root) else []:
+        if name.startswith(SNAPSHOT_PREFIX) and name.endswith(".tmp"):
+            shutil.rmtree(os.path.join(backup_root, name), ignore_errors=True)
+    return removed
+
+
+def format_stats(stats):
+    """快照统计的简短描述"""
+    return (f"保存 {stats['stored_files']} 个变化的文件 ({stats['stored_bytes']/(1024 * 1024):.2f} MB)，"
+            f"沿用 {stats['linked_files']} 个未变化的文件，耗时 {stats['elapsed']:.2f}秒")
+
+
+def _store(src, snapshot_dir, rel, codec):
+    """
+    复制或压缩保存一个文件，同时计算原文件的SHA-256，返回清单条目
+
+    保存位置已被占用时（如 a 沿用了上一个快照的 a.gz，本次又有名为 a.gz 的文件）
+    改用带序号的文件名，不会写入硬链接到其他快照的文件
+    """
+    stored = f"{FILES_DIR}/{rel}{CODECS[codec]}"
+    counter = 1
+    while os.path.lexists(os.path.join(snapshot_dir, *stored.split("/"))):
+        counter += 1
+        stored = f"{FILES_DIR}/{rel}.{counter}{CODECS[codec]}"
+    dst = os.path.join(snapshot_dir, *stored.split("/"))
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    sha256 = hashlib.sha256()
+    size = 0
+    with open(src, "rb") as fsrc, _create_stored(dst, codec) as fdst:
+        for chunk in iter(lambda: fsrc.read(1024 * 1024), b""):
+            sha256.update(chunk)
+            fdst.write(chunk)
+            size += len(chunk)
+    return {"size": size, "sha256": sha256.hexdigest(), "stored": stored, "codec": codec,
+            "stored_size": os.path.getsize(dst)}
+
+
+def _create_stored(path, codec):
+    if codec == "gzip":
+        return gzip.open(path, "wb", compresslevel=6)
+    if codec == "zstd":
+        return zstandard.ZstdCompressor().stream_writer(open(path, "wb"), closefd=True)
+    return open(path, "wb")
+
+
+def _open_stored(path, codec):
+    if codec == "gzip":
+        return gzip.open(path, "rb")
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("恢复 zstd 压缩的快照需要安装 zstandard")
+        return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+    return open(path, "rb")
+
+
+def _link(src, dst):
+    """硬链接上一个快照中的文件，失败（如跨文件系统或已被删除）时返回 False"""
+    try:
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        os.link(src, dst)
+        return True
+    except OSError:
+        return False
+
+
+def main():
+    """命令行：python config_backup.py list|backup|restore|prune"""
+    default_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    parser = argparse.ArgumentParser(description="小智AI服务端配置快照备份")
+    parser.add_argument("command", choices=["list", "backup", "restore", "prune"])
+    parser.add_argument("snapshot", nargs="?", help="restore 使用的快照名称，默认为最新快照")
+    parser.add_argument("--root", default=default_root, help="整合包根目录")
+    parser.add_argument("--codec", choices=list(CODECS), default="none", help="变化文件的压缩方式")
+    parser.add_argument("--delete", action="store_true", help="restore 时删除快照中没有的文件")
+    args = parser.parse_args()
+
+    data_dir = os.path.join(args.root, "src", "main", "xiaozhi-server", "data")
+    backup_root = os.path.join(args.root, "backup")
+    snapshots = list_snapshots(backup_root)
+
+    if args.command == "list":
+        for path, manifest in snapshots:
+            created = datetime.fromtimestamp(manifest["created"]).strftime("%Y-%m-%d %H:%M:%S")
+            print(f"{os.path.basename(path)}  {created}  {len(manifest['files'])} 个文件")
+        if not snapshots:
+            print("还没有快照")
+    elif args.command == "backup":
+        snapshot_dir, stats = create_snapshot(data_dir, backup_root, args.codec)
+        print(f"✅ 已创建快照 {snapshot_dir}：{format_stats(stats)}")
+    elif args.command == "restore":
+        if not snapshots:
+            print("❌ 没有可恢复的快照")
+            sys.exit(1)
+        snapshot_dir = os.path.join(backup_root, args.snapshot) if args.snapshot else snapshots[0][0]
+        if not os.path.isfile(os.path.join(snapshot_dir, MANIFEST_NAME)):
+            print(f"❌ 快照不存在: {snapshot_dir}")
+            sys.exit(1)
+        stats = restore_snapshot(snapshot_dir, data_dir, args.delete)
+        print(f"✅ 已从 {os.path.basename(snapshot_dir)} 恢复 {stats['restored_files']} 个文件，"
+              f"{stats['unchanged_files']} 个未变化，删除 {stats['deleted_files']} 个，耗时 {stats['elapsed']:.2f}秒")
+    else:
+        removed = apply_retention(backup_root, **DEFAULT_RETENTION)
+        print(f"✅ 已删除 {len(removed)} 个旧快照")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+# coding=UTF-8
+# 本更新脚本以GPL v3.0开源
+# 目录增量同步：只复制变化的文件，只删除已移除的文件
+import os
+import time
+import shutil
+import fnmatch
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+# 修改时间比较的容差（秒），FAT 文件系统的时间精度为2秒
+MTIME_TOLERANCE = 2
+
+
+def scan_tree(root):
+    """
+    扫描目录
+
+    返回:
+        (文件字典 {相对路径: (大小, 修改时间)}, 子目录相对路径集合)，路径统一使用 / 分隔
+    """
+    files = {}
+    dirs = set()
+    if not os.path.isdir(root):
+        return files, dirs
+    stack = [""]
+    while stack:
+        relative = stack.pop()
+        with os.scandir(os.path.join(root, relative)) as entries:
+            for entry in entries:
+                path = f"{relative}/{entry.name}" if relative else entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    dirs.add(path)
+                    stack.append(path)
+                else:
+                    stat = entry.stat()
+                    files[path] = (stat.st_size, stat.st_mtime)
+    return files, dirs
+
+
+def sync_tree(source, target, hash_content=False, delete=True, preserve=None,
+              move=False, atomic=True, max_workers=8):
+    """
+    把 source 目录增量同步到 target
+
+    参数:
+        source: 源目录
+        target: 目标目录
+        hash_content: 大小相同但修改时间不同时，比较内容哈希再决定是否复制
+        delete: 是否删除目标中源目录已没有的文件
+        preserve: 即使源目录没有也保留的文件通配符（相对路径），如 "data/*"
+        move: 直接移动源文件而不是复制（源目录之后不再使用时更快）
+        atomic: 先在暂存目录中组装新目录（未变化的文件用硬链接），再整体替换目标目录，
+            使新目录一次性可见；为 False 时直接在目标目录中修改
+        max_workers: 并行复制的线程数
+
+    返回:
+        统计字典: copied_files, copied_bytes, deleted_files, unchanged_files, elapsed
+    """
+    start_time = time.time()
+    preserve = preserve or []
+    src_files, src_dirs = scan_tree(source)
+    dst_files, _ = scan_tree(target)
+
+    changed = [rel for rel, info in src_files.items()
+               if not _same_file(source, target, rel, info, dst_files.get(rel), hash_content)]
+    changed_set = set(changed)
+    unchanged = [rel for rel in src_files if rel in dst_files and rel not in changed_set]
+    extra = [rel for rel in dst_files if rel not in src_files]
+    kept = [rel for rel in extra if not delete or any(fnmatch.fnmatch(rel, p) for p in preserve)]
+    kept_set = set(kept)
+    removed = [rel for rel in extra if rel not in kept_set]
+    stats = {
+        "copied_files": len(changed),
+        "copied_bytes": sum(src_files[rel][0] for rel in changed),
+        "deleted_files": len(removed),
+        "unchanged_files": len(unchanged),
+        "elapsed": 0.0,
+    }
+
+    if not changed and not removed and os.path.isdir(target):
+        stats["elapsed"] = time.time() - start_time
+        return stats
+
+    transfer = _move_file if move else shutil.copy2
+    if atomic:
+        staging = f"{target}.staging"
+        if os.path.exists(staging):
+            shutil.rmtree(staging)
+        os.makedirs(staging)
+        for rel in sorted(src_dirs):
+            os.makedirs(os.path.join(staging, rel), exist_ok=True)
+        # 未变化和需要保留的文件从旧目录硬链接过来，不复制数据
+        for rel in unchanged + kept:
+            dst = os.path.join(staging, rel)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            _link_or_copy(os.path.join(target, rel), dst)
+        _parallel(transfer, source, staging, changed, max_workers)
+        swap_directory(staging, target)
+    else:
+        os.makedirs(target, exist_ok=True)
+        for rel in sorted(src_dirs):
+            os.makedirs(os.path.join(target, rel), exist_ok=True)
+        # 先写临时文件再替换，避免改动与旧文件共享的硬链接
+        _parallel(lambda src, dst: _replace_file(transfer, src, dst), source, target, changed, max_workers)
+        for rel in removed:
+            os.remove(os.path.join(target, rel))
+
+    stats["elapsed"] = time.time() - start_time
+    return stats
+
+
+def format_stats(stats):
+    """同步统计的简短描述"""
+    return (f"复制 {stats['copied_files']} 个文件 ({stats['copied_bytes']/(1024 * 1024):.2f} MB)，"
+            f"删除 {stats['deleted_files']} 个，未变化 {stats['unchanged_files']} 个，"
+            f"耗时 {stats['elapsed']:.2f}秒")
+
+
+def swap_directory(staging_dir, target_path):
+    """
+    用暂存目录替换目标目录
+
+    先把旧目录改名让出位置，再把暂存目录改名为目标目录，两次改名之间没有复制，
+    替换失败时恢复旧目录
+    """
+    old_path = f"{target_path}.old"
+    if os.path.exists(old_path):
+        shutil.rmtree(old_path)
+    had_target = os.path.exists(target_path)
+    if had_target:
+        os.replace(target_path, old_path)
+    try:
+        os.replace(staging_dir, target_path)
+    except OSError:
+        if had_target:
+            os.replace(old_path, target_path)
+        raise
+    if had_target:
+        shutil.rmtree(old_path, ignore_errors=True)
+
+
+def _same_file(source, target, rel, src_info, dst_info, hash_content):
+    """按大小和修改时间（可选内容哈希）判断文件是否未变化"""
+    if dst_info is None or src_info[0] != dst_info[0]:
+        return False
+    if abs(src_info[1] - dst_info[1]) <= MTIME_TOLERANCE:
+        return True
+    if hash_content:
+        return _file_hash(os.path.join(source, rel)) == _file_hash(os.path.join(target, rel))
+    return False
+
+
+def _file_hash(path):
+    """计算文件内容的SHA-256"""
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def _parallel(transfer, source, target, paths, max_workers):
+    """用线程池并行复制或移动文件"""
+    def run(rel):
+        dst = os.path.join(target, rel)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        transfer(os.path.join(source, rel), dst)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(run, paths))
+
+
+def _move_file(src, dst):
+    """移动文件，跨文件系统时退化为复制"""
+    try:
+        os.replace(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _replace_file(transfer, src, dst):
+    """把文件传到临时名称后替换目标文件"""
+    tmp_path = f"{dst}.sync-tmp"
+    transfer(src, tmp_path)
+    os.replace(tmp_path, dst)
+
+
+def _link_or_copy(src, dst):
+    """创建硬链接，文件系统不支持时复制"""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
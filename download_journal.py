@@ -0,0 +1,161 @@
+# coding=UTF-8
+# 本更新脚本以GPL v3.0开源
+# 断点续传：.part 临时文件及其下载日志
+import os
+import json
+
+
+class DownloadJournal:
+    """
+    记录 <文件名>.part 的下载进度，日志保存在 <文件名>.part.json
+
+    日志包含来源地址、ETag/Last-Modified、文件总大小和已完成的字节区间，
+    续传前需用服务器返回的校验信息核对，只有下载完整的文件才会被改名为最终文件名
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.part_path = f"{filename}.part"
+        self.journal_path = f"{filename}.part.json"
+        self.url = None
+        self.etag = None
+        self.last_modified = None
+        self.total_size = None
+        self.done = []
+        self._load()
+
+    def _load(self):
+        """读取日志；日志或 .part 文件缺失、损坏时视为没有可续传的进度"""
+        try:
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if not os.path.exists(self.part_path):
+                return
+            self.url = data.get("url")
+            self.etag = data.get("etag")
+            self.last_modified = data.get("last_modified")
+            self.total_size = data.get("total_size")
+            self.done = _merge(data.get("done", []))
+        except (OSError, ValueError, TypeError):
+            self.done = []
+
+    def save(self):
+        """原子写入日志，调用前应先刷新 .part 文件的写缓冲"""
+        data = {
+            "url": self.url,
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+            "total_size": self.total_size,
+            "done": self.done,
+        }
+        tmp_path = f"{self.journal_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.journal_path)
+
+    def matches(self, etag=None, last_modified=None, total_size=None, url=None):
+        """
+        用服务器返回的校验信息核对日志，决定能否续传
+
+        同一镜像重试时，双方都有 ETag 或 Last-Modified 则必须一致；完全没有校验信息时
+        只在文件总大小已知且一致的情况下续传。换了镜像时各镜像的 ETag 等本就不同，
+        只核对总大小，内容由下载完成后的大小/摘要校验把关
+        """
+        if not self.done:
+            return False
+        if self.total_size is not None and total_size is not None and self.total_size != total_size:
+            return False
+        if url is not None and url != self.url:
+            return self.total_size is not None and self.total_size == total_size
+        if self.etag and etag:
+            return self.etag == etag
+        if self.last_modified and last_modified:
+            return self.last_modified == last_modified
+        return self.total_size is not None and self.total_size == total_size
+
+    def start(self, url, etag=None, last_modified=None, total_size=None, resume=False):
+        """
+        开始一次下载，resume 为 False 时清空 .part 文件重新开始
+
+        返回: 以追加/随机写方式打开的 .part 文件对象
+        """
+        if resume and url == self.url:
+            self.etag = etag or self.etag
+            self.last_modified = last_modified or self.last_modified
+        elif resume:
+            # 换了镜像续传，之后的重试按新镜像的校验信息核对
+            self.etag = etag
+            self.last_modified = last_modified
+        else:
+            self.etag = etag
+            self.last_modified = last_modified
+            self.total_size = None
+            self.done = []
+            with open(self.part_path, "wb"):
+                pass
+        self.url = url
+        if total_size is not None:
+            self.total_size = total_size
+        self.save()
+        return open(self.part_path, "r+b")
+
+    def prefix(self):
+        """从文件开头起连续完成的字节数，单线程续传从这里开始"""
+        if self.done and self.done[0][0] == 0:
+            return self.done[0][1]
+        return 0
+
+    def missing(self):
+        """尚未完成的字节区间列表，总大小未知时返回 None"""
+        if self.total_size is None:
+            return None
+        missing = []
+        pos = 0
+        for start, end in self.done:
+            if start > pos:
+                missing.append((pos, start))
+            pos = max(pos, end)
+        if pos < self.total_size:
+            missing.append((pos, self.total_size))
+        return missing
+
+    def mark_done(self, start, end):
+        """记录一个已写入的字节区间 [start, end)"""
+        if end > start:
+            self.done = _merge(self.done + [[start, end]])
+
+    def truncate(self, offset):
+        """丢弃 offset 之后的进度（这部分数据来自不可信的镜像，需要重新下载）"""
+        self.done = [[start, min(end, offset)] for start, end in self.done if start < offset]
+
+    def is_complete(self):
+        """总大小已知且所有字节均已完成"""
+        return self.total_size is not None and self.missing() == []
+
+    def finalize(self):
+        """校验 .part 文件大小后改名为最终文件名并删除日志"""
+        size = os.path.getsize(self.part_path)
+        if self.total_size is not None and size != self.total_size:
+            raise OSError(f"文件大小不符: {size} != {self.total_size}")
+        os.replace(self.part_path, self.filename)
+        self.discard(keep_part=True)
+        return os.path.abspath(self.filename)
+
+    def discard(self, keep_part=False):
+        """删除日志（以及 .part 文件）"""
+        paths = [self.journal_path] if keep_part else [self.journal_path, self.part_path]
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+        self.done = []
+
+
+def _merge(ranges):
+    """合并重叠或相邻的区间"""
+    merged = []
+    for start, end in sorted([int(s), int(e)] for s, e in ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
@@ -0,0 +1,156 @@
+# coding=UTF-8
+# 本更新脚本以GPL v3.0开源
+# 大文件快速复制：硬链接、写时复制克隆、内核零拷贝，最后才用用户态缓冲复制
+import os
+import sys
+import hashlib
+
+# Linux FICLONE ioctl，在 Btrfs/XFS 等写时复制文件系统上共享数据块
+_FICLONE = 0x40049409
+# 内核零拷贝每次调用复制的字节数，也是进度更新的粒度
+_KERNEL_CHUNK = 64 * 1024 * 1024
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """计算文件的SHA-256"""
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def same_content(src, dst):
+    """目标文件已存在且大小和SHA-256都与源文件一致"""
+    if not os.path.isfile(dst) or os.path.getsize(src) != os.path.getsize(dst):
+        return False
+    if os.path.samefile(src, dst):
+        return True
+    return file_sha256(src) == file_sha256(dst)
+
+
+def copy_file(src, dst, progress=None, hardlink=False, skip_same=True, chunk_size=1024 * 1024):
+    """
+    复制单个大文件，按以下顺序选择最快的可用方式：
+    已有相同内容则跳过 → 硬链接（需 hardlink=True）→ 写时复制克隆 →
+    Windows CopyFile2 → copy_file_range → sendfile → 缓冲读写
+
+    数据先写入临时文件，完成后再改名，中途失败不会留下不完整的目标文件
+
+    参数:
+        src: 源文件
+        dst: 目标文件
+        progress: 进度回调，参数为本次新增的字节数（可直接传入 tqdm.update）
+        hardlink: 允许用硬链接代替复制（两份文件共享数据，修改一份会影响另一份）
+        skip_same: 目标已有相同内容时跳过
+        chunk_size: 缓冲读写的块大小
+
+    返回:
+        实际使用的方式: "skipped", "hardlink", "reflink", "copyfile2",
+        "copy_file_range", "sendfile" 或 "buffered"
+    """
+    total_size = os.path.getsize(src)
+    progress = progress or (lambda n: None)
+    os.makedirs(os.path.dirname(os.path.abspath(dst)), exist_ok=True)
+
+    if skip_same and same_content(src, dst):
+        progress(total_size)
+        return "skipped"
+
+    tmp_path = f"{dst}.copying"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    try:
+        method = None
+        if hardlink:
+            try:
+                os.link(src, tmp_path)
+                method = "hardlink"
+            except OSError:
+                pass
+        if method is None:
+            method = _copy_data(src, tmp_path, total_size, progress, chunk_size)
+        if method != "hardlink":
+            _copy_times(src, tmp_path)
+        os.replace(tmp_path, dst)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    if method in ("hardlink", "reflink", "copyfile2"):
+        progress(total_size)
+    return method
+
+
+def _copy_data(src, dst, total_size, progress, chunk_size):
+    """依次尝试克隆和零拷贝方式，都不可用时缓冲复制"""
+    if sys.platform == "win32":
+        try:
+            import _winapi
+            if hasattr(_winapi, "CopyFile2"):
+                # 系统复制例程，在 ReFS/Dev Drive 上会自动使用块克隆
+                _winapi.CopyFile2(src, dst, 0)
+                return "copyfile2"
+        except OSError:
+            pass
+
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        if sys.platform.startswith("linux"):
+            try:
+                import fcntl
+                fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+                return "reflink"
+            except (ImportError, OSError):
+                pass
+
+        if hasattr(os, "copy_file_range") and _kernel_copy(os.copy_file_range, fsrc, fdst, total_size, progress):
+            return "copy_file_range"
+        if sys.platform.startswith("linux") and _kernel_copy(_sendfile, fsrc, fdst, total_size, progress):
+            return "sendfile"
+
+        fsrc.seek(0)
+        fdst.seek(0)
+        fdst.truncate()
+        while True:
+            chunk = fsrc.read(chunk_size)
+            if not chunk:
+                break
+            fdst.write(chunk)
+            progress(len(chunk))
+        return "buffered"
+
+
+def _sendfile(src_fd, dst_fd, count, offset_src=None, offset_dst=None):
+    """把 os.sendfile 包装成与 os.copy_file_range 相同的参数顺序，输出位置随写入自动前进"""
+    return os.sendfile(dst_fd, src_fd, offset_src, count)
+
+
+def _kernel_copy(copy_func, fsrc, fdst, total_size, progress):
+    """
+    用内核零拷贝接口复制，数据不经过用户态
+
+    首次调用就失败（文件系统或内核不支持）时返回 False，由调用方换用其他方式；
+    中途失败则抛出异常
+    """
+    src_fd, dst_fd = fsrc.fileno(), fdst.fileno()
+    copied = 0
+    while copied < total_size:
+        try:
+            sent = copy_func(src_fd, dst_fd, min(_KERNEL_CHUNK, total_size - copied), copied, copied)
+        except OSError:
+            if copied == 0:
+                return False
+            raise
+        if sent == 0:
+            break
+        copied += sent
+        progress(sent)
+    if copied != total_size:
+        raise OSError(f"复制不完整: {copied}/{total_size}")
+    return True
+
+
+def _copy_times(src, dst):
+    """保留源文件的访问和修改时间"""
+    stat = os.stat(src)
+    os.utime(dst, ns=(stat.st_atime_ns, stat.st_mtime_ns))
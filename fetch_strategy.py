@@ -0,0 +1,251 @@
+# coding=UTF-8
+# 本更新脚本以GPL v3.0开源
+# 强制更新的拉取策略：只拉单个分支、浅拉取或不含文件内容的部分拉取，并记录节省的流量和时间
+import os
+import time
+
+import metrics
+from git_runner import run_git_command
+from mirror_health import MirrorHealthStore, mirror_key
+from state_file import read_json, update_json
+
+# 可选的拉取方式
+#   all:     git fetch --all，所有远程的所有分支及完整历史（原来的做法）
+#   single:  只拉取 origin 的目标分支
+#   shallow: 只拉取目标分支最近 depth 个提交（或 shallow_since 之后的提交）
+#   partial: 拉取目标分支的全部提交和目录结构，文件内容在检出时按需下载
+FETCH_MODES = ("all", "single", "shallow", "partial")
+
+# 默认统计文件位置，可通过环境变量覆盖
+DEFAULT_STATS_FILE = os.environ.get(
+    "XIAOZHI_FETCH_STATS",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".fetch_stats.json")
+)
+# 低于该速度（字节/秒）的镜像视为慢速镜像，没有本地历史时只做浅拉取
+SLOW_MIRROR_BPS = 512 * 1024
+# 每个远程保留的统计记录条数
+MAX_HISTORY = 50
+# 设置环境变量 XIAOZHI_FETCH_CALIBRATE=1 后，自动方式下同一远程最近这么多次拉取中没有 all 方式的记录时，
+# 改用一次 all 作为估算节省量的基准；默认不校准，不为统计额外产生网络流量
+CALIBRATE_EVERY = 20
+
+
+def inspect_repo(git_path, remote="origin", branch="main", cwd=None):
+    """
+    读取本地仓库状态
+
+    返回:
+        字典: url（远程地址）, shallow（是否浅仓库）, partial（是否部分克隆）,
+        has_tracking（本地是否已有 remote/branch）
+    """
+    def git(*args):
+        result = run_git_command(git_path, list(args), echo=False, cwd=cwd)
+        return result["output"].strip() if result["code"] == 0 else ""
+
+    return {
+        "url": git("remote", "get-url", remote),
+        "shallow": git("rev-parse", "--is-shallow-repository") == "true",
+        "partial": git("config", "--get", f"remote.{remote}.promisor") == "true",
+        "has_tracking": bool(git("rev-parse", "--verify", "-q", f"refs/remotes/{remote}/{branch}")),
+    }
+
+
+def choose_fetch_mode(repo, bandwidth_bps=None):
+    """
+    按仓库状态和镜像速度自动选择拉取方式
+
+    - 已是浅仓库或部分克隆时保持原方式，避免补全历史或文件内容
+    - 本地已有远程分支时只拉单个分支，增量协商后只传输新提交
+    - 本地没有历史时，慢速或未测过速的镜像只浅拉取最新提交，快速镜像用部分拉取保留完整历史
+    """
+    if repo["shallow"]:
+        return "shallow"
+    if repo["partial"]:
+        return "partial"
+    if repo["has_tracking"]:
+        return "single"
+    if bandwidth_bps is None or bandwidth_bps < SLOW_MIRROR_BPS:
+        return "shallow"
+    return "partial"
+
+
+def build_fetch_args(mode, remote="origin", branch="main", depth=1, shallow_since=None, source=None):
+    """生成对应拉取方式的 git fetch 参数，source 为实际拉取的地址（如本机缓存），默认即 remote"""
+    if mode not in FETCH_MODES:
+        raise ValueError(f"未知的拉取方式: {mode}")
+    if mode == "all":
+        return ["fetch", "--all", "--progress"]
+    args = ["fetch", "--progress", "--no-tags"]
+    if mode == "shallow":
+        args.append(f"--shallow-since={shallow_since}" if shallow_since else f"--depth={depth}")
+    elif mode == "partial":
+        args.append("--filter=blob:none")
+    # 显式写出引用映射，使 remote/branch 一定被更新
+    args += [source or remote, f"+refs/heads/{branch}:refs/remotes/{remote}/{branch}"]
+    return args
+
+
+class FetchStats:
+    """
+    按远程地址记录每次拉取的方式、传输量和耗时
+
+    以同一远程最近几次 all 方式的结果为基准，估算其他方式节省的流量和时间；
+    自动方式从不选择 all，基准来自用户选择的 all 拉取，或启用 XIAOZHI_FETCH_CALIBRATE 后
+    由 needs_baseline() 触发的定期校准拉取
+    """
+
+    def __init__(self, path=DEFAULT_STATS_FILE):
+        self.path = path
+        self.data = read_json(path)
+        # 尚未保存的记录 [(远程地址, 记录)]
+        self._pending = []
+
+    def baseline(self, url):
+        """同一远程最近至多5次 all 方式的平均传输字节数和耗时，没有记录时返回 None"""
+        runs = [r for r in self.data.get(url, []) if r["mode"] == "all" and r["bytes"] is not None][-5:]
+        if not runs:
+            return None
+        return {
+            "bytes": sum(r["bytes"] for r in runs) / len(runs),
+            "duration": sum(r["duration"] for r in runs) / len(runs),
+        }
+
+    def needs_baseline(self, url):
+        """
+        该远程已有拉取记录，但最近 CALIBRATE_EVERY 次中没有 all 方式的结果
+
+        第一次拉取通常是首次同步等特殊情况，不用于校准；之后定期校准，使基准跟上仓库的变化
+        """
+        runs = self.data.get(url, [])
+        return bool(runs) and not any(r["mode"] == "all" and r["bytes"] is not None
+                                      for r in runs[-CALIBRATE_EVERY:])
+
+    def record(self, url, mode, result):
+        """
+        记录一次拉取
+
+        返回:
+            本次记录，包含 saved_bytes、saved_seconds（没有基准时为 None）
+        """
+        baseline = self.baseline(url)
+        run = {
+            "time": time.time(),
+            "mode": mode,
+            "bytes": result["bytes"],
+            "objects": result["objects"],
+            "duration": result["duration"],
+            "saved_bytes": None,
+            "saved_seconds": None,
+        }
+        if baseline and mode != "all":
+            run["saved_bytes"] = baseline["bytes"] - (result["bytes"] or 0)
+            run["saved_seconds"] = baseline["duration"] - result["duration"]
+        self.data.setdefault(url, []).append(run)
+        del self.data[url][:-MAX_HISTORY]
+        self._pending.append((url, run))
+        return run
+
+    def save(self):
+        """
+        加锁后把本进程新增的记录追加到文件中的最新内容上再原子写入，写入失败不影响主流程
+
+        批量更新时多个进程同时保存，各自的记录都会保留
+        """
+        pending = self._pending
+
+        def merge(current):
+            for url, run in pending:
+                runs = current.setdefault(url, [])
+                runs.append(run)
+                runs.sort(key=lambda r: r["time"])
+                del runs[:-MAX_HISTORY]
+            return current
+
+        try:
+            self.data = update_json(self.path, merge)
+            self._pending = []
+        except OSError as e:
+            print(f"⚠️ 拉取统计保存失败: {e}")
+
+
+def fetch_and_reset(git_path, mode="auto", remote="origin", branch="main", depth=1,
+                    shallow_since=None, health=None, stats=None, cwd=None, source=None):
+    """
+    按选定的方式拉取远程分支，再把工作区强制重置到该分支
+
+    传输量优先取 git 输出中的统计，没有时（对象较少时 git 不显示）用对象库增长量代替；
+    部分拉取在重置时按需下载的文件内容也计算在内
+
+    参数:
+        git_path: git 可执行文件路径
+        mode: FETCH_MODES 之一，或 "auto" 自动选择（自动选择时可用环境变量 XIAOZHI_FETCH_MODE 指定）
+        remote: 远程名
+        branch: 分支名
+        depth: shallow 方式拉取的提交数
+        shallow_since: shallow 方式改为拉取该日期之后的提交，如 "2025-01-01"
+        health: MirrorHealthStore，用于读取镜像速度并记录本次速度
+        stats: FetchStats，用于记录本次传输量
+        cwd: 仓库目录
+        source: 从该地址（如 git_cache 提供的本机缓存）拉取，仍更新 remote/branch；
+            不记录镜像速度，统计按该地址单独记录
+
+    返回:
+        拉取命令的结果字典，另加 mode、reset_code、saved_bytes、saved_seconds
+    """
+    health = health or MirrorHealthStore()
+    stats = stats or FetchStats()
+    repo = inspect_repo(git_path, remote, branch, cwd)
+    url = source or repo["url"]
+
+    # 调用方明确指定的方式（如从本机缓存拉取时的 single）不被环境变量覆盖
+    if mode == "auto":
+        mode = os.environ.get("XIAOZHI_FETCH_MODE", mode)
+    if mode == "auto":
+        entry = health.entries.get(mirror_key(repo["url"])) if repo["url"] else None
+        mode = choose_fetch_mode(repo, entry and entry["throughput_bps"])
+        # 已有本地历史时 all 只比 single 多拉其他分支的新提交，启用校准后定期用它校准节省量的基准；
+        # all 方式不经过 source，从本机缓存拉取时不校准
+        if (mode == "single" and url and not source and os.environ.get("XIAOZHI_FETCH_CALIBRATE") == "1"
+                and stats.needs_baseline(url)):
+            mode = "all"
+            print("\n本次用 all 方式拉取，作为估算节省流量和时间的基准")
+    print(f"\n拉取方式: {mode}")
+
+    size_before = _object_store_size(git_path, cwd)
+    with metrics.span("fetch"):
+        result = run_git_command(git_path, build_fetch_args(mode, remote, branch, depth, shallow_since, source),
+                                 cwd=cwd)
+    result["mode"] = mode
+    result["reset_code"] = None
+    result["saved_bytes"] = result["saved_seconds"] = None
+    if result["code"] != 0:
+        return result
+
+    with metrics.span("reset"):
+        reset = run_git_command(git_path, ["reset", "--hard", f"{remote}/{branch}"], cwd=cwd)
+    result["reset_code"] = reset["code"]
+    result["duration"] += reset["duration"]
+    if result["bytes"] is None or mode == "partial":
+        result["bytes"] = max(0, _object_store_size(git_path, cwd) - size_before)
+    metrics.count("bytes_downloaded", result["bytes"])
+    if not url:
+        return result
+
+    if result["bytes"] and not source:
+        health.record_success(url, throughput_bps=result["bytes"] / max(result["duration"], 1e-3))
+        health.save()
+    run = stats.record(url, mode, result)
+    stats.save()
+    result["saved_bytes"] = run["saved_bytes"]
+    result["saved_seconds"] = run["saved_seconds"]
+    return result
+
+
+def _object_store_size(git_path, cwd=None):
+    """对象库占用的字节数（松散对象加包文件）"""
+    result = run_git_command(git_path, ["count-objects", "-v"], echo=False, cwd=cwd)
+    values = dict(line.split(": ", 1) for line in result["output"].splitlines() if ": " in line)
+    try:
+        return (int(values.get("size", 0)) + int(values.get("size-pack", 0))) * 1024
+    except ValueError:
+        return 0
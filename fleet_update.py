@@ -0,0 +1,173 @@
+# coding=UTF-8
+# 本更新脚本以GPL v3.0开源
+# 批量更新：一次命令并行更新多个整合包，共用一次代理测速结果，最后汇总各整合包的结果和耗时
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import unicodedata
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from updater import select_proxy_url
+
+UPDATER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "updater.py")
+# 每个整合包的更新日志写在其根目录下
+LOG_NAME = "updater_fleet.log"
+# 单个整合包的最长更新时间（秒）
+DEFAULT_TIMEOUT = 30 * 60
+
+_STATUS_TEXT = {
+    "updated": "✅ 已更新",
+    "up_to_date": "🎉 已是最新",
+    "failed": "❌ 失败",
+}
+
+
+def load_roots(items):
+    """
+    整理整合包根目录列表
+
+    参数中的 .txt 文件按每行一个目录读取（# 开头为注释），重复的目录只保留一个
+    """
+    roots = []
+    for item in items:
+        if item.lower().endswith(".txt") and os.path.isfile(item):
+            with open(item, "r", encoding="utf-8") as f:
+                candidates = [line.strip() for line in f if line.strip() and not line.strip().startswith("#")]
+        else:
+            candidates = [item]
+        for root in candidates:
+            root = os.path.abspath(root)
+            if root not in roots:
+                roots.append(root)
+    return roots
+
+
+def update_one(root, mode="normal", proxy_url=None, reset_proxy=False, always=False, timeout=DEFAULT_TIMEOUT):
+    """
+    在子进程中运行 updater.py --unattended 更新一个整合包，输出写入其根目录下的日志
+
+    每个整合包使用独立进程，工作目录和输出互不干扰
+
+    返回:
+        updater.update_install 的结果字典，另加 log（日志路径）
+    """
+    start_time = time.time()
+    report = {"root": root, "status": "failed", "before": None, "after": None,
+              "duration": 0.0, "message": "", "log": os.path.join(root, LOG_NAME)}
+    fd, result_path = tempfile.mkstemp(prefix="xiaozhi_fleet_", suffix=".json")
+    os.close(fd)
+    command = [sys.executable, UPDATER_SCRIPT, "--unattended", root, "--mode", mode, "--result", result_path]
+    if proxy_url:
+        command += ["--proxy-url", proxy_url]
+    elif reset_proxy:
+        command.append("--no-proxy")
+    if always:
+        command.append("--always")
+
+    env = dict(os.environ, PYTHONIOENCODING="utf-8")
+    try:
+        with open(report["log"], "w", encoding="utf-8") as log:
+            subprocess.run(command, stdout=log, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL,
+                           timeout=timeout, env=env)
+        with open(result_path, "r", encoding="utf-8") as f:
+            report.update(json.load(f))
+    except subprocess.TimeoutExpired:
+        report["message"] = f"超时（{timeout}秒）"
+    except (OSError, ValueError) as e:
+        report["message"] = report["message"] or f"更新进程异常退出: {e}"
+    finally:
+        os.remove(result_path)
+    report["duration"] = time.time() - start_time
+    return report
+
+
+def run_fleet(roots, mode="normal", proxy="keep", workers=4, always=False, timeout=DEFAULT_TIMEOUT):
+    """
+    并行更新多个整合包
+
+    参数:
+        roots: 整合包根目录列表
+        mode: "normal" 普通拉取，"force" 备份配置后强制同步
+        proxy: "auto" 测速选择代理（所有整合包共用一次测速结果），
+            "none" 重置为默认地址，"keep" 保持各自现有的远程地址
+        workers: 同时更新的整合包数量
+        always: 远程没有新提交时也执行拉取
+        timeout: 单个整合包的最长更新时间（秒）
+
+    返回:
+        按 roots 顺序排列的结果字典列表
+    """
+    proxy_url = None
+    if proxy == "auto":
+        proxy_url = select_proxy_url()
+
+    print(f"\n开始批量更新 {len(roots)} 个整合包（并行 {workers} 个，模式: {mode}）")
+    reports = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {executor.submit(update_one, root, mode, proxy_url, proxy == "none", always, timeout): root
+                   for root in roots}
+        for done, future in enumerate(as_completed(futures), 1):
+            report = future.result()
+            reports[futures[future]] = report
+            print(f"[{done}/{len(roots)}] {_STATUS_TEXT[report['status']]}  {report['root']}  {report['duration']:.1f}秒")
+    return [reports[root] for root in roots]
+
+
+def print_summary(reports):
+    """打印各整合包的更新结果表"""
+    rows = [("整合包", "结果", "更新前", "更新后", "耗时", "说明")]
+    for report in reports:
+        rows.append((
+            report["root"],
+            _STATUS_TEXT[report["status"]],
+            (report["before"] or "-")[:7],
+            (report["after"] or "-")[:7],
+            f"{report['duration']:.1f}秒",
+            report["message"] + (f"（日志: {report['log']}）" if report["status"] == "failed" else ""),
+        ))
+    widths = [max(_display_width(row[i]) for row in rows) for i in range(len(rows[0]))]
+    print()
+    for index, row in enumerate(rows):
+        print("  ".join(_pad(cell, width) for cell, width in zip(row, widths)).rstrip())
+        if index == 0:
+            print("  ".join("-" * width for width in widths))
+    counts = {status: sum(r["status"] == status for r in reports) for status in _STATUS_TEXT}
+    print(f"\n共 {len(reports)} 个：已更新 {counts['updated']}，已是最新 {counts['up_to_date']}，失败 {counts['failed']}")
+
+
+def _display_width(text):
+    """终端显示宽度，中文等全角字符占两列"""
+    return sum(2 if unicodedata.east_asian_width(c) in ("W", "F") else 1 for c in text)
+
+
+def _pad(text, width):
+    return text + " " * (width - _display_width(text))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="批量更新多个小智AI服务端整合包")
+    parser.add_argument("roots", nargs="+", help="整合包根目录，或每行一个目录的 .txt 文件")
+    parser.add_argument("--mode", choices=["normal", "force"], default="normal",
+                        help="normal 普通拉取（保留本地修改），force 备份配置后强制同步")
+    parser.add_argument("--proxy", choices=["auto", "none", "keep"], default="keep",
+                        help="auto 测速选择代理，none 使用默认地址，keep 保持现有地址")
+    parser.add_argument("--workers", type=int, default=4, help="同时更新的整合包数量")
+    parser.add_argument("--always", action="store_true", help="远程没有新提交时也执行拉取")
+    parser.add_argument("--timeout", type=int, default=DEFAULT_TIMEOUT, help="单个整合包的最长更新时间（秒）")
+    args = parser.parse_args(argv)
+
+    roots = load_roots(args.roots)
+    if not roots:
+        print("没有需要更新的整合包")
+        sys.exit(1)
+    reports = run_fleet(roots, args.mode, args.proxy, args.workers, args.always, args.timeout)
+    print_summary(reports)
+    sys.exit(0 if all(r["status"] != "failed" for r in reports) else 1)
+
+
+if __name__ == "__main__":
+    main()
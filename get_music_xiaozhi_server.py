@@ -1,15 +1,31 @@
 import os
+import re
 import sys
+import json
 import time
 import shutil
+import zlib
+import fnmatch
 import zipfile
-import requests
+import threading
 from io import BytesIO
-from urllib3.util.retry import Retry
-from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
 from requests.exceptions import RequestException
+from http_client import get_client, Progress
+import metrics
+from mirror_health import MirrorHealthStore
+from segmented_download import segmented_download, parse_content_range
+from download_journal import DownloadJournal
+from integrity import IntegrityError, DownloadVerifier, expected_from_env
+from stream_unzip import StreamingZipExtractor, StreamingZipError
+from dir_sync import sync_tree, format_stats
+
+# 更新时即使新版本中没有也要保留的文件：用户配置和单独复制进来的语音识别模型
+PRESERVE_PATHS = ["data/*", "models/SenseVoiceSmall/model.pt"]
 
 DEFAULT_ZIP_URL = "https://github.com/XuSenfeng/xiaozhi-esp32-server-music/archive/refs/heads/master.zip"
+# Git 智能HTTP协议的引用列表，只有几KB，用来查询 master 分支的最新提交
+REPO_REFS_URL = "https://github.com/XuSenfeng/xiaozhi-esp32-server-music.git/info/refs?service=git-upload-pack"
 
 # 硬编码的代理地址
 PROXY_URL = [
@@ -30,13 +46,128 @@ PROXY_URL = [
     "https://ghproxy.net/https://github.com/XuSenfeng/xiaozhi-esp32-server-music/archive/refs/heads/master.zip"
 ]
 
-def download_file_with_fallbacks(filename="master.zip", retries=5):
+def _version_file(target_path):
+    """已安装版本记录放在目标目录旁边，目录被整体替换时不受影响"""
+    return f"{target_path}.version.json"
+
+
+def load_installed_version(target_path):
+    """读取已安装版本记录（validators, commit），没有记录时返回空字典"""
+    try:
+        with open(_version_file(target_path), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_installed_version(target_path, etag=None, last_modified=None, commit=None, url=None):
+    """
+    安装成功后记录版本，供下次更新前检查
+
+    不同镜像对同一内容给出的 ETag/Last-Modified 不同，按镜像地址分别记录（validators）；
+    提交未变时保留其他镜像之前记录的值，提交变化或未知时这些值对应的是旧内容，全部丢弃
+    """
+    previous = load_installed_version(target_path)
+    validators = {}
+    if commit and previous.get("commit") == commit:
+        validators.update(previous.get("validators") or {})
+    if url and (etag or last_modified):
+        validators[url] = {"etag": etag, "last_modified": last_modified}
+    state = {
+        "validators": validators,
+        "commit": commit,
+        "installed_at": time.time(),
+    }
+    tmp_path = f"{_version_file(target_path)}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, _version_file(target_path))
+
+
+def _zip_commit(comment):
+    """从压缩包注释中取出提交哈希（GitHub 生成的压缩包注释就是提交哈希）"""
+    match = re.fullmatch(rb"\s*([0-9a-f]{40})\s*", comment or b"")
+    return match.group(1).decode('ascii') if match else None
+
+
+def fetch_remote_commit(mirrors=None, timeout=(5, 10)):
+    """
+    通过镜像查询远程 master 分支的最新提交
+
+    返回:
+        提交哈希，所有镜像都失败时返回None
+    """
+    headers = {'User-Agent': 'git/2.48.1'}
+    for url in mirrors or PROXY_URL:
+        refs_url = url.split("/https://github.com/")[0] + "/" + REPO_REFS_URL
+        try:
+            response = get_client().get(refs_url, headers=headers, timeout=timeout)
+            response.raise_for_status()
+        except RequestException:
+            continue
+        match = re.search(rb"([0-9a-f]{40}) refs/heads/master\b", response.content)
+        if match:
+            return match.group(1).decode('ascii')
+    return None
+
+
+def check_for_update(target_path, max_mirrors=3, timeout=(5, 10)):
+    """
+    检查远程是否有新版本，只发一次小请求，不下载压缩包
+
+    向记录过 ETag/Last-Modified 的镜像发条件请求，只与该镜像自己记录的值比较
+    （304 或 ETag 相同即为最新）；没有记录或镜像不支持条件请求时比较远程 master 分支的提交哈希
+
+    返回:
+        True 有新版本（或尚未安装），False 已是最新，None 无法判断
+    """
+    state = load_installed_version(target_path)
+    if not state or not os.path.isdir(target_path):
+        return True
+
+    health = MirrorHealthStore()
+    mirrors = health.ranked(PROXY_URL)[:max_mirrors]
+    validators = state.get("validators") or {}
+    for url in mirrors:
+        stored = validators.get(url)
+        if not stored:
+            continue
+        headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
+        if stored.get("etag"):
+            headers['If-None-Match'] = stored["etag"]
+        if stored.get("last_modified"):
+            headers['If-Modified-Since'] = stored["last_modified"]
+        try:
+            response = get_client().head(url, headers=headers, timeout=timeout, allow_redirects=True)
+        except RequestException:
+            continue
+        if response.status_code == 304:
+            return False
+        etag = response.headers.get('ETag')
+        if response.ok and etag and stored.get("etag"):
+            return etag != stored["etag"]
+
+    if state.get("commit"):
+        remote_commit = fetch_remote_commit(mirrors, timeout)
+        if remote_commit:
+            return remote_commit != state["commit"]
+    return None
+
+
+def download_file_with_fallbacks(filename="master.zip", retries=5, segmented=True,
+                                 expected_sha256=None, expected_size=None):
     """
     通过镜像源列表下载文件，支持失败自动切换和重试
     
+    优先从多个支持 Range 的镜像分段并发下载，不支持时逐个镜像单线程下载；
+    给出预期摘要或大小时边下载边校验，内容不符的镜像会被暂时拉黑
+    
     参数:
         filename: 保存的文件名
         retries: 每个地址的最大重试次数
+        segmented: 是否尝试多镜像分段下载
+        expected_sha256: 可信的预期SHA-256，默认读取环境变量 XIAOZHI_MUSIC_SHA256
+        expected_size: 可信的预期大小（字节），默认读取环境变量 XIAOZHI_MUSIC_SIZE
         
     返回: 
         成功返回文件路径，失败返回None
@@ -50,44 +181,127 @@ def download_file_with_fallbacks(filename="master.zip", retries=5):
     if not os.path.exists(os.path.dirname(filename)):
         os.makedirs(os.path.dirname(filename) or os.getcwd(), exist_ok=True)
     
-    for idx, url in enumerate(PROXY_URL):
-        print(f"尝试镜像源 #{idx+1}/{len(PROXY_URL)}: {url.split('//')[1].split('/')[0]}")
+    if expected_sha256 is None and expected_size is None:
+        expected_sha256, expected_size = expected_from_env("XIAOZHI_MUSIC")
+    
+    # 按历史健康记录排序，近期表现好的镜像优先尝试，已被拉黑的镜像不使用
+    health = MirrorHealthStore()
+    mirrors = health.usable(PROXY_URL)
+    # 下载先写入 .part 文件，重试和切换镜像时从已完成的位置续传
+    journal = DownloadJournal(filename)
+    verifier = DownloadVerifier(journal.part_path, expected_sha256, expected_size)
+    # 与测速、分段下载共用连接池，重试和切换镜像时复用已建立的连接
+    client = get_client()
+    
+    if segmented:
+        result = segmented_download(mirrors, filename, headers=headers, health=health, journal=journal,
+                                    verifier=verifier)
+        health.save()
+        if result:
+            return result
+        mirrors = health.usable(PROXY_URL)
+    
+    for idx, url in enumerate(mirrors):
+        if health.is_blacklisted(url):
+            continue
+        if idx > 0:
+            metrics.count("mirror_switches")
+        print(f"尝试镜像源 #{idx+1}/{len(mirrors)}: {url.split('//')[1].split('/')[0]}")
         
         # 每个地址尝试多次
         for attempt in range(1, retries + 1):
+            resume_offset = None  # 本次请求开始写入的位置
+            verifying = False
             try:
                 start_time = time.time()
-                response = requests.get(
-                    url,
-                    headers=headers,
-                    stream=True,  # 流式下载大文件
-                    timeout=(5, 15)  # 连接超时5秒，读取超时15秒
-                )
-                
-                # 检查响应状态
-                response.raise_for_status()
+                response, resume = _open_download(url, headers, journal)
+                first_byte_ms = (time.time() - start_time) * 1000
                 
                 # 获取文件大小
-                total_size = int(response.headers.get('content-length', 0))
+                if response.status_code == 206:
+                    total_size = parse_content_range(response.headers)[2] or 0
+                else:
+                    total_size = int(response.headers.get('content-length', 0))
                 print(f"文件大小: {total_size/(1024 * 1024):.2f} MB" if total_size > 0 else "文件大小: 未知")
+                verifier.check_total(total_size)
                 
                 # 下载文件
-                downloaded = 0
-                with open(filename, 'wb') as f:
-                    for chunk in response.iter_content(chunk_size=8192):
+                f = journal.start(url, response.headers.get('ETag'), response.headers.get('Last-Modified'),
+                                  total_size or None, resume=resume)
+                offset = resume_offset = journal.prefix() if resume else 0
+                if not resume:
+                    verifier.reset()
+                if offset:
+                    print(f"从 {offset/(1024 * 1024):.2f} MB 处继续下载")
+                downloaded = offset
+                progress = Progress(total_size)
+                try:
+                    f.seek(offset)
+                    # 每次读取并写入1MB，而不是每8KB一次
+                    for chunk in client.iter_chunks(response):
                         if chunk:
+                            verifier.update(url, downloaded, chunk)
                             f.write(chunk)
                             downloaded += len(chunk)
-                            if total_size > 0:
-                                progress = downloaded / total_size * 100
-                                print(f"\r下载进度: {progress:.1f}%", end='', flush=True)
+                            metrics.count("bytes_downloaded", len(chunk))
+                            progress.update(downloaded)
+                            # 每写入4MB记录一次进度
+                            if downloaded - offset >= 4 * 1024 * 1024:
+                                f.flush()
+                                journal.mark_done(offset, downloaded)
+                                journal.save()
+                                offset = downloaded
+                finally:
+                    f.close()
+                    journal.mark_done(offset, downloaded)
+                    journal.save()
+                    progress.close(downloaded)
                 
                 if total_size > 0:
-                    print()
-                print(f"✅ 下载成功! 耗时: {time.time()-start_time:.2f}秒")
-                return os.path.abspath(filename)
+                    if downloaded < total_size:
+                        raise RequestException(f"连接中断，已下载 {downloaded}/{total_size} 字节")
+                else:
+                    journal.total_size = downloaded
+                verifying = True
+                verifier.verify(downloaded)
+                # 之前多个镜像一起下载校验失败时，与这份校验通过的文件比对，拉黑提供了错误数据的镜像
+                if verifier.suspects:
+                    for bad_url in verifier.blame(journal.part_path):
+                        print(f"⚠️ {bad_url.split('//')[1].split('/')[0]} 提供的数据与校验通过的文件不符，已拉黑")
+                        health.blacklist(bad_url, "提供的数据与校验通过的文件不符")
+                elapsed = time.time() - start_time
+                print(f"✅ 下载成功! 耗时: {elapsed:.2f}秒")
+                health.record_success(url, latency_ms=first_byte_ms,
+                                      throughput_bps=downloaded / max(elapsed - first_byte_ms / 1000, 1e-3))
+                health.save()
+                return journal.finalize()
                 
+            except IntegrityError as e:
+                print(f"\n❌ 下载内容校验失败: {e}")
+                if verifying:
+                    journal.discard()
+                    source = verifier.single_source()
+                    if source is None:
+                        # 续传时数据来自多个镜像，无法确定是哪个有误，只记失败，从头只用这个镜像重新下载，
+                        # 校验通过后再比对找出有误的镜像
+                        for contributor in verifier.contributors:
+                            health.record_failure(contributor, f"校验失败: {e}")
+                        verifier.keep_suspects()
+                        verifier.reset()
+                        health.save()
+                        continue
+                    health.blacklist(source, str(e))
+                else:
+                    health.blacklist(url, str(e))
+                    if resume_offset is not None:
+                        journal.truncate(resume_offset)
+                        journal.save()
+                verifier.reset()
+                health.save()
+                break
             except RequestException as e:
+                health.record_failure(url, type(e).__name__)
+                metrics.count("retries")
                 wait_time = min(5, attempt * 1.5)  # 指数退避等待
                 print(f"尝试 #{attempt} 失败: {type(e).__name__}{f' - {str(e)}' if str(e) else ''}")
                 if attempt < retries:
@@ -96,18 +310,63 @@ def download_file_with_fallbacks(filename="master.zip", retries=5):
                     
         print("-" * 60)
     
+    health.save()
     print("❌ 所有镜像源均尝试失败")
     return None
 
 
-def extract_repo(filename="master.zip", extract_dir="./"):
+def _open_download(url, headers, journal):
+    """
+    发起下载请求，日志中有已完成的部分时带 Range 请求续传
+
+    同一镜像重试时带 If-Range，文件已变化则服务器直接返回完整文件；换了镜像时
+    各镜像的 ETag 不同，不带 If-Range，只要文件总大小一致就接着下载，由最终的大小/摘要校验把关
+
+    返回:
+        (响应对象, 是否续传)；服务器文件已变化或不支持续传时重新发起完整请求
+    """
+    client = get_client()
+    offset = journal.prefix()
+    if offset:
+        request_headers = dict(headers)
+        request_headers['Range'] = f"bytes={offset}-"
+        validator = journal.etag or journal.last_modified
+        if validator and journal.url == url:
+            request_headers['If-Range'] = validator
+        response = client.get(url, headers=request_headers, stream=True)
+        response.raise_for_status()
+        if response.status_code == 206:
+            start, _, total_size = parse_content_range(response.headers)
+            if start == offset and journal.matches(response.headers.get('ETag'),
+                                                   response.headers.get('Last-Modified'), total_size, url):
+                return response, True
+        elif response.status_code == 200:
+            # 服务器不支持续传或文件已变化，返回的是完整文件，直接从头使用
+            print("服务器文件已变化或不支持续传，从头下载")
+            return response, False
+        response.close()
+        print("续传校验失败，从头下载")
+    
+    # 流式下载大文件，超时按该镜像的延迟自动设置
+    response = client.get(url, headers=headers, stream=True)
+    # 检查响应状态
+    response.raise_for_status()
+    return response, False
+
+
+def extract_repo(filename="master.zip", extract_dir="./", include=None, exclude=None, max_workers=None,
+                 reuse=None):
     """
     下载GitHub的ZIP文件并解压
     
     参数:
-        zip_url: GitHub仓库的ZIP文件URL
         filename: 保存的文件名 (默认 master.zip)
         extract_dir: 解压目录 (默认当前目录)
+        include: 只解压这些目录前缀下的文件（相对于压缩包顶层目录），None 表示全部
+        exclude: 跳过匹配这些通配符的文件（相对于压缩包顶层目录），如 "*.md"
+        max_workers: 并行解压的线程数
+        reuse: (压缩包内的目录前缀, 本地目录)，如已安装的目标目录；本地目录中大小和CRC都与条目一致的文件
+               直接硬链接到解压目录，不再解压写入
     返回:
         解压后的完整目录路径
     """
@@ -117,13 +376,17 @@ def extract_repo(filename="master.zip", extract_dir="./"):
             os.makedirs(extract_dir, exist_ok=True)
             print(f"创建目录: {os.path.abspath(extract_dir)}")
         
-        # 检查zip文件是否存在
+        # 检查zip文件是否存在，旧版本可能留下不完整的文件
+        if os.path.exists(filename) and not zipfile.is_zipfile(filename):
+            print(f"已存在的 {filename} 不完整，重新下载")
+            os.remove(filename)
         if os.path.exists(filename):
             print(f"已存在 {filename}，直接解压")
         else:
             # 下载zip
             print(f"下载 {filename}...")
-            result = download_file_with_fallbacks(filename)
+            with metrics.span("download"):
+                result = download_file_with_fallbacks(filename)
             if result:
                 print(f"文件已保存至: {result}")
                 if os.path.exists(result):
@@ -141,7 +404,12 @@ def extract_repo(filename="master.zip", extract_dir="./"):
             with zipfile.ZipFile(filename, 'r') as zip_ref:
                 # 获取顶层目录名
                 first_dir = zip_ref.namelist()[0].split('/')[0] if zip_ref.namelist() else "repo"
-                zip_ref.extractall(extract_dir)
+                members = _select_members(zip_ref.infolist(), include, exclude)
+            
+            with metrics.span("extract"):
+                written, skipped = _extract_members(filename, members, extract_dir, max_workers, reuse)
+            metrics.count("files_written", written)
+            print(f"解压 {written} 个文件，跳过 {skipped} 个未变化的文件")
             
             extracted_path = os.path.abspath(os.path.join(extract_dir, first_dir))
             print(f"解压完成! 文件位于: {extracted_path}")
@@ -160,10 +428,215 @@ def extract_repo(filename="master.zip", extract_dir="./"):
         print(f"解压过程中发生错误: {e}")
         sys.exit(1)
 
-def main():
+def _select_members(infolist, include=None, exclude=None):
+    """按目录前缀和通配符筛选需要解压的文件条目"""
+    prefixes = [p.strip('/') + '/' for p in include] if include else None
+    members = []
+    for info in infolist:
+        if info.is_dir():
+            continue
+        relative = info.filename.split('/', 1)[1] if '/' in info.filename else info.filename
+        if prefixes is not None and not any(relative.startswith(p) for p in prefixes):
+            continue
+        if exclude and any(fnmatch.fnmatch(relative, pattern) for pattern in exclude):
+            continue
+        members.append(info)
+    return members
+
+
+def _extract_members(filename, members, extract_dir, max_workers=None, reuse=None):
+    """
+    用线程池并行解压文件条目，每个条目一个任务
+    
+    解压目录中已有大小和CRC都与条目一致的文件时跳过，不重新写入；给出 reuse 时
+    reuse 目录中一致的文件硬链接过来，无法硬链接时照常解压
+    
+    返回:
+        (写入的文件数, 跳过的文件数)
+    """
+    local = threading.local()
+    opened = []
+    base_dir = os.path.abspath(extract_dir)
+    reuse_prefix, reuse_dir = ([p for p in reuse[0].split('/') if p], reuse[1]) if reuse else (None, None)
+    
+    def unchanged(path, info):
+        return os.path.isfile(path) and os.path.getsize(path) == info.file_size and _file_crc32(path) == info.CRC
+    
+    def extract(info):
+        parts = [p for p in info.filename.split('/') if p]
+        if any(p in ('..', '.') or ':' in p for p in parts):
+            raise zipfile.BadZipFile(f"不安全的条目路径: {info.filename}")
+        target = os.path.join(base_dir, *parts)
+        if unchanged(target, info):
+            return False
+        # 条目路径去掉顶层目录和前缀后，对应 reuse 目录中的文件
+        relative = parts[1:]
+        if reuse_dir and relative[:len(reuse_prefix)] == reuse_prefix and len(relative) > len(reuse_prefix):
+            reference = os.path.join(reuse_dir, *relative[len(reuse_prefix):])
+            if unchanged(reference, info):
+                try:
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    if os.path.lexists(target):
+                        os.remove(target)
+                    os.link(reference, target)
+                    return False
+                except OSError:
+                    pass
+        # ZipFile 对象不在线程间共享，每个线程各自打开
+        if not hasattr(local, 'zip_ref'):
+            local.zip_ref = zipfile.ZipFile(filename, 'r')
+            opened.append(local.zip_ref)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with local.zip_ref.open(info) as src, open(target, 'wb') as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        mtime = time.mktime(info.date_time + (0, 0, -1))
+        os.utime(target, (mtime, mtime))
+        return True
+    
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(extract, members))
+    finally:
+        for zip_ref in opened:
+            zip_ref.close()
+    return results.count(True), results.count(False)
+
+
+def _file_crc32(path):
+    """计算磁盘文件的CRC32"""
+    crc = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+
+def download_and_extract_streaming(target_path, prefix="main/xiaozhi-server",
+                                   expected_sha256=None, expected_size=None):
+    """
+    边下载边解压，只把压缩包中 prefix 目录下的文件写入暂存目录，完成后增量同步到目标目录
+    
+    给出预期摘要或大小时边下载边校验整个压缩包，校验通过后才同步到目标目录；
+    流式传输无法续传，出现网络错误时不在这里从头重试，而是交给调用方改用
+    可分段、可续传的 download_file_with_fallbacks 下载后再解压
+    
+    参数:
+        target_path: 目标目录
+        prefix: 需要解压的目录（相对于压缩包顶层目录）
+        expected_sha256: 可信的预期SHA-256，默认读取环境变量 XIAOZHI_MUSIC_SHA256
+        expected_size: 可信的预期大小（字节），默认读取环境变量 XIAOZHI_MUSIC_SIZE
+        
+    返回:
+        成功返回True；压缩包无法流式解压、传输出错或所有镜像失败时返回False，调用方应改用先下载后解压
+    """
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+        'Accept': '*/*'
+    }
+    # 不能与 sync_tree 自己使用的 .staging 暂存目录同名
+    staging_dir = f"{target_path}.download"
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    if expected_sha256 is None and expected_size is None:
+        expected_sha256, expected_size = expected_from_env("XIAOZHI_MUSIC")
+    
+    health = MirrorHealthStore()
+    mirrors = health.usable(PROXY_URL)
+    client = get_client()
+    
+    try:
+        for idx, url in enumerate(mirrors):
+            if idx > 0:
+                metrics.count("mirror_switches")
+            print(f"尝试镜像源 #{idx+1}/{len(mirrors)}: {url.split('//')[1].split('/')[0]}")
+            
+            if os.path.exists(staging_dir):
+                shutil.rmtree(staging_dir)
+            extractor = StreamingZipExtractor(staging_dir, prefix)
+            verifier = DownloadVerifier(None, expected_sha256, expected_size)
+            try:
+                start_time = time.time()
+                response = client.get(url, headers=headers, stream=True)
+                response.raise_for_status()
+                first_byte_ms = (time.time() - start_time) * 1000
+                
+                total_size = int(response.headers.get('content-length', 0))
+                verifier.check_total(total_size)
+                progress = Progress(total_size, "下载并解压")
+                for chunk in client.iter_chunks(response):
+                    verifier.update(url, extractor.offset, chunk)
+                    extractor.feed(chunk)
+                    metrics.count("bytes_downloaded", len(chunk))
+                    progress.update(extractor.offset)
+                progress.close(extractor.offset)
+                extractor.close()
+                verifier.verify(extractor.offset)
+                if not extractor.files:
+                    raise StreamingZipError(f"压缩包中没有找到 {prefix}")
+                
+                elapsed = time.time() - start_time
+                print(f"✅ 下载并解压成功! {extractor.files} 个文件，耗时: {elapsed:.2f}秒")
+                # 边下载边解压，两者无法分开计时，记为 download 阶段
+                metrics.record_span("download", elapsed)
+                metrics.count("files_written", extractor.files)
+                with metrics.span("copy"):
+                    stats = sync_tree(staging_dir, target_path, preserve=PRESERVE_PATHS, move=True)
+                metrics.count("files_written", stats["copied_files"])
+                print(f"同步完成: {format_stats(stats)}")
+                save_installed_version(target_path, response.headers.get('ETag'),
+                                       response.headers.get('Last-Modified'), _zip_commit(extractor.comment), url)
+                health.record_success(url, latency_ms=first_byte_ms,
+                                      throughput_bps=extractor.offset / max(elapsed - first_byte_ms / 1000, 1e-3))
+                return True
+            
+            except IntegrityError as e:
+                # 整个压缩包都来自这一个镜像，可以确定是它的问题，换下一个镜像
+                extractor.abort()
+                print(f"\n❌ 下载内容校验失败，已拉黑该镜像: {e}")
+                health.blacklist(url, str(e))
+            except StreamingZipError as e:
+                extractor.abort()
+                print(f"\n流式解压失败: {e}")
+                return False
+            except RequestException as e:
+                extractor.abort()
+                health.record_failure(url, type(e).__name__)
+                print(f"\n流式下载失败: {type(e).__name__}{f' - {str(e)}' if str(e) else ''}")
+                return False
+            
+            print("-" * 60)
+        
+        print("❌ 所有镜像源均尝试失败")
+        return False
+    finally:
+        health.save()
+        if os.path.exists(staging_dir):
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+
+def main(streaming=True, check_first=True):
     """主函数"""
+    # 目标路径
+    target_path = os.path.abspath("./src/main/music-xiaozhi-server")
+    
+    # 已安装过时先检查远程是否有新版本，没有就不必下载
+    if check_first:
+        with metrics.span("check"):
+            has_update = check_for_update(target_path)
+        if has_update is False:
+            print(f"🎉 已是最新版本，无需下载: {target_path}")
+            return
+    
+    # 优先边下载边解压，省去保存压缩包、完整解压和复制三次读写
+    if streaming:
+        print(f"开始下载并解压到: {target_path}")
+        if download_and_extract_streaming(target_path):
+            print(f"✅ 内容已保存到: {target_path}")
+            return
+        print("改用可续传的先下载后解压方式")
+    
     # 下载并解压
-    unpack_dir = extract_repo()
+    # 与已安装目录中一致的文件直接硬链接，只解压变化的文件
+    unpack_dir = extract_repo(include=["main/xiaozhi-server"], reuse=("main/xiaozhi-server", target_path))
     
     if unpack_dir is None:
         print("解压失败，程序退出")
@@ -173,8 +646,10 @@ def main():
     
     # 源文件路径
     source_path = os.path.join(unpack_dir, "main", "xiaozhi-server")
-    # 目标路径
-    target_path = os.path.abspath("./src/main/music-xiaozhi-server")
+    commit = None
+    if zipfile.is_zipfile("master.zip"):
+        with zipfile.ZipFile("master.zip") as zip_ref:
+            commit = _zip_commit(zip_ref.comment)
     
     print(f"开始复制: {source_path} → {target_path}")
     
@@ -184,20 +659,19 @@ def main():
             print(f"源目录不存在: {source_path}")
             raise FileNotFoundError(f"源目录不存在: {source_path}")
             
-        # 如果目标路径已存在，先删除
-        if os.path.exists(target_path):
-            shutil.rmtree(target_path)
-            print(f"移除已存在的目标目录: {target_path}")
-            
         # 确保目标目录的父目录存在
         parent_dir = os.path.dirname(target_path)
         if not os.path.exists(parent_dir):
             os.makedirs(parent_dir, exist_ok=True)
             print(f"创建父目录: {parent_dir}")
         
-        # 执行复制
-        shutil.copytree(source_path, target_path)
-        print(f"✅ 复制成功! 内容已保存到: {target_path}")
+        # 只复制变化的文件，新目录整体替换旧目录
+        with metrics.span("copy"):
+            stats = sync_tree(source_path, target_path, preserve=PRESERVE_PATHS, move=True)
+        metrics.count("files_written", stats["copied_files"])
+        print(f"✅ 复制成功! {format_stats(stats)}")
+        save_installed_version(target_path, commit=commit)
+        print(f"内容已保存到: {target_path}")
         
     except Exception as e:
         print(f"❌ 复制过程中发生错误: {e}")
@@ -205,15 +679,30 @@ def main():
     finally:
         # 清理临时文件
         try:
-            if os.path.exists("master.zip"):
-                os.remove("master.zip")
-                print("已删除临时压缩文件")
-            
-            if unpack_dir and os.path.exists(unpack_dir):
-                shutil.rmtree(unpack_dir)
-                print(f"已删除临时解压目录: {unpack_dir}")
+            with metrics.span("cleanup"):
+                if os.path.exists("master.zip"):
+                    os.remove("master.zip")
+                    print("已删除临时压缩文件")
+                
+                if unpack_dir and os.path.exists(unpack_dir):
+                    shutil.rmtree(unpack_dir)
+                    print(f"已删除临时解压目录: {unpack_dir}")
         except Exception as e:
             print(f"清理临时文件时出错: {e}")
 
+def check_main():
+    """
+    非交互的更新检查，供计划任务使用：python get_music_xiaozhi_server.py --check
+
+    返回:
+        退出码: 0 已是最新，1 有新版本，2 无法判断
+    """
+    result = check_for_update(os.path.abspath("./src/main/music-xiaozhi-server"))
+    print({True: "✅ 有新版本", False: "🎉 已是最新版本", None: "⚠️ 无法判断是否有新版本"}[result])
+    return {False: 0, True: 1, None: 2}[result]
+
 if __name__ == "__main__":
-    main()
+    if "--check" in sys.argv[1:]:
+        sys.exit(check_main())
+    with metrics.run("install_music", root=os.getcwd()):
+        main()
@@ -0,0 +1,314 @@
+# coding=UTF-8
+# 本更新脚本以GPL v3.0开源
+# 本机共享的 Git 缓存：同一台机器（或局域网共享目录）上的多个整合包只从网络拉取一次
+import os
+import sys
+import time
+import shutil
+import hashlib
+
+from git_runner import run_git_command
+
+# 缓存目录，设置该环境变量即启用缓存
+CACHE_DIR_ENV = "XIAOZHI_GIT_CACHE"
+DEFAULT_CACHE_DIR = os.environ.get(
+    CACHE_DIR_ENV,
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".git_cache")
+)
+# 缓存总大小上限（字节），超出时按最近使用时间淘汰
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+# 超过该时长（秒）未被使用的缓存直接删除
+DEFAULT_MAX_AGE = 30 * 24 * 3600
+# 距上次从网络刷新不到该时长（秒）时直接使用缓存
+DEFAULT_REFRESH_INTERVAL = 10 * 60
+# 其他进程持有刷新锁超过该时长（秒）视为已失效
+LOCK_TIMEOUT = 30 * 60
+
+# 缓存只保存分支和标签；clone --mirror 会连同托管平台的 refs/pull/* 等引用一起拉取，体积大得多
+CACHE_REFSPECS = ["+refs/heads/*:refs/heads/*", "+refs/tags/*:refs/tags/*"]
+
+_USED_STAMP = "xiaozhi-cache-used"
+_REFRESHED_STAMP = "xiaozhi-cache-refreshed"
+
+
+def canonical_url(url):
+    """去掉代理前缀，使经不同代理访问的同一仓库共用一份缓存"""
+    index = url.find("https://github.com/")
+    url = url[index:] if index > 0 else url
+    return url.rstrip("/")
+
+
+class GitCache:
+    """
+    Git 缓存目录
+
+    每个上游仓库在缓存目录下有一个只含分支和标签的裸仓库（<名称>-<哈希>.git），可选导出同名 .bundle 文件；
+    整合包先从缓存拉取（普通的本地拉取，对象复制到整合包自己的仓库中，
+    缓存被清理也不会损坏整合包），缓存过期时才由其中一个整合包从网络刷新
+    """
+
+    def __init__(self, root=DEFAULT_CACHE_DIR, git_path="git", max_bytes=DEFAULT_MAX_BYTES,
+                 max_age=DEFAULT_MAX_AGE, refresh_interval=DEFAULT_REFRESH_INTERVAL):
+        self.root = os.path.abspath(root)
+        self.git_path = git_path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.refresh_interval = refresh_interval
+
+    @classmethod
+    def from_env(cls, git_path="git"):
+        """设置了 XIAOZHI_GIT_CACHE 时返回缓存对象，否则返回 None"""
+        if not os.environ.get(CACHE_DIR_ENV):
+            return None
+        return cls(os.environ[CACHE_DIR_ENV], git_path)
+
+    def mirror_path(self, url):
+        url = canonical_url(url)
+        name = url.rsplit("/", 1)[-1]
+        name = (name[:-len(".git")] if name.endswith(".git") else name) or "repo"
+        key = hashlib.sha1(url.encode("utf-8")).hexdigest()[:12]
+        return os.path.join(self.root, f"{name}-{key}.git")
+
+    def bundle_path(self, url):
+        return self.mirror_path(url)[:-len(".git")] + ".bundle"
+
+    def prepare(self, url):
+        """
+        确保缓存中有该仓库的最新内容
+
+        返回:
+            可供 git fetch/pull 使用的缓存位置（镜像仓库或 bundle 文件），
+            缓存不可用时返回 None，调用方直接从网络拉取
+        """
+        if self.refresh(url)["ok"]:
+            self.prune(keep=self.mirror_path(url))
+            return self.mirror_path(url)
+        # 只读的共享目录无法刷新镜像，但可能有其他机器导出的 bundle
+        bundle = self.bundle_path(url)
+        if os.path.isfile(bundle):
+            print(f"使用共享的Git bundle: {bundle}")
+            _touch(f"{bundle}.used")
+            return bundle
+        print("Git缓存不可用，将直接从网络拉取")
+        return None
+
+    def refresh(self, url, force=False):
+        """
+        从网络刷新镜像仓库，距上次刷新不足 refresh_interval 时跳过
+
+        多个整合包同时刷新时由第一个获得锁的进程拉取，其余进程等待后直接使用结果
+
+        返回:
+            字典: path, ok, refreshed（是否访问了网络）, duration
+        """
+        start_time = time.time()
+        path = self.mirror_path(url)
+        status = {"path": path, "ok": False, "refreshed": False, "duration": 0.0}
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            lock = self._acquire_lock(path)
+        except OSError as e:
+            print(f"⚠️ 无法使用Git缓存目录 {self.root}: {e}")
+            return status
+        try:
+            if os.path.isdir(path) and self._is_full_mirror(path):
+                # 旧版本用 --mirror 创建的缓存含有 refs/pull/* 等引用，重新创建
+                print(f"Git缓存包含分支和标签以外的引用，重新创建: {path}")
+                shutil.rmtree(path)
+            fresh = self._age(path, _REFRESHED_STAMP) < self.refresh_interval
+            if fresh and not force:
+                print(f"使用Git缓存: {path}")
+                status["ok"] = True
+            elif os.path.isdir(path):
+                print(f"正在刷新Git缓存: {path}")
+                run_git_command(self.git_path, ["--git-dir", path, "remote", "set-url", "origin", url], echo=False)
+                result = run_git_command(self.git_path, ["--git-dir", path, "fetch", "--prune", "--progress", "origin"]
+                                         + CACHE_REFSPECS)
+                status["ok"] = status["refreshed"] = result["code"] == 0
+            else:
+                print(f"正在创建Git缓存: {path}")
+                tmp_path = f"{path}.tmp"
+                if os.path.exists(tmp_path):
+                    shutil.rmtree(tmp_path)
+                result = run_git_command(self.git_path, ["clone", "--bare", "--progress", url, tmp_path])
+                if result["code"] == 0:
+                    # 之后的 git fetch 也只拉取分支和标签
+                    run_git_command(self.git_path, ["--git-dir", tmp_path, "config", "--unset-all", "remote.origin.fetch"],
+                                    echo=False)
+                    for refspec in CACHE_REFSPECS:
+                        run_git_command(self.git_path, ["--git-dir", tmp_path, "config", "--add", "remote.origin.fetch",
+                                                        refspec], echo=False)
+                    # 允许整合包从缓存做部分拉取
+                    run_git_command(self.git_path, ["--git-dir", tmp_path, "config", "uploadpack.allowFilter", "true"],
+                                    echo=False)
+                    os.replace(tmp_path, path)
+                    status["ok"] = status["refreshed"] = True
+                else:
+                    shutil.rmtree(tmp_path, ignore_errors=True)
+            if status["refreshed"]:
+                _touch(os.path.join(path, _REFRESHED_STAMP))
+            if status["ok"]:
+                _touch(os.path.join(path, _USED_STAMP))
+        finally:
+            os.remove(lock)
+        status["duration"] = time.time() - start_time
+        if not status["ok"]:
+            print("⚠️ Git缓存刷新失败")
+        return status
+
+    def _is_full_mirror(self, path):
+        """该镜像仓库由 clone --mirror 创建（拉取全部引用）"""
+        result = run_git_command(self.git_path, ["--git-dir", path, "config", "--get", "remote.origin.mirror"],
+                                 echo=False)
+        return result["code"] == 0 and result["output"].strip() == "true"
+
+    def export_bundle(self, url):
+        """
+        把镜像仓库导出为 bundle 文件，可放在局域网共享目录供其他机器使用
+
+        返回:
+            bundle 文件路径，失败时返回 None
+        """
+        path = self.mirror_path(url)
+        bundle = self.bundle_path(url)
+        tmp_path = f"{bundle}.tmp"
+        result = run_git_command(self.git_path, ["--git-dir", path, "bundle", "create", tmp_path, "--all"],
+                                 echo=False)
+        if result["code"] != 0:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return None
+        os.replace(tmp_path, bundle)
+        return bundle
+
+    def entries(self):
+        """
+        缓存中的各项内容
+
+        返回:
+            [{"path", "bytes", "last_used"}]，bundle 与其镜像仓库分别列出
+        """
+        entries = []
+        if not os.path.isdir(self.root):
+            return entries
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name.endswith(".git") and os.path.isdir(path):
+                last_used = _mtime(os.path.join(path, _USED_STAMP))
+            elif name.endswith(".bundle") and os.path.isfile(path):
+                last_used = max(_mtime(f"{path}.used"), os.path.getmtime(path))
+            else:
+                continue
+            entries.append({"path": path, "bytes": _tree_size(path), "last_used": last_used})
+        return entries
+
+    def prune(self, keep=None):
+        """
+        清理缓存：删除超过 max_age 未使用的内容，总大小仍超过 max_bytes 时从最久未使用的开始删除
+
+        参数:
+            keep: 即将使用、不能删除的缓存路径
+
+        返回:
+            (删除的项数, 释放的字节数)
+        """
+        now = time.time()
+        entries = sorted(self.entries(), key=lambda e: e["last_used"])
+        total = sum(e["bytes"] for e in entries)
+        removed = 0
+        freed = 0
+        for entry in entries:
+            if now - entry["last_used"] <= self.max_age and total <= self.max_bytes:
+                continue
+            if entry["path"] == keep or os.path.exists(f"{entry['path']}.lock"):
+                continue  # 即将使用或正在被其他进程刷新
+            if os.path.isdir(entry["path"]):
+                shutil.rmtree(entry["path"], ignore_errors=True)
+            else:
+                os.remove(entry["path"])
+                if os.path.exists(f"{entry['path']}.used"):
+                    os.remove(f"{entry['path']}.used")
+            total -= entry["bytes"]
+            freed += entry["bytes"]
+            removed += 1
+        return removed, freed
+
+    def _age(self, path, stamp):
+        """距标记文件最后修改的秒数，没有标记时为无穷大"""
+        mtime = _mtime(os.path.join(path, stamp))
+        return time.time() - mtime if mtime else float("inf")
+
+    def _acquire_lock(self, path):
+        """创建锁文件，已被其他进程持有时等待其完成或失效"""
+        lock = f"{path}.lock"
+        waited = False
+        while True:
+            try:
+                os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return lock
+            except FileExistsError:
+                if time.time() - _mtime(lock) > LOCK_TIMEOUT:
+                    os.remove(lock)
+                    continue
+                if not waited:
+                    print("其他整合包正在刷新Git缓存，等待完成...")
+                    waited = True
+                time.sleep(1)
+
+
+def _touch(path):
+    with open(path, "a", encoding="utf-8"):
+        pass
+    os.utime(path)
+
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return 0
+
+
+def _tree_size(path):
+    """文件或目录占用的字节数"""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def main():
+    """
+    命令行：python git_cache.py <命令> [仓库地址]
+
+    命令: refresh（刷新并导出 bundle）、prune（清理）、status（查看缓存）
+    """
+    from updater import DEFAULT_REPO_URL
+
+    if len(sys.argv) < 2 or sys.argv[1] not in ("refresh", "prune", "status"):
+        print("用法: python git_cache.py refresh|prune|status [仓库地址]")
+        sys.exit(1)
+    cache = GitCache()
+    url = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_REPO_URL
+    if sys.argv[1] == "refresh":
+        if not cache.refresh(url, force=True)["ok"]:
+            sys.exit(1)
+        bundle = cache.export_bundle(url)
+        print(f"✅ 缓存已刷新，bundle: {bundle}" if bundle else "⚠️ 缓存已刷新，bundle 导出失败")
+    elif sys.argv[1] == "prune":
+        removed, freed = cache.prune()
+        print(f"✅ 已清理 {removed} 项缓存，释放 {freed/(1024 * 1024):.2f} MB")
+    else:
+        for entry in cache.entries():
+            print(f"{entry['path']}  {entry['bytes']/(1024 * 1024):.2f} MB  "
+                  f"最近使用: {time.strftime('%Y-%m-%d %H:%M', time.localtime(entry['last_used']))}")
+
+
+if __name__ == "__main__":
+    main()
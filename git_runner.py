@@ -0,0 +1,165 @@
+# coding=UTF-8
+# 本更新脚本以GPL v3.0开源
+# Git 命令执行：后台线程分块读取输出，折叠进度行，支持超时和取消
+import re
+import time
+import queue
+import codecs
+import threading
+import subprocess
+from collections import deque
+
+# 输出只保留最后这么多行
+DEFAULT_MAX_LINES = 500
+
+# fetch 输出中的引用更新行，如 "   1a2b3c4..5d6e7f8  main  -> origin/main"、" * [new branch]  dev  -> origin/dev"
+_REF_LINE = re.compile(r"^\s*[+\-*t!=]?\s*(\[[^\]]+\]|[0-9a-f]+\.{2,3}[0-9a-f]+)\s+(\S+)\s+->\s+(\S+)")
+# 传输统计，如 "Receiving objects: 100% (1234/1234), 5.67 MiB | 1.23 MiB/s, done."
+_OBJECTS_LINE = re.compile(
+    r"(?:Receiving|Unpacking) objects:\s+\d+% \((\d+)/(\d+)\)(?:, ([\d.]+) (bytes|KiB|MiB|GiB))?")
+_UNITS = {"bytes": 1, "KiB": 1024, "MiB": 1024 ** 2, "GiB": 1024 ** 3}
+
+
+def run_git_command(git_path, args, timeout=None, cancel_event=None, echo=True,
+                    max_lines=DEFAULT_MAX_LINES, cwd=None):
+    """
+    执行 Git 命令并实时显示输出
+
+    输出由后台线程分块读取；以回车结尾的进度行在同一行原地刷新，不计入输出记录
+
+    参数:
+        git_path: git 可执行文件路径
+        args: 命令参数列表
+        timeout: 超时秒数，超时后终止进程
+        cancel_event: threading.Event，被设置后终止进程
+        echo: 是否打印输出
+        max_lines: 输出记录保留的最大行数
+        cwd: 工作目录
+
+    返回:
+        结果字典: code, output, up_to_date, refs_updated, objects, bytes,
+        duration, timed_out, cancelled
+    """
+    start_time = time.monotonic()
+    if echo:
+        print(f"\n执行命令: git {' '.join(args)}")
+        print("-" * 60)
+
+    process = subprocess.Popen(
+        [git_path] + args,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        cwd=cwd
+    )
+    chunks = queue.Queue()
+    reader = threading.Thread(target=_read_chunks, args=(process.stdout, chunks), daemon=True)
+    reader.start()
+
+    parser = _OutputParser(max_lines, echo)
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    timed_out = cancelled = False
+    while True:
+        try:
+            chunk = chunks.get(timeout=0.2)
+        except queue.Empty:
+            chunk = b""
+        else:
+            if chunk is None:
+                break
+            parser.feed(decoder.decode(chunk))
+        if timeout is not None and time.monotonic() - start_time > timeout:
+            timed_out = True
+        elif cancel_event is not None and cancel_event.is_set():
+            cancelled = True
+        if timed_out or cancelled:
+            process.kill()
+            break
+    parser.feed(decoder.decode(b"", final=True))
+    parser.flush()
+    code = process.wait()
+
+    if echo:
+        if timed_out:
+            print(f"⚠️ 命令超时（{timeout}秒），已终止")
+        elif cancelled:
+            print("⚠️ 命令已取消")
+        print("-" * 60)
+
+    output = "\n".join(parser.lines)
+    return {
+        "code": code,
+        "output": output,
+        "up_to_date": "Already up to date" in output or "Already up-to-date" in output,
+        "refs_updated": parser.refs,
+        "objects": parser.objects,
+        "bytes": parser.bytes,
+        "duration": time.monotonic() - start_time,
+        "timed_out": timed_out,
+        "cancelled": cancelled,
+    }
+
+
+def _read_chunks(stream, chunks):
+    """后台读取子进程输出，读到结尾时放入 None"""
+    try:
+        while True:
+            chunk = stream.read1(65536)
+            if not chunk:
+                break
+            chunks.put(chunk)
+    finally:
+        stream.close()
+        chunks.put(None)
+
+
+class _OutputParser:
+    """把输出切分为行并提取引用更新和传输统计"""
+
+    def __init__(self, max_lines, echo):
+        self.lines = deque(maxlen=max_lines)
+        self.echo = echo
+        self.refs = []
+        self.objects = None
+        self.bytes = None
+        self._current = ""
+        self._carriage = False
+
+    def feed(self, text):
+        for token in re.split(r"(\r|\n)", text):
+            if token == "\n":
+                self._finish_line()
+            elif token == "\r":
+                # 进度行：等下一段内容到来才知道是被覆盖还是以 \r\n 结束
+                self._carriage = True
+                if self.echo and self._current:
+                    print(f"\r{self._current}", end="", flush=True)
+            elif token:
+                if self._carriage:
+                    self._parse(self._current)
+                    self._current = ""
+                    self._carriage = False
+                self._current += token
+
+    def flush(self):
+        if self._current:
+            self._finish_line()
+
+    def _finish_line(self):
+        line = self._current.strip()
+        self._current = ""
+        self._carriage = False
+        if self.echo:
+            print(f"\r{line}")
+        self.lines.append(line)
+        self._parse(line)
+
+    def _parse(self, line):
+        match = _REF_LINE.match(line)
+        if match:
+            self.refs.append({"summary": match.group(1), "from": match.group(2), "to": match.group(3)})
+            return
+        match = _OBJECTS_LINE.search(line)
+        if match:
+            self.objects = int(match.group(2))
+            if match.group(3):
+                self.bytes = int(float(match.group(3)) * _UNITS[match.group(4)])
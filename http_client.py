@@ -0,0 +1,152 @@
+# coding=UTF-8
+# 本更新脚本以GPL v3.0开源
+# 共享的HTTP客户端：按镜像主机复用连接，测速、更新检查和下载共用同一个连接池
+import time
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ReadTimeoutError
+
+DEFAULT_USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+# 保留连接池的主机数，需大于镜像数量，否则测速后连接池会被挤出
+POOL_HOSTS = 64
+# 每个主机保留的空闲连接数（分段下载时同一镜像可能有多个连接）
+POOL_MAXSIZE = 8
+# 连接超时和初始读取超时（秒）
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 15
+# 读取超时随镜像首字节延迟调整的范围（秒）
+MIN_READ_TIMEOUT = 5
+MAX_READ_TIMEOUT = 60
+# 读取超时为首字节延迟平均值的倍数
+LATENCY_FACTOR = 10
+# 每次从连接读取并写入文件的块大小，较大的块减少Python层面的循环和写入次数
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+# 进度显示的最短刷新间隔（秒）
+PROGRESS_INTERVAL = 0.5
+
+
+def host_of(url):
+    return urlsplit(url).netloc
+
+
+class HttpClient:
+    """
+    带连接池的HTTP客户端
+
+    同一主机的请求复用 keep-alive 连接（含TLS会话），重试和切换镜像时不必重新握手；
+    未指定超时的请求按该主机的首字节延迟自动设置读取超时，读取超时后加倍，
+    使慢速镜像不会被过早放弃，快速镜像卡住时也能尽快切换
+    """
+
+    def __init__(self, chunk_size=DEFAULT_CHUNK_SIZE, connect_timeout=CONNECT_TIMEOUT,
+                 read_timeout=READ_TIMEOUT, pool_maxsize=POOL_MAXSIZE):
+        self.chunk_size = chunk_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = DEFAULT_USER_AGENT
+        adapter = HTTPAdapter(pool_connections=POOL_HOSTS, pool_maxsize=pool_maxsize)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._lock = threading.Lock()
+        self._latency = {}
+        self._read_timeouts = {}
+
+    def timeout_for(self, url):
+        """该主机当前的 (连接超时, 读取超时)"""
+        with self._lock:
+            return self.connect_timeout, self._read_timeouts.get(host_of(url), self.read_timeout)
+
+    def request(self, method, url, timeout=None, **kwargs):
+        """发起请求，timeout 为 None 时使用自适应超时，其余参数同 requests"""
+        try:
+            response = self.session.request(method, url, timeout=timeout or self.timeout_for(url), **kwargs)
+        except requests.exceptions.ReadTimeout:
+            self._note_timeout(url)
+            raise
+        self._note_latency(url, response.elapsed.total_seconds())
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self.request("HEAD", url, **kwargs)
+
+    def iter_chunks(self, response, chunk_size=None):
+        """按 chunk_size（默认 1MB）读取响应内容，读取超时会延长该主机之后的超时"""
+        try:
+            yield from response.iter_content(chunk_size=chunk_size or self.chunk_size)
+        except requests.exceptions.ConnectionError as e:
+            if e.args and isinstance(e.args[0], ReadTimeoutError):
+                self._note_timeout(response.url)
+            raise
+
+    def close(self):
+        self.session.close()
+
+    def _note_latency(self, url, latency):
+        host = host_of(url)
+        with self._lock:
+            average = self._latency.get(host)
+            average = latency if average is None else 0.3 * latency + 0.7 * average
+            self._latency[host] = average
+            read_timeout = min(MAX_READ_TIMEOUT, max(MIN_READ_TIMEOUT, average * LATENCY_FACTOR))
+            # 曾经超时的主机不因一次快速响应立即缩短超时
+            self._read_timeouts[host] = max(read_timeout, self._read_timeouts.get(host, 0) * 0.7)
+
+    def _note_timeout(self, url):
+        host = host_of(url)
+        with self._lock:
+            current = self._read_timeouts.get(host, self.read_timeout)
+            self._read_timeouts[host] = min(MAX_READ_TIMEOUT, current * 2)
+
+
+class Progress:
+    """按时间节流的进度显示，每 interval 秒最多刷新一次，而不是每个数据块都打印"""
+
+    def __init__(self, total=None, label="下载进度", interval=PROGRESS_INTERVAL):
+        self.total = total
+        self.label = label
+        self.interval = interval
+        self._last = 0.0
+
+    def update(self, done, force=False):
+        now = time.monotonic()
+        if not force and now - self._last < self.interval:
+            return
+        self._last = now
+        if self.total:
+            print(f"\r{self.label}: {done / self.total * 100:.1f}%", end='', flush=True)
+        else:
+            print(f"\r{self.label}: {done/(1024 * 1024):.2f} MB", end='', flush=True)
+
+    def close(self, done):
+        """显示最终进度并换行"""
+        self.update(done, force=True)
+        print()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """本进程共用的 HttpClient"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient()
+        return _client
+
+
+def reset_client():
+    """关闭共用的客户端，下次 get_client() 时重新创建（丢弃已建立的连接和超时记录）"""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
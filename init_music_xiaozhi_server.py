@@ -1,52 +1,109 @@
 import os
-import shutil
-from tqdm import tqdm
+import sys
+import argparse
+from dir_sync import scan_tree
+from fast_copy import copy_file
+from blob_store import BlobStore
+import metrics
 
-def copy_file_with_progress(src, dst, chunk_size=1024 * 1024):
-    """复制文件并显示进度条"""
+def progress_bar(path, desc):
+    """以文件大小为总量的进度条，返回的对象可作为 with 语句使用，其 update 方法可直接作为进度回调"""
+    # 进度条模块按需导入，检查更新等不复制文件的路径不加载
+    from tqdm import tqdm
+
+    return tqdm(total=os.path.getsize(path), unit='B', unit_scale=True, desc=f"{desc} {os.path.basename(path)}")
+
+def copy_file_with_progress(src, dst, chunk_size=1024 * 1024, hardlink=False):
+    """
+    复制文件并显示进度条
+
+    优先使用写时复制克隆或内核零拷贝，不可用时分块读写（默认1MB）；
+    hardlink 为 True 时直接创建硬链接，目标已有相同内容时跳过
+    """
     try:
-        total_size = os.path.getsize(src)  # 获取文件总大小
-        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
-            # 初始化进度条
-            with tqdm(total=total_size, unit='B', unit_scale=True, desc=f"复制 {os.path.basename(src)}") as pbar:
-                while True:
-                    chunk = fsrc.read(chunk_size)  # 分块读取（默认1MB）
-                    if not chunk:
-                        break
-                    fdst.write(chunk)
-                    pbar.update(len(chunk))  # 更新进度条
-        print(f"✅ 文件复制成功: {src} → {dst}")
+        # 初始化进度条
+        with progress_bar(src, "复制") as pbar:
+            method = copy_file(src, dst, progress=pbar.update, hardlink=hardlink, chunk_size=chunk_size)
+        if method == "skipped":
+            print(f"✅ 目标文件内容相同，已跳过复制: {dst}")
+        else:
+            print(f"✅ 文件复制成功 ({method}): {src} → {dst}")
     except Exception as e:
         print(f"❌ 复制失败: {e}")
 
 # 复制文件的函数
-def copy_config_and_models():
-    """复制配置文件和模型文件"""
+def copy_config_and_models(hardlink=False):
+    """
+    复制配置文件和模型文件
+
+    配置文件先放入共享的内容寻址仓库，再用写时复制克隆或复制生成到音乐小智目录；
+    模型文件默认直接复制一次（优先克隆或内核零拷贝），hardlink 为 True（用户明确选择）时
+    经仓库用硬链接共享，两个服务端共用同一份数据；仓库与模型文件不在同一文件系统时
+    无法硬链接，经仓库中转会复制两次，改为直接复制一次
+    """
+    src_server = rf"{scripts_dir}\src\main\xiaozhi-server"
+    dst_server = rf"{scripts_dir}\src\main\music-xiaozhi-server"
+    store = BlobStore()
     try:
         # 检查配置文件是否存在
-        if os.path.exists(rf"{scripts_dir}\src\main\music-xiaozhi-server\data"):
+        if os.path.exists(rf"{dst_server}\data"):
             print("配置文件已存在，跳过复制")
         else:
             # 复制配置文件到音乐小智目录
             print("开始复制配置文件到音乐小智目录")
-            shutil.copytree(rf"{scripts_dir}\src\main\xiaozhi-server\data", rf"{scripts_dir}\src\main\music-xiaozhi-server\data")
+            with metrics.span("copy"):
+                files, _ = scan_tree(rf"{src_server}\data")
+                entries = store.ingest(src_server, [f"data/{rel}" for rel in files])
+                store.materialize(entries, dst_server)
+            metrics.count("files_written", len(files))
             print("配置文件复制完成！")
 
-        if os.path.exists(rf"{scripts_dir}\src\main\music-xiaozhi-server\models\SenseVoiceSmall\model.pt"):
+        if os.path.exists(rf"{dst_server}\models\SenseVoiceSmall\model.pt"):
             print("语音识别模型文件已存在，跳过复制")
         else:
             # 复制语音识别模型文件到音乐小智目录
             print("开始复制语音识别模型文件到音乐小智目录，可能需要较长时间，请耐心等待~")
-            copy_file_with_progress(rf"{scripts_dir}\src\main\xiaozhi-server\models\SenseVoiceSmall\model.pt", rf"{scripts_dir}\src\main\music-xiaozhi-server\models\SenseVoiceSmall\model.pt")
+            model = "models/SenseVoiceSmall/model.pt"
+            src_model = rf"{src_server}\models\SenseVoiceSmall\model.pt"
+            dst_model = rf"{dst_server}\models\SenseVoiceSmall\model.pt"
+            with metrics.span("model_copy"):
+                if not hardlink:
+                    copy_file_with_progress(src_model, dst_model)
+                    print("提示: 使用 --hardlink 可让两个服务端用硬链接共享模型文件，不占用额外磁盘空间")
+                else:
+                    try:
+                        if not store.on_same_device(src_model, dst_model):
+                            raise OSError("共享仓库与模型文件不在同一磁盘")
+                        with progress_bar(src_model, "入库") as pbar:
+                            entries = store.ingest(src_server, [model], immutable=True, progress=pbar.update)
+                        with progress_bar(src_model, "生成") as pbar:
+                            methods = store.materialize(entries, dst_server, hardlink=True, progress=pbar.update)
+                        print(f"✅ 已从共享仓库生成模型文件 ({methods[model]})")
+                    except OSError as e:
+                        print(f"⚠️ 共享仓库不可用（{e}），改为直接复制")
+                        copy_file_with_progress(src_model, dst_model)
+            metrics.count("files_written")
             print("语音识别模型文件复制完成！")
         return True
     except Exception as e:
         print(f"❌ 复制模型文件失败: {e}")
         return False
 
-if __name__ == "__main__":
+def cli(argv=None):
+    """
+    交互式安装音乐小智服务端DLC：python init_music_xiaozhi_server.py 或 python xiaozhi.py install-music
+
+    返回:
+        退出码
+    """
+    parser = argparse.ArgumentParser(description="下载音乐小智服务端DLC并复制配置文件和模型文件")
+    parser.add_argument("--hardlink", action="store_true",
+                        help="模型文件用硬链接与小智AI服务端共享，不占用额外磁盘空间；替换或修改其中一份会影响另一份")
+    args = parser.parse_args(argv)
+    global scripts_dir
     # 获取脚本所在目录
     scripts_dir = os.path.dirname(__file__)
+    code = 0
 
     # 检查是否存在小智服务器文件夹
     if not os.path.exists(rf"{scripts_dir}\src\main\music-xiaozhi-server"):
@@ -55,12 +112,15 @@ if __name__ == "__main__":
             
             if choice in ['y', 'yes', '']:
                 print("下载音乐小智服务器")
-                # 导入模块下载小智的代码
-                from get_music_xiaozhi_server import main
-                main()
-                print("下载音乐小智服务端DLC成功！")
-                # 复制模型文件和配置文件
-                copy_config_and_models()
+                with metrics.run("install_music", root=scripts_dir):
+                    # 导入模块下载小智的代码
+                    from get_music_xiaozhi_server import main
+                    main()
+                    print("下载音乐小智服务端DLC成功！")
+                    # 复制模型文件和配置文件
+                    if not copy_config_and_models(hardlink=args.hardlink):
+                        metrics.set_status("failed")
+                        code = 1
                 break
             elif choice in ['n', 'no']:
                 print("取消下载")
@@ -69,5 +129,8 @@ if __name__ == "__main__":
                 print("无效输入，请输入 Y(是) 或 n(否)")
     else:
         print("你似乎已经下载过音乐小智服务端了，请回到一键包根目录，尝试启动音乐小智服务端吧！")
+    return code
 
 
+if __name__ == "__main__":
+    sys.exit(cli())
@@ -0,0 +1,190 @@
+# coding=UTF-8
+# 本更新脚本以GPL v3.0开源
+# 下载完整性校验：写入的同时计算SHA-256，并与可信来源给出的摘要和大小核对
+import os
+import zlib
+import hashlib
+
+# 乱序到达的数据最多暂存这么多字节，超出的部分最后从磁盘补读
+DEFAULT_MAX_PENDING = 64 * 1024 * 1024
+
+
+class IntegrityError(Exception):
+    """下载内容与预期的摘要或大小不符，提供该内容的镜像不可信"""
+
+
+class InlineHasher:
+    """
+    按文件顺序计算SHA-256，不需要下载完成后再读一遍文件
+
+    写入位置紧接已计算部分的数据直接计算；分段下载时乱序到达的数据先暂存在内存中，
+    等前面的数据到齐后再计算。暂存超过 max_pending 时不再暂存，最后从磁盘补读缺少的部分；
+    本进程启动前已下载（续传）的部分同样在最后补读
+    """
+
+    def __init__(self, path=None, max_pending=DEFAULT_MAX_PENDING):
+        self.path = path
+        self.max_pending = max_pending
+        self.position = 0
+        self.caught_up_bytes = 0
+        self._sha256 = hashlib.sha256()
+        self._pending = {}
+        self._pending_bytes = 0
+
+    def update(self, offset, data):
+        """加入写入文件 offset 处的数据"""
+        if offset + len(data) <= self.position:
+            return
+        if offset < self.position:
+            data = data[self.position - offset:]
+            offset = self.position
+        if offset == self.position:
+            self._consume(data)
+            # 之前暂存的后续数据可能已经接上
+            while self.position in self._pending:
+                data = self._pending.pop(self.position)
+                self._pending_bytes -= len(data)
+                self._consume(data)
+        elif self._pending_bytes + len(data) <= self.max_pending:
+            self._pending[offset] = bytes(data)
+            self._pending_bytes += len(data)
+
+    def hexdigest(self, size):
+        """计算前 size 字节的摘要，未计算的部分从磁盘补读"""
+        f = None
+        try:
+            while self.position < size:
+                data = self._pending.pop(self.position, None)
+                if data is not None:
+                    self._pending_bytes -= len(data)
+                else:
+                    if self.path is None:
+                        raise IntegrityError(f"数据不连续，缺少 {self.position} 处的内容")
+                    if f is None:
+                        f = open(self.path, "rb")
+                    next_offset = min((o for o in self._pending if o > self.position), default=size)
+                    f.seek(self.position)
+                    data = f.read(min(next_offset, size, self.position + 1024 * 1024) - self.position)
+                    if not data:
+                        raise IntegrityError(f"文件不完整，缺少 {self.position} 处的内容")
+                    self.caught_up_bytes += len(data)
+                self._consume(data[:size - self.position])
+        finally:
+            if f is not None:
+                f.close()
+        return self._sha256.hexdigest()
+
+    def reset(self):
+        """丢弃已计算的状态，之后从文件开头补读"""
+        self.position = 0
+        self._sha256 = hashlib.sha256()
+        self._pending.clear()
+        self._pending_bytes = 0
+
+    def _consume(self, data):
+        self._sha256.update(data)
+        self.position += len(data)
+
+
+class DownloadVerifier:
+    """
+    下载校验器
+
+    expected_sha256/expected_size 应来自可信来源（如发布者公布的摘要），而不是镜像本身；
+    镜像声明的大小不符或发送的数据超出预期大小时立即报错，不必等下载完成；
+    没有预期摘要时不计算SHA-256
+
+    有预期摘要时还记录每段数据的来源镜像和CRC32：多个镜像各提供一部分而校验失败时，
+    用 keep_suspects() 保留这些记录，之后得到校验通过的文件再用 blame() 找出提供了错误数据的镜像
+    """
+
+    def __init__(self, path=None, expected_sha256=None, expected_size=None):
+        self.expected_sha256 = expected_sha256.lower() if expected_sha256 else None
+        self.expected_size = expected_size
+        self.hasher = InlineHasher(path) if self.expected_sha256 else None
+        self.contributors = set()
+        # 本次下载各段数据的 (镜像, 偏移, 长度, CRC32)
+        self.pieces = []
+        # 校验失败的多镜像下载留下的记录，reset() 不清除
+        self.suspects = []
+
+    @property
+    def enabled(self):
+        return self.expected_sha256 is not None or self.expected_size is not None
+
+    def check_total(self, total_size):
+        """核对镜像声明的文件总大小"""
+        if self.expected_size is not None and total_size and total_size != self.expected_size:
+            raise IntegrityError(f"镜像声明的文件大小 {total_size} 与预期 {self.expected_size} 不符")
+
+    def update(self, url, offset, data):
+        """写入前核对并计算一段数据"""
+        if self.expected_size is not None and offset + len(data) > self.expected_size:
+            raise IntegrityError(f"镜像返回的数据超出预期大小 {self.expected_size}")
+        self.contributors.add(url)
+        if self.hasher is not None:
+            self.hasher.update(offset, data)
+            self.pieces.append((url, offset, len(data), zlib.crc32(data)))
+
+    def verify(self, size):
+        """下载完成后核对大小和摘要"""
+        self.check_total(size)
+        if self.hasher is None:
+            return
+        digest = self.hasher.hexdigest(size)
+        if self.hasher.caught_up_bytes:
+            print(f"（校验时补读了 {self.hasher.caught_up_bytes/(1024 * 1024):.2f} MB 续传前已下载的数据）")
+        if digest != self.expected_sha256:
+            raise IntegrityError(f"SHA-256 不符: {digest}")
+        print(f"✅ SHA-256 校验通过: {digest}")
+
+    def single_source(self):
+        """
+        所有数据都来自同一个镜像时返回该镜像，否则返回 None
+
+        校验失败时只有这种情况能确定是哪个镜像的问题；多个镜像各提供一部分时无法判断，
+        不应拉黑其中内容正确的镜像
+        """
+        return next(iter(self.contributors)) if len(self.contributors) == 1 else None
+
+    def keep_suspects(self):
+        """校验失败且数据来自多个镜像时调用，保留各段数据的来源记录供 blame() 使用"""
+        self.suspects.extend(self.pieces)
+
+    def blame(self, path):
+        """
+        与校验通过的文件逐段比较 keep_suspects() 保留的记录
+
+        返回:
+            提供了与该文件不符的数据的镜像集合
+        """
+        bad = set()
+        with open(path, "rb") as f:
+            for url, offset, length, crc in sorted(self.suspects, key=lambda piece: piece[1]):
+                if url in bad:
+                    continue
+                f.seek(offset)
+                if zlib.crc32(f.read(length)) != crc:
+                    bad.add(url)
+        self.suspects = []
+        return bad
+
+    def reset(self):
+        """重新开始下载时清空状态"""
+        self.contributors.clear()
+        self.pieces = []
+        if self.hasher is not None:
+            self.hasher.reset()
+
+
+def expected_from_env(prefix):
+    """
+    从环境变量读取可信的预期摘要和大小，如 prefix 为 XIAOZHI_MUSIC 时读取
+    XIAOZHI_MUSIC_SHA256 和 XIAOZHI_MUSIC_SIZE
+
+    返回:
+        (预期SHA-256, 预期大小)，未设置的为 None
+    """
+    sha256 = os.environ.get(f"{prefix}_SHA256") or None
+    size = os.environ.get(f"{prefix}_SIZE")
+    return sha256, int(size) if size else None
@@ -0,0 +1,250 @@
+# coding=UTF-8
+# 本更新脚本以GPL v3.0开源
+# 运行指标：记录更新各阶段耗时和计数，导出为 JSON-lines 日志和 Prometheus textfile
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from contextlib import contextmanager, nullcontext
+
+# 每次运行追加一行的 JSON-lines 日志，可通过环境变量覆盖
+DEFAULT_LOG_FILE = os.environ.get(
+    "XIAOZHI_METRICS_LOG",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".update_metrics.jsonl")
+)
+# 设置后在该目录（node_exporter 的 textfile 目录）写入 Prometheus 指标文件
+TEXTFILE_DIR_ENV = "XIAOZHI_METRICS_TEXTFILE_DIR"
+# 设置后用 cProfile 分析整个运行过程，结果保存到该目录
+PROFILE_DIR_ENV = "XIAOZHI_PROFILE"
+# 常用计数项，未发生的也以 0 导出，便于监控设置告警
+COUNTERS = ("bytes_downloaded", "files_written", "retries", "mirror_switches")
+
+_current = None
+
+
+class RunMetrics:
+    """
+    一次运行（一次更新或一次DLC安装）的指标
+
+    spans 记录各阶段（probe、remote_rewrite、fetch、reset、backup、download、extract、
+    copy、model_copy、cleanup 等）的起止时间，counters 为累计计数，fields 为其他附加信息；
+    计数可能来自多个下载线程，加锁累加
+    """
+
+    def __init__(self, name, labels=None):
+        self.name = name
+        self.labels = dict(labels or {})
+        self.start_time = time.time()
+        self.duration = None
+        self.status = None
+        self.spans = []
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.fields = {}
+        self.profile_path = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, phase):
+        """计时一个阶段，阶段中抛出异常时记为失败"""
+        start_time = time.time()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            self.record_span(phase, time.time() - start_time, error, start_time)
+
+    def record_span(self, phase, duration, error=None, start_time=None):
+        """记录已经自行计时的阶段"""
+        start_time = time.time() - duration if start_time is None else start_time
+        with self._lock:
+            self.spans.append({"phase": phase, "start": round(start_time - self.start_time, 6),
+                               "duration": duration, "ok": error is None, "error": error})
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def phase_totals(self):
+        """各阶段的总耗时（同一阶段多次出现时累加），按首次出现的顺序"""
+        totals = {}
+        for span in self.spans:
+            totals[span["phase"]] = totals.get(span["phase"], 0.0) + span["duration"]
+        return totals
+
+    def to_record(self):
+        import socket
+
+        return {
+            "run": self.name,
+            "host": socket.gethostname(),
+            "labels": self.labels,
+            "start": self.start_time,
+            "duration": self.duration,
+            "status": self.status,
+            "spans": self.spans,
+            "counters": self.counters,
+            "fields": self.fields,
+            "profile": self.profile_path,
+        }
+
+    def finish(self, status, log_file=None, textfile_dir=None):
+        """结束运行并导出，写入失败只提示，不影响更新结果"""
+        self.duration = time.time() - self.start_time
+        self.status = status
+        try:
+            with open(log_file or DEFAULT_LOG_FILE, "a", encoding="utf-8") as f:
+                f.write(json.dumps(self.to_record(), ensure_ascii=False) + "\n")
+        except OSError as e:
+            print(f"⚠️ 运行指标写入失败: {e}")
+        textfile_dir = textfile_dir or os.environ.get(TEXTFILE_DIR_ENV)
+        if textfile_dir:
+            try:
+                write_textfile(self, textfile_dir)
+            except OSError as e:
+                print(f"⚠️ Prometheus 指标文件写入失败: {e}")
+
+    def summary(self):
+        """各阶段耗时的简短描述"""
+        phases = "，".join(f"{phase} {seconds:.2f}秒" for phase, seconds in self.phase_totals().items())
+        return f"各阶段耗时: {phases or '无'}"
+
+
+def write_textfile(run_metrics, textfile_dir):
+    """
+    把最近一次运行写成 Prometheus textfile（由 node_exporter 的 textfile collector 读取）
+
+    同一台机器上的每个整合包（root 标签）和每种运行各写一个文件，先写临时文件再替换，
+    避免 node_exporter 读到写了一半的文件
+
+    返回:
+        指标文件路径
+    """
+    labels = dict(run_metrics.labels, run=run_metrics.name)
+    key = hashlib.sha1(json.dumps(labels, sort_keys=True).encode("utf-8")).hexdigest()[:8]
+    path = os.path.join(textfile_dir, f"xiaozhi_{run_metrics.name}_{key}.prom")
+    lines = []
+
+    def metric(name, help_text, samples):
+        lines.append(f"# HELP xiaozhi_update_{name} {help_text}")
+        lines.append(f"# TYPE xiaozhi_update_{name} gauge")
+        for extra, value in samples:
+            lines.append(f"xiaozhi_update_{name}{{{_format_labels(dict(labels, **extra))}}} {value}")
+
+    metric("last_run_timestamp_seconds", "Start time of the last run.", [({}, run_metrics.start_time)])
+    metric("last_run_duration_seconds", "Duration of the last run.", [({}, run_metrics.duration)])
+    metric("last_run_success", "1 if the last run succeeded.", [({}, int(run_metrics.status == "ok"))])
+    metric("phase_duration_seconds", "Time spent in each phase of the last run.",
+           [({"phase": phase}, seconds) for phase, seconds in run_metrics.phase_totals().items()])
+    metric("phase_failures", "Failed attempts of each phase in the last run.",
+           [({"phase": phase}, sum(not s["ok"] for s in run_metrics.spans if s["phase"] == phase))
+            for phase in run_metrics.phase_totals()])
+    for name, value in sorted(run_metrics.counters.items()):
+        metric(name, f"{name.replace('_', ' ').capitalize()} in the last run.", [({}, value)])
+
+    os.makedirs(textfile_dir, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp_path, path)
+    return path
+
+
+def _format_labels(labels):
+    return ",".join(f'{key}="{_escape(value)}"' for key, value in sorted(labels.items()))
+
+
+def _escape(value):
+    return re.sub(r'(["\\])', r"\\\1", str(value)).replace("\n", "\\n")
+
+
+@contextmanager
+def run(name, **labels):
+    """
+    记录一次运行：with metrics.run("updater", root=...):
+
+    已有进行中的运行时（如DLC安装过程中调用下载模块的 main）直接沿用，不另起一条记录；
+    设置了 XIAOZHI_PROFILE 时用 cProfile 分析主线程，结果保存为 <运行名>-<时间>.prof
+    """
+    global _current
+    if _current is not None:
+        yield _current
+        return
+    run_metrics = RunMetrics(name, labels)
+    _current = run_metrics
+    profiler = _start_profiler()
+    status = "failed"
+    try:
+        yield run_metrics
+        status = "ok"
+    except SystemExit as e:
+        status = "ok" if not e.code else "failed"
+        raise
+    finally:
+        _current = None
+        if profiler is not None:
+            profiler.disable()
+            run_metrics.profile_path = _save_profile(profiler, name)
+        if run_metrics.spans:
+            print(f"\n📊 {run_metrics.summary()}")
+        # 运行过程中设置的结果（如更新失败但没有抛出异常）优先
+        run_metrics.finish(run_metrics.status or status)
+
+
+def current():
+    """进行中的运行，没有时返回 None"""
+    return _current
+
+
+def span(phase):
+    """计时一个阶段，没有进行中的运行时不做任何事"""
+    return _current.span(phase) if _current is not None else nullcontext()
+
+
+def record_span(phase, duration, error=None):
+    if _current is not None:
+        _current.record_span(phase, duration, error)
+
+
+def count(name, value=1):
+    if _current is not None:
+        _current.count(name, value)
+
+
+def set_field(key, value):
+    if _current is not None:
+        _current.fields[key] = value
+
+
+def set_status(status):
+    """设置本次运行的结果，如 "ok"、"failed"，未设置时按是否抛出异常判断"""
+    if _current is not None:
+        _current.status = status
+
+
+def _start_profiler():
+    if not os.environ.get(PROFILE_DIR_ENV):
+        return None
+    import cProfile
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def _save_profile(profiler, name):
+    """保存 cProfile 结果，可用 python -m pstats <文件> 查看"""
+    profile_dir = os.environ[PROFILE_DIR_ENV]
+    path = os.path.join(profile_dir, f"{name}-{time.strftime('%Y%m%d%H%M%S')}-{os.getpid()}.prof")
+    try:
+        os.makedirs(profile_dir, exist_ok=True)
+        profiler.dump_stats(path)
+        print(f"📊 性能分析结果已保存到: {path}")
+        return path
+    except OSError as e:
+        print(f"⚠️ 性能分析结果保存失败: {e}")
+        return None
@@ -0,0 +1,233 @@
+# coding=UTF-8
+# 本更新脚本以GPL v3.0开源
+# 镜像健康状况持久化记录，供 updater.py 与 get_music_xiaozhi_server.py 共用
+import os
+import copy
+import time
+import threading
+from urllib.parse import urlparse
+
+from state_file import read_json, update_json
+
+# 默认记录文件位置，可通过环境变量覆盖
+DEFAULT_HEALTH_FILE = os.environ.get(
+    "XIAOZHI_MIRROR_HEALTH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".mirror_health.json")
+)
+# 超过该时长未出现的镜像记录将被淘汰（秒）
+DEFAULT_TTL = 7 * 24 * 3600
+# 成功/失败计数的衰减半衰期（秒）
+DEFAULT_HALF_LIFE = 24 * 3600
+# 在该时长内成功过的镜像视为“新鲜”，可直接使用而无需重新测速（秒）
+DEFAULT_FRESH_AGE = 6 * 3600
+# 延迟与吞吐量的指数滑动平均系数
+EWMA_ALPHA = 0.3
+# 返回错误内容的镜像被拉黑的时长（秒）
+DEFAULT_BLACKLIST_TIME = 24 * 3600
+
+
+def mirror_key(url):
+    """以镜像主机名作为记录键，使两个脚本对同一镜像的观测可以共享"""
+    return urlparse(url).netloc or url
+
+
+class MirrorHealthStore:
+    """
+    镜像健康记录
+
+    每个镜像记录延迟、吞吐量、成功/失败次数和最近一次出现的时间，
+    并按指数衰减后的成功率与延迟计算得分进行排序
+    """
+
+    def __init__(self, path=DEFAULT_HEALTH_FILE, ttl=DEFAULT_TTL, half_life=DEFAULT_HALF_LIFE):
+        self.path = path
+        self.ttl = ttl
+        self.half_life = half_life
+        self._lock = threading.Lock()
+        self.entries = self._load()
+        # 读取时的记录，保存时据此算出本进程的改动，与其他进程同时写入的记录合并
+        self._saved = copy.deepcopy(self.entries)
+
+    def _load(self):
+        """读取记录文件，文件缺失或损坏时从空记录开始"""
+        now = time.time()
+        return {k: v for k, v in read_json(self.path).items() if not self._expired(v, now)}
+
+    def _expired(self, entry, now):
+        """记录损坏或超过 ttl 未出现的镜像视为已淘汰"""
+        return not isinstance(entry, dict) or now - entry.get("last_seen", 0) > self.ttl
+
+    def save(self):
+        """
+        加锁合并后原子写入记录文件，写入失败不影响主流程
+
+        批量更新时多个进程共用同一个记录文件：只写入本进程改动过的镜像，
+        成功/失败次数按本进程新增的次数累加到文件中的最新值上，已淘汰的记录同时从文件中删除
+        """
+        with self._lock:
+            changed = {k: copy.deepcopy(v) for k, v in self.entries.items() if v != self._saved.get(k)}
+            saved = self._saved
+
+        def merge(current):
+            now = time.time()
+            for key in [k for k, v in current.items() if self._expired(v, now)]:
+                del current[key]
+            for key, entry in changed.items():
+                current[key] = _merge_entry(current.get(key), saved.get(key), entry)
+            return current
+
+        try:
+            merged = update_json(self.path, merge)
+        except OSError as e:
+            print(f"⚠️ 镜像健康记录保存失败: {e}")
+            return
+        with self._lock:
+            for key in changed:
+                self.entries[key] = copy.deepcopy(merged[key])
+            for key in [k for k in self.entries if k not in merged]:
+                del self.entries[key]
+            self._saved = copy.deepcopy(self.entries)
+
+    def _entry(self, url, now):
+        """取出镜像记录并把衰减计数更新到当前时刻"""
+        key = mirror_key(url)
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = {"latency_ms": None, "throughput_bps": None, "successes": 0, "failures": 0,
+                     "decayed_successes": 0.0, "decayed_failures": 0.0,
+                     "last_seen": now, "last_success": None, "last_error": None}
+            self.entries[key] = entry
+        factor = 0.5 ** (max(0.0, now - entry["last_seen"]) / self.half_life)
+        entry["decayed_successes"] *= factor
+        entry["decayed_failures"] *= factor
+        entry["last_seen"] = now
+        return entry
+
+    def record_success(self, url, latency_ms=None, throughput_bps=None):
+        """记录一次成功访问，latency_ms 为首字节时间，throughput_bps 为下载速度"""
+        now = time.time()
+        with self._lock:
+            entry = self._entry(url, now)
+            entry["successes"] += 1
+            entry["decayed_successes"] += 1
+            entry["last_success"] = now
+            entry["last_error"] = None
+            if latency_ms is not None:
+                entry["latency_ms"] = _ewma(entry["latency_ms"], latency_ms)
+            if throughput_bps is not None:
+                entry["throughput_bps"] = _ewma(entry["throughput_bps"], throughput_bps)
+
+    def record_failure(self, url, error=None):
+        """记录一次失败访问"""
+        now = time.time()
+        with self._lock:
+            entry = self._entry(url, now)
+            entry["failures"] += 1
+            entry["decayed_failures"] += 1
+            entry["last_error"] = error or "未知错误"
+
+    def blacklist(self, url, reason, duration=DEFAULT_BLACKLIST_TIME):
+        """拉黑返回了错误内容的镜像，在 duration 秒内不再使用"""
+        now = time.time()
+        with self._lock:
+            entry = self._entry(url, now)
+            entry["failures"] += 1
+            entry["decayed_failures"] += 1
+            entry["last_error"] = reason
+            entry["blacklisted_until"] = now + duration
+
+    def is_blacklisted(self, url):
+        entry = self.entries.get(mirror_key(url))
+        return bool(entry and entry.get("blacklisted_until", 0) > time.time())
+
+    def usable(self, urls):
+        """去掉被拉黑的镜像后按得分排序"""
+        return self.ranked([url for url in urls if not self.is_blacklisted(url)])
+
+    def record_probe_results(self, results):
+        """批量记录 mirror_probe.probe_mirrors 的测速结果，因提前返回而取消的测速不计入"""
+        for result in results:
+            if result.get("cancelled"):
+                continue
+            if result["ok"]:
+                self.record_success(result["url"], latency_ms=result["latency_ms"])
+            else:
+                self.record_failure(result["url"], result["error"])
+
+    def score(self, url):
+        """
+        镜像得分，越高越好；没有记录的镜像返回 None
+
+        得分 = 平滑后的衰减成功率 × 1000 / (延迟ms + 100)
+        """
+        entry = self.entries.get(mirror_key(url))
+        if entry is None:
+            return None
+        factor = 0.5 ** (max(0.0, time.time() - entry["last_seen"]) / self.half_life)
+        successes = entry["decayed_successes"] * factor
+        failures = entry["decayed_failures"] * factor
+        reliability = (successes + 1) / (successes + failures + 2)
+        latency = entry["latency_ms"] if entry["latency_ms"] is not None else 1000
+        return reliability * 1000 / (latency + 100)
+
+    def ranked(self, urls):
+        """
+        按得分从高到低对镜像排序，没有记录的镜像按中性得分参与排序，
+        得分相同时保持原顺序
+        """
+        neutral = 0.5 * 1000 / (1000 + 100)
+
+        def key(item):
+            index, url = item
+            score = self.score(url)
+            return -(neutral if score is None else score), index
+
+        return [url for _, url in sorted(enumerate(urls), key=key)]
+
+    def fresh_best(self, urls, max_age=DEFAULT_FRESH_AGE):
+        """
+        返回近期成功过且最近一次访问未失败的镜像，按得分排序
+
+        有结果时调用方可以跳过测速直接使用
+        """
+        now = time.time()
+        fresh = []
+        for url in urls:
+            entry = self.entries.get(mirror_key(url))
+            if (entry and entry["last_success"] and entry["last_error"] is None
+                    and now - entry["last_success"] <= max_age):
+                fresh.append(url)
+        return self.ranked(fresh)
+
+
+def _merge_entry(current, base, ours):
+    """
+    合并同一镜像的记录
+
+    current 为文件中的最新记录，base 为本进程读取时的记录，ours 为本进程修改后的记录；
+    文件中的记录在此期间没有被其他进程改动时直接使用本进程的记录
+    """
+    if current is None or current == base:
+        return ours
+    merged = dict(ours)
+    for name in ("successes", "failures"):
+        added = ours[name] - (base[name] if base else 0)
+        merged[name] = current.get(name, 0) + added
+        # 本进程新增的次数都发生在刚才，按未衰减计入
+        merged[f"decayed_{name}"] = current.get(f"decayed_{name}", 0.0) + added
+    if current.get("last_seen", 0) > ours["last_seen"]:
+        merged["last_seen"] = current["last_seen"]
+        merged["last_error"] = current.get("last_error")
+    merged["last_success"] = max(ours["last_success"] or 0, current.get("last_success") or 0) or None
+    merged["blacklisted_until"] = max(ours.get("blacklisted_until", 0), current.get("blacklisted_until", 0))
+    if not merged["blacklisted_until"]:
+        del merged["blacklisted_until"]
+    for name in ("latency_ms", "throughput_bps"):
+        if merged[name] is None:
+            merged[name] = current.get(name)
+    return merged
+
+
+def _ewma(old, new):
+    """指数滑动平均"""
+    return new if old is None else old * (1 - EWMA_ALPHA) + new * EWMA_ALPHA
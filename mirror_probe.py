@@ -0,0 +1,141 @@
+# coding=UTF-8
+# 本更新脚本以GPL v3.0开源
+# GitHub镜像代理并发测速
+import time
+import queue
+import threading
+
+import requests
+import urllib3
+
+from http_client import get_client
+
+# 分步设置超时：连接3秒，读取5秒
+PROBE_TIMEOUT = (3, 5)
+
+
+def probe_mirror(url, timeout=PROBE_TIMEOUT):
+    """
+    对单个镜像地址发送HEAD请求并测量延迟
+
+    参数:
+        url: 镜像地址
+        timeout: (连接超时, 读取超时)
+
+    返回:
+        测速结果字典: url, ok, latency_ms, status, insecure, error, cancelled
+    """
+    result = {"url": url, "ok": False, "latency_ms": None, "status": None, "insecure": False, "error": None,
+              "cancelled": False}
+    # 与下载共用连接池，测速时建立的连接之后可以直接复用
+    client = get_client()
+    start_time = time.perf_counter()
+    try:
+        try:
+            response = client.head(url, timeout=timeout)
+        except requests.exceptions.SSLError:
+            # SSL失败时尝试不验证
+            urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+            result["insecure"] = True
+            start_time = time.perf_counter()
+            response = client.head(url, timeout=timeout, verify=False)
+        result["status"] = response.status_code
+        result["latency_ms"] = (time.perf_counter() - start_time) * 1000
+        result["ok"] = response.status_code == 200
+        if not result["ok"]:
+            result["error"] = f"HTTP {response.status_code}"
+    except requests.exceptions.Timeout:
+        result["error"] = "请求超时"
+    except requests.exceptions.ConnectionError:
+        result["error"] = "连接失败"
+    except Exception as e:
+        result["error"] = f"未知异常 ({str(e)})"
+    return result
+
+
+def probe_mirrors(urls, deadline=10.0, first_n=None, good_enough_ms=None,
+                  max_workers=16, timeout=PROBE_TIMEOUT, verbose=True):
+    """
+    并发测试所有镜像地址的延迟
+
+    参数:
+        urls: 镜像地址列表
+        deadline: 整体截止时间（秒），超时未返回的镜像记为失败；
+                  因 first_n/good_enough_ms 提前返回时未完成的镜像记为已取消（cancelled），不代表镜像有问题
+        first_n: 收到N个成功响应后立即返回（None表示不启用）
+        good_enough_ms: 出现延迟低于该阈值的镜像后立即返回（None表示不启用）
+        max_workers: 并发线程数
+        timeout: 单个请求的 (连接超时, 读取超时)
+        verbose: 是否打印每个镜像的测速结果
+
+    返回:
+        测速结果列表，成功的按延迟升序排在前面，其余保持原顺序
+    """
+    urls = list(dict.fromkeys(urls))  # 去重并保持顺序
+    results = {}
+    if not urls:
+        return []
+
+    # 用守护线程测速：提前返回后仍在进行的请求不会阻塞进程退出（线程池的线程在退出时会被等待）
+    todo = queue.Queue()
+    for url in urls:
+        todo.put(url)
+    done = queue.Queue()
+
+    def worker():
+        while True:
+            try:
+                url = todo.get_nowait()
+            except queue.Empty:
+                return
+            done.put(probe_mirror(url, timeout))
+
+    for _ in range(min(max_workers, len(urls))):
+        threading.Thread(target=worker, daemon=True).start()
+
+    end_time = time.perf_counter() + deadline
+    successes = 0
+    satisfied = False
+    while len(results) < len(urls):
+        remaining = end_time - time.perf_counter()
+        if remaining <= 0:
+            break
+        try:
+            result = done.get(timeout=remaining)
+        except queue.Empty:
+            break
+        results[result["url"]] = result
+        if verbose:
+            _print_result(result)
+        if result["ok"]:
+            successes += 1
+            if good_enough_ms is not None and result["latency_ms"] <= good_enough_ms:
+                satisfied = True
+        if first_n is not None and successes >= first_n:
+            satisfied = True
+        if satisfied:
+            break
+    # 不等待仍在进行的请求，直接返回已有结果；尚未开始的测速不再进行
+    while True:
+        try:
+            todo.get_nowait()
+        except queue.Empty:
+            break
+
+    for url in urls:
+        if url in results:
+            continue
+        results[url] = {"url": url, "ok": False, "latency_ms": None, "status": None, "insecure": False,
+                        "error": None if satisfied else "未在截止时间内完成", "cancelled": satisfied}
+
+    ordered = [results[url] for url in urls]
+    return sorted(ordered, key=lambda r: (not r["ok"], r["latency_ms"] if r["ok"] else 0))
+
+
+def _print_result(result):
+    """打印单个镜像的测速结果"""
+    if result["ok"]:
+        suffix = " (不安全连接)" if result["insecure"] else ""
+        print(f"{result['url']}: {result['latency_ms']:.2f}ms{suffix}")
+    else:
+        print(f"{result['url']}: {result['error']}")
@@ -0,0 +1,339 @@
+# coding=UTF-8
+# 本更新脚本以GPL v3.0开源
+# 多镜像分段并发下载（HTTP Range）
+import re
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from requests.exceptions import RequestException
+
+import metrics
+from download_journal import DownloadJournal
+from http_client import get_client, Progress
+from integrity import IntegrityError
+
+# 每个分段的默认大小
+DEFAULT_SEGMENT_SIZE = 4 * 1024 * 1024
+# 剩余字节少于该值的分段不再拆分
+MIN_SPLIT_SIZE = 512 * 1024
+# 单个镜像连续失败多少次后放弃该镜像
+MAX_MIRROR_FAILURES = 2
+# 分段超过该时长（秒）没有进展时，其余镜像可以接管全部剩余部分
+STALL_TIMEOUT = 3.0
+# 分段下载每次读取的块大小；块太大时慢速镜像在 STALL_TIMEOUT 内读不满一块，会被误判为卡住
+SEGMENT_CHUNK_SIZE = 64 * 1024
+
+_CONTENT_RANGE = re.compile(r"bytes (\d+)-(\d+)/(\d+|\*)")
+
+
+def parse_content_range(headers):
+    """
+    解析 Content-Range 响应头
+
+    返回:
+        (起始位置, 结束位置, 文件总大小)，无法解析的部分为 None
+    """
+    match = _CONTENT_RANGE.match(headers.get("content-range", ""))
+    if not match:
+        return None, None, None
+    total_size = int(match.group(3)) if match.group(3) != "*" else None
+    return int(match.group(1)), int(match.group(2)), total_size
+
+
+def probe_range_support(url, headers=None, timeout=None):
+    """
+    通过 Range: bytes=0-0 请求检测镜像是否支持分段下载
+
+    返回:
+        测试结果字典: url, ok, total_size, etag, last_modified, latency_ms；
+        不支持 Range 或无法得知文件总大小时 ok 为 False
+    """
+    result = {"url": url, "ok": False, "total_size": None, "etag": None, "last_modified": None,
+              "latency_ms": None}
+    request_headers = dict(headers or {})
+    request_headers["Range"] = "bytes=0-0"
+    start_time = time.perf_counter()
+    try:
+        with get_client().get(url, headers=request_headers, stream=True, timeout=timeout) as response:
+            result["latency_ms"] = (time.perf_counter() - start_time) * 1000
+            if response.status_code != 206:
+                # 镜像忽略了 Range，响应体是整个文件：不读取，直接关闭连接
+                return result
+            # 读完仅1字节的响应体，连接放回连接池供随后的分段请求复用
+            response.content
+            total_size = parse_content_range(response.headers)[2]
+            if total_size:
+                result["total_size"] = total_size
+                result["etag"] = response.headers.get("ETag")
+                result["last_modified"] = response.headers.get("Last-Modified")
+                result["ok"] = True
+    except RequestException:
+        pass
+    return result
+
+
+class _Segment:
+    """下载分段，pos 为下一个待写入字节，end 为结束位置（不含）"""
+
+    def __init__(self, start, end):
+        self.start = start
+        self.pos = start
+        self.written = start
+        self.end = end
+        self.last_progress = time.monotonic()
+
+    def remaining(self):
+        return self.end - self.pos
+
+
+class _SegmentScheduler:
+    """
+    分段调度器
+
+    空闲的镜像优先领取队列中的分段；队列为空时，把其他镜像手上剩余最多的分段
+    从中间拆开领取后半部分（work stealing），使慢镜像的尾部工作转移到快镜像上；
+    长时间没有进展的分段则整体转交
+    """
+
+    def __init__(self, ranges, segment_size, completed=0, verifier=None):
+        self.verifier = verifier
+        self.cond = threading.Condition()
+        self.write_lock = threading.Lock()
+        self.queue = deque(_Segment(start, min(start + segment_size, end))
+                           for range_start, end in ranges
+                           for start in range(range_start, end, segment_size))
+        self.active = set()
+        self.finished = []
+        self.completed = completed
+
+    def acquire(self):
+        """领取一个分段，全部完成时返回 None"""
+        with self.cond:
+            while True:
+                if self.queue:
+                    segment = self.queue.popleft()
+                    self.active.add(segment)
+                    return segment
+                victim = max(self.active, key=_Segment.remaining, default=None)
+                if victim and victim.remaining() >= 2 * MIN_SPLIT_SIZE:
+                    middle = victim.pos + victim.remaining() // 2
+                    segment = _Segment(middle, victim.end)
+                    victim.end = middle
+                    self.active.add(segment)
+                    return segment
+                stalled = [s for s in self.active
+                           if s.remaining() > 0 and time.monotonic() - s.last_progress > STALL_TIMEOUT]
+                if stalled:
+                    # 卡住的分段整体转交，原镜像超时后归还时已无剩余部分
+                    victim = stalled[0]
+                    segment = _Segment(victim.pos, victim.end)
+                    victim.end = victim.pos
+                    self.active.add(segment)
+                    return segment
+                if not any(s.remaining() > 0 for s in self.active):
+                    return None
+                # 剩余分段太小不值得拆分，等待其他镜像完成或失败归还
+                self.cond.wait(0.5)
+
+    def reserve(self, segment, size):
+        """为即将写入的数据预留位置，返回写入偏移和允许写入的长度"""
+        with self.cond:
+            offset = segment.pos
+            allowed = max(0, min(size, segment.end - segment.pos))
+            segment.pos += allowed
+            segment.last_progress = time.monotonic()
+            return offset, allowed
+
+    def write(self, output, segment, offset, data, url=None):
+        """
+        各镜像共用同一个文件句柄，定位和写入需要加锁；completed 只统计已写入的字节；
+        有校验器时在同一把锁内计算摘要，不需要下载完成后再读一遍文件
+        """
+        with self.write_lock:
+            if self.verifier is not None:
+                self.verifier.update(url, offset, data)
+            output.seek(offset)
+            output.write(data)
+            segment.written = offset + len(data)
+            self.completed += len(data)
+
+    def done_ranges(self):
+        """已写入的字节区间，用于保存断点续传日志"""
+        with self.cond:
+            segments = self.finished + list(self.active)
+            return [[s.start, s.written] for s in segments if s.written > s.start]
+
+    def release(self, segment):
+        """分段结束：未完成的部分放回队列头部供其他镜像领取"""
+        with self.cond:
+            self.active.discard(segment)
+            self.finished.append(segment)
+            if segment.end > segment.written:
+                self.queue.appendleft(_Segment(segment.written, segment.end))
+            self.cond.notify_all()
+
+
+def _mirror_worker(url, output, scheduler, headers, timeout, stats, chunk_size=SEGMENT_CHUNK_SIZE):
+    """单个镜像的下载线程：循环领取分段并写入文件对应位置，同一镜像的各分段复用连接"""
+    client = get_client()
+    failures = 0
+    while failures < MAX_MIRROR_FAILURES:
+        segment = scheduler.acquire()
+        if segment is None:
+            break
+        try:
+            request_headers = dict(headers)
+            request_headers["Range"] = f"bytes={segment.pos}-{segment.end - 1}"
+            with client.get(url, headers=request_headers, stream=True, timeout=timeout) as response:
+                if response.status_code != 206 or parse_content_range(response.headers)[0] != segment.pos:
+                    raise RequestException(f"镜像未按 Range 返回数据 (HTTP {response.status_code})")
+                for chunk in client.iter_chunks(response, chunk_size):
+                    offset, allowed = scheduler.reserve(segment, len(chunk))
+                    if allowed:
+                        scheduler.write(output, segment, offset, chunk[:allowed], url)
+                        stats["bytes"] += allowed
+                        metrics.count("bytes_downloaded", allowed)
+                    if segment.remaining() <= 0:
+                        break
+            if segment.remaining() > 0:
+                raise RequestException("分段数据不完整")
+            failures = 0
+        except (RequestException, OSError) as e:
+            failures += 1
+            stats["errors"].append(f"{type(e).__name__}: {e}")
+            metrics.count("retries")
+        finally:
+            scheduler.release(segment)
+
+
+def segmented_download(urls, filename, headers=None, max_mirrors=4, segment_size=DEFAULT_SEGMENT_SIZE,
+                       timeout=None, health=None, journal=None, verifier=None):
+    """
+    从多个镜像并发分段下载同一个文件
+
+    参数:
+        urls: 镜像地址列表（按优先级排序）
+        filename: 保存的文件名
+        headers: 请求头
+        max_mirrors: 同时使用的镜像数量上限
+        segment_size: 分段大小
+        timeout: (连接超时, 读取超时)，默认按镜像延迟自动设置
+        health: 可选的 MirrorHealthStore，用于记录各镜像表现
+        journal: 可选的 DownloadJournal，校验通过时只下载缺失的区间，
+            未完成时保留进度供下次续传
+        verifier: 可选的 integrity.DownloadVerifier，声明大小不符的镜像不使用，
+            下载完成后摘要不符时丢弃已下载的内容；数据来自多个镜像时无法确定是哪个有误，
+            只记一次失败，由调用方改用单个镜像下载找出有问题的镜像
+
+    返回:
+        成功返回文件路径；没有镜像支持 Range 或下载失败返回 None，
+        调用方应回退到单线程下载
+    """
+    headers = dict(headers or {})
+    candidates = list(dict.fromkeys(urls))[:max_mirrors * 2]
+    if not candidates:
+        return None
+
+    print(f"检测镜像是否支持分段下载...")
+    with ThreadPoolExecutor(max_workers=len(candidates)) as executor:
+        probes = list(executor.map(lambda u: probe_range_support(u, headers, timeout), candidates))
+    supported = sorted((p for p in probes if p["ok"]), key=lambda p: p["latency_ms"])
+    if not supported:
+        print("没有镜像支持分段下载，改用单线程下载")
+        return None
+
+    # 有可信的预期大小时，声明大小不符的镜像直接拉黑
+    if verifier is not None and verifier.expected_size is not None:
+        for probe in supported:
+            if probe["total_size"] != verifier.expected_size:
+                print(f"⚠️ {probe['url'].split('//')[1].split('/')[0]} 声明的文件大小不符，已拉黑")
+                if health is not None:
+                    health.blacklist(probe["url"], f"文件大小不符: {probe['total_size']}")
+        supported = [p for p in supported if p["total_size"] == verifier.expected_size]
+        if not supported:
+            print("没有文件大小符合预期的镜像，改用单线程下载")
+            return None
+
+    # 只使用与最快镜像文件大小一致的镜像，避免混合不同版本的内容
+    best = supported[0]
+    total_size = best["total_size"]
+    mirrors = [p["url"] for p in supported if p["total_size"] == total_size][:max_mirrors]
+    print(f"文件大小: {total_size/(1024 * 1024):.2f} MB，使用 {len(mirrors)} 个镜像分段下载")
+
+    if journal is None:
+        journal = DownloadJournal(filename)
+    resume = journal.matches(best["etag"], best["last_modified"], total_size, best["url"])
+    output = journal.start(best["url"], best["etag"], best["last_modified"], total_size, resume=resume)
+    output.truncate(total_size)
+    ranges = journal.missing()
+    completed = total_size - sum(end - start for start, end in ranges)
+    if completed:
+        print(f"已完成 {completed/(1024 * 1024):.2f} MB，继续下载剩余部分")
+
+    scheduler = _SegmentScheduler(ranges, segment_size, completed, verifier)
+    stats = {url: {"bytes": 0, "errors": []} for url in mirrors}
+    start_time = time.time()
+    threads = [threading.Thread(target=_mirror_worker, daemon=True,
+                                args=(url, output, scheduler, headers, timeout, stats[url]))
+               for url in mirrors]
+    for thread in threads:
+        thread.start()
+    progress = Progress(total_size)
+    last_save = time.time()
+    while any(thread.is_alive() for thread in threads) and scheduler.completed < total_size:
+        time.sleep(0.1)
+        progress.update(scheduler.completed)
+        if time.time() - last_save >= 2:
+            _save_journal(journal, scheduler, output)
+            last_save = time.time()
+    progress.close(scheduler.completed)
+    # 数据已全部写入时不再等待仍卡在读取上的连接，它们超时后不会再写入任何数据
+    _save_journal(journal, scheduler, output)
+    output.close()
+
+    elapsed = max(time.time() - start_time, 1e-3)
+    for url, stat in stats.items():
+        host = url.split('//')[1].split('/')[0]
+        print(f"  {host}: {stat['bytes']/(1024 * 1024):.2f} MB, {stat['bytes']/elapsed/1024:.0f} KB/s"
+              + (f", 失败 {len(stat['errors'])} 次" if stat["errors"] else ""))
+        if health is not None:
+            if stat["bytes"]:
+                health.record_success(url, throughput_bps=stat["bytes"] / elapsed)
+            if stat["errors"]:
+                health.record_failure(url, stat["errors"][-1])
+
+    if not journal.is_complete():
+        print(f"❌ 分段下载未完成 ({scheduler.completed}/{total_size} 字节)，已保存进度")
+        return None
+    if verifier is not None:
+        try:
+            verifier.verify(total_size)
+        except IntegrityError as e:
+            print(f"❌ 完整性校验失败: {e}")
+            source = verifier.single_source()
+            if health is not None:
+                if source:
+                    health.blacklist(source, str(e))
+                else:
+                    for url in verifier.contributors:
+                        health.record_failure(url, f"分段下载校验失败: {e}")
+            if not source:
+                # 记下各镜像提供的数据，单个镜像重新下载并校验通过后据此找出有误的镜像
+                verifier.keep_suspects()
+                print("数据来自多个镜像，暂时无法确定是哪个镜像有误，改用单个镜像重新下载后比对")
+            journal.discard()
+            verifier.reset()
+            return None
+    print(f"✅ 分段下载成功! 耗时: {elapsed:.2f}秒")
+    return journal.finalize()
+
+
+def _save_journal(journal, scheduler, output):
+    """刷新文件缓冲后把已写入的区间记入日志"""
+    with scheduler.write_lock:
+        output.flush()
+        for start, end in scheduler.done_ranges():
+            journal.mark_done(start, end)
+    journal.save()
@@ -0,0 +1,78 @@
+# coding=UTF-8
+# 本更新脚本以GPL v3.0开源
+# 多个进程共用的 JSON 状态文件：加锁后重新读取、合并再原子写入，批量更新时并发保存不会互相覆盖
+import os
+import json
+import time
+import tempfile
+from contextlib import contextmanager
+
+# 其他进程持有锁超过该时长（秒）视为已失效（保存状态文件只需很短时间）
+LOCK_TIMEOUT = 30
+# 等待锁的轮询间隔（秒）
+LOCK_POLL = 0.02
+
+
+@contextmanager
+def locked(path, timeout=LOCK_TIMEOUT):
+    """用 <path>.lock 锁文件在进程间互斥，已被其他进程持有时等待其释放或失效"""
+    lock = f"{path}.lock"
+    os.makedirs(os.path.dirname(os.path.abspath(lock)), exist_ok=True)
+    while True:
+        try:
+            os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock) > timeout:
+                    os.remove(lock)
+                    continue
+            except OSError:
+                # 锁刚被释放
+                continue
+            time.sleep(LOCK_POLL)
+    try:
+        yield
+    finally:
+        try:
+            os.remove(lock)
+        except OSError:
+            pass
+
+
+def read_json(path):
+    """读取 JSON 对象，文件缺失、损坏或不是对象时返回空字典"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def write_json(path, data):
+    """先写入同目录下唯一的临时文件再替换，多个进程同时写入不会互相破坏临时文件"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f"{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def update_json(path, merge):
+    """
+    加锁后读取文件当前内容，交给 merge(当前内容) 与本进程的修改合并，再写回
+
+    返回:
+        写入的内容
+    """
+    with locked(path):
+        data = merge(read_json(path))
+        write_json(path, data)
+    return data
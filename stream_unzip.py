@@ -0,0 +1,257 @@
+# coding=UTF-8
+# 本更新脚本以GPL v3.0开源
+# 边下载边解压：按到达顺序解析ZIP本地文件头，只解压需要的目录
+import os
+import time
+import zlib
+import struct
+
+_LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+_LOCAL_SIGNATURE = 0x04034b50
+_CENTRAL_SIGNATURE = 0x02014b50
+_END_SIGNATURE = 0x06054b50
+_DESCRIPTOR_SIGNATURE = b"PK\x07\x08"
+_FLAG_DESCRIPTOR = 0x08
+_FLAG_UTF8 = 0x800
+# 目录结束记录（22字节）加最长注释的长度，读完文件数据后只保留这么多尾部数据
+_TAIL_SIZE = 22 + 0xFFFF
+
+
+class StreamingZipError(Exception):
+    """流式解压无法处理的ZIP内容，调用方应回退到先下载后解压"""
+
+
+class StreamingZipExtractor:
+    """
+    流式ZIP解压器
+
+    通过 feed() 按顺序喂入ZIP数据，解析本地文件头并把顶层目录下
+    以 prefix 开头的条目直接写入 dest_dir，其余条目跳过不解压
+    """
+
+    def __init__(self, dest_dir, prefix=""):
+        self.dest_dir = os.path.abspath(dest_dir)
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self.offset = 0
+        self.finished = False
+        self.files = 0
+        self.bytes_written = 0
+        self._buffer = bytearray()
+        self._entry = None
+
+    def feed(self, data):
+        """喂入下一段数据"""
+        self.offset += len(data)
+        self._buffer += data
+        if self.finished:
+            del self._buffer[:-_TAIL_SIZE]
+            return
+        while not self.finished:
+            if self._entry is None:
+                if not self._read_header():
+                    return
+            elif not self._read_data():
+                return
+
+    @property
+    def comment(self):
+        """
+        归档注释（git archive 生成的压缩包中为提交哈希），
+        需在喂入全部数据后读取，没有注释时返回 b""
+        """
+        if not self.finished:
+            return b""
+        pos = self._buffer.rfind(b"PK\x05\x06")
+        if pos < 0 or pos + 22 > len(self._buffer):
+            return b""
+        length = struct.unpack_from("<H", self._buffer, pos + 20)[0]
+        return bytes(self._buffer[pos + 22:pos + 22 + length])
+
+    def close(self):
+        """确认已读到中央目录，即归档完整"""
+        self.abort()
+        if not self.finished:
+            raise StreamingZipError("ZIP数据不完整")
+
+    def abort(self):
+        """放弃解压，关闭正在写入的文件"""
+        if self._entry is not None and self._entry["out"]:
+            self._entry["out"].close()
+        self._entry = None
+
+    def _read_header(self):
+        """解析本地文件头，数据不足时返回 False"""
+        if len(self._buffer) < 4:
+            return False
+        signature = struct.unpack_from("<I", self._buffer)[0]
+        if signature in (_CENTRAL_SIGNATURE, _END_SIGNATURE):
+            # 之后是中央目录，所有文件数据都已处理完
+            self.finished = True
+            return False
+        if signature != _LOCAL_SIGNATURE:
+            raise StreamingZipError(f"无效的ZIP本地文件头 (偏移 {self.offset - len(self._buffer)})")
+        if len(self._buffer) < _LOCAL_HEADER.size:
+            return False
+        (_, _, flags, method, mod_time, mod_date, crc, compressed_size, size,
+         name_len, extra_len) = _LOCAL_HEADER.unpack_from(self._buffer)
+        header_size = _LOCAL_HEADER.size + name_len + extra_len
+        if len(self._buffer) < header_size:
+            return False
+        raw_name = bytes(self._buffer[_LOCAL_HEADER.size:_LOCAL_HEADER.size + name_len])
+        extra = bytes(self._buffer[_LOCAL_HEADER.size + name_len:header_size])
+        del self._buffer[:header_size]
+
+        zip64 = False
+        if compressed_size == 0xFFFFFFFF or size == 0xFFFFFFFF:
+            size, compressed_size = _parse_zip64_extra(extra, size, compressed_size)
+            zip64 = True
+        if method not in (0, 8):
+            raise StreamingZipError(f"不支持的压缩方式: {method}")
+        descriptor = bool(flags & _FLAG_DESCRIPTOR)
+        if descriptor and method == 0 and compressed_size == 0:
+            raise StreamingZipError("无法流式处理带数据描述符的未压缩条目")
+
+        name = raw_name.decode("utf-8" if flags & _FLAG_UTF8 else "cp437")
+        path = self._target_path(name)
+        entry = {
+            "name": name, "path": path, "method": method, "crc": crc,
+            "size": size, "remaining": compressed_size, "zip64": zip64,
+            "descriptor": descriptor, "until_eof": descriptor and compressed_size == 0,
+            "data_done": False,
+            "mtime": _dos_time(mod_date, mod_time),
+            "inflater": zlib.decompressobj(-15) if method == 8 else None,
+            "crc_actual": 0, "size_actual": 0, "out": None,
+        }
+        if path is not None:
+            if name.endswith("/"):
+                os.makedirs(path, exist_ok=True)
+                path = None
+                entry["path"] = None
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                entry["out"] = open(path, "wb")
+        elif not entry["until_eof"]:
+            entry["inflater"] = None  # 不需要的条目直接跳过压缩数据
+        self._entry = entry
+        return True
+
+    def _target_path(self, name):
+        """计算条目的解压路径，不在 prefix 下的条目返回 None"""
+        relative = name.split("/", 1)[1] if "/" in name else ""
+        if not relative.startswith(self.prefix) or relative == self.prefix:
+            return None
+        relative = relative[len(self.prefix):]
+        parts = [p for p in relative.split("/") if p]
+        if not parts or any(p in ("..", ".") or ":" in p for p in parts):
+            raise StreamingZipError(f"不安全的条目路径: {name}")
+        path = os.path.join(self.dest_dir, *parts)
+        return path + "/" if name.endswith("/") else path
+
+    def _read_data(self):
+        """处理当前条目的压缩数据及其后的数据描述符，数据不足时返回 False"""
+        entry = self._entry
+        if not entry["data_done"]:
+            if entry["until_eof"]:
+                # 本地文件头中没有大小，只能解压到deflate流结束为止
+                if not self._buffer:
+                    return False
+                chunk = bytes(self._buffer)
+                self._buffer.clear()
+                self._consume(chunk)
+                if not entry["inflater"].eof:
+                    return False
+                self._buffer[:0] = entry["inflater"].unused_data
+            else:
+                if entry["remaining"] > 0:
+                    if not self._buffer:
+                        return False
+                    chunk = bytes(self._buffer[:entry["remaining"]])
+                    del self._buffer[:len(chunk)]
+                    entry["remaining"] -= len(chunk)
+                    self._consume(chunk)
+                    if entry["remaining"] > 0:
+                        return False
+                if entry["inflater"] is not None:
+                    self._write(entry["inflater"].flush())
+            entry["data_done"] = True
+        if entry["descriptor"]:
+            return self._read_descriptor()
+        self._finish_entry(entry["crc"], entry["size"])
+        return True
+
+    def _read_descriptor(self):
+        """读取数据之后的数据描述符（签名可选），其中的CRC和大小才是准确值"""
+        entry = self._entry
+        size_len = 8 if entry["zip64"] else 4
+        need = 4 + 2 * size_len
+        if len(self._buffer) < 4:
+            return False
+        has_signature = self._buffer[:4] == _DESCRIPTOR_SIGNATURE
+        if len(self._buffer) < need + (4 if has_signature else 0):
+            return False
+        if has_signature:
+            del self._buffer[:4]
+        fmt = "<IQQ" if entry["zip64"] else "<III"
+        crc, _, size = struct.unpack_from(fmt, self._buffer)
+        del self._buffer[:need]
+        self._finish_entry(crc, size)
+        return True
+
+    def _consume(self, chunk):
+        """解压（或原样写出）一段压缩数据"""
+        entry = self._entry
+        if entry["inflater"] is not None:
+            self._write(entry["inflater"].decompress(chunk))
+        elif entry["method"] == 0:
+            self._write(chunk)
+
+    def _write(self, data):
+        entry = self._entry
+        if not data or entry["out"] is None:
+            return
+        entry["out"].write(data)
+        entry["crc_actual"] = zlib.crc32(data, entry["crc_actual"])
+        entry["size_actual"] += len(data)
+
+    def _finish_entry(self, crc, size):
+        """关闭文件并校验CRC和大小"""
+        entry = self._entry
+        self._entry = None
+        if entry["out"] is None:
+            return
+        entry["out"].close()
+        if entry["crc_actual"] != crc or entry["size_actual"] != size:
+            raise StreamingZipError(f"CRC校验失败: {entry['name']}")
+        os.utime(entry["path"], (entry["mtime"], entry["mtime"]))
+        self.files += 1
+        self.bytes_written += size
+
+
+def _parse_zip64_extra(extra, size, compressed_size):
+    """从 Zip64 扩展字段中读取真实大小"""
+    pos = 0
+    while pos + 4 <= len(extra):
+        tag, length = struct.unpack_from("<HH", extra, pos)
+        if tag == 0x0001:
+            values = extra[pos + 4:pos + 4 + length]
+            index = 0
+            if size == 0xFFFFFFFF:
+                size = struct.unpack_from("<Q", values, index)[0]
+                index += 8
+            if compressed_size == 0xFFFFFFFF:
+                compressed_size = struct.unpack_from("<Q", values, index)[0]
+            return size, compressed_size
+        pos += 4 + length
+    raise StreamingZipError("缺少 Zip64 扩展字段")
+
+
+def _dos_time(dos_date, dos_time):
+    """DOS日期时间转换为时间戳"""
+    try:
+        return time.mktime((
+            (dos_date >> 9) + 1980, (dos_date >> 5) & 0xF, dos_date & 0x1F,
+            dos_time >> 11, (dos_time >> 5) & 0x3F, (dos_time & 0x1F) * 2, 0, 0, -1
+        ))
+    except (OverflowError, ValueError):
+        return time.time()
+
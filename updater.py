@@ -1,13 +1,16 @@
 # coding=UTF-8
 # 本更新脚本以GPL v3.0开源
 import os
+import re
+import sys
+import json
 import time
-import shutil
-import requests
-import subprocess
-from datetime import datetime
-from urllib3.util.retry import Retry
-from requests.adapters import HTTPAdapter
+import argparse
+import metrics
+from mirror_health import MirrorHealthStore
+from git_runner import run_git_command
+from fetch_strategy import fetch_and_reset
+from git_cache import GitCache
 
 # 常量
 DEFAULT_REPO_URL = "https://github.com/xinnan-tech/xiaozhi-esp32-server.git"
@@ -15,7 +18,7 @@ DEFAULT_REPO_URL = "https://github.com/xinnan-tech/xiaozhi-esp32-server.git"
 def get_github_proxy_urls():
     """返回GitHub镜像代理地址列表"""
     return [
-        "https://ghfast.top"
+        "https://ghfast.top",
         "https://gh.ddlc.top",
         "https://slink.ltd",
         "https://cors.isteed.cc",
@@ -32,78 +35,154 @@ def get_github_proxy_urls():
         "https://ghproxy.net"
     ]
 
-def run_git_command(git_path, args):
-    """执行 Git 命令并实时显示输出"""
-    process = subprocess.Popen(
-        [git_path] + args,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-        text=True,
-        encoding='utf-8',
-        errors='replace'
-    )
-
-    output_lines = []
-    print(f"\n执行命令: git {' '.join(args)}")
-    print("-" * 60)
-    while True:
-        output = process.stdout.readline()
-        if output == '' and process.poll() is not None:
-            break
-        if output:
-            cleaned = output.strip()
-            print(cleaned)
-            output_lines.append(cleaned)
-    print("-" * 60)
-    return process.poll(), '\n'.join(output_lines)
-    
+def select_proxy_url(deadline=10.0, first_n=3, good_enough_ms=None, use_cache=True):
+    """
+    自动选择延迟最低的GitHub代理地址
+
+    镜像健康记录中有近期可用的代理时直接使用，不再测速；
+    否则并发测试所有代理，收到 first_n 个成功响应、出现延迟低于 good_enough_ms 的代理
+    或到达 deadline 秒后，立即从已有结果中选择延迟最低者
+    """
+    # 测速才需要 requests，用户不设置代理或只检查更新时不加载
+    from mirror_probe import probe_mirrors
+
+    health = MirrorHealthStore()
+    # 返回过错误内容的代理暂不使用
+    proxies = [p for p in get_github_proxy_urls() if not health.is_blacklisted(p)]
+
+    if use_cache:
+        cached = health.fresh_best(proxies)
+        if cached:
+            print(f"\n使用近期测速记录，已选择代理: {cached[0]}")
+            return cached[0]
 
-def select_proxy_url():
-    """自动选择延迟最低的GitHub代理地址"""
-    proxies = get_github_proxy_urls()
     print(f"\n请稍后，正在测试代理地址延迟...")
-    
-    # 配置重试策略
-    retries = Retry(total=3, backoff_factor=0.5)
-    session = requests.Session()
-    session.mount('https://', HTTPAdapter(max_retries=retries))
-    
-    proxy_latencies = {}
-    for url in proxies:
-        try:
-            start_time = time.time()
-            # 分步设置超时：连接3秒，读取5秒
-            response = session.head(url, timeout=(3, 5))
-            if response.status_code == 200:
-                latency = (time.time() - start_time) * 1000
-                proxy_latencies[url] = latency
-                print(f"{url}: {latency:.2f}ms")
-        except requests.exceptions.SSLError:
-            try:
-                # SSL失败时尝试不验证
-                start_time = time.time()
-                response = session.head(url, timeout=(3,5), verify=False)
-                if response.status_code == 200:
-                    latency = (time.time() - start_time) * 1000
-                    proxy_latencies[url] = latency
-                    print(f"{url}: {latency:.2f}ms (不安全连接)")
-            except Exception as e:
-                print(f"{url}: SSL失败后重试异常 ({str(e)})")
-        except requests.exceptions.Timeout:
-            print(f"{url}: 请求超时")
-        except requests.exceptions.ConnectionError:
-            print(f"{url}: 连接失败")
-        except Exception as e:
-            print(f"{url}: 未知异常 ({str(e)})")
-    
-    if not proxy_latencies:
+
+    with metrics.span("probe"):
+        results = probe_mirrors(proxies, deadline=deadline, first_n=first_n, good_enough_ms=good_enough_ms)
+    health.record_probe_results(results)
+    health.save()
+    available = [r for r in results if r["ok"]]
+
+    if not available:
         print("\n所有代理地址测试失败，将不使用代理")
         return None
-    
-    best_proxy = min(proxy_latencies.items(), key=lambda x: x[1])
-    print(f"\n已选择最低延迟代理: {best_proxy[0]} ({best_proxy[1]:.2f}ms)")
-    
-    return best_proxy[0]
+
+    best_proxy = available[0]
+    print(f"\n已选择最低延迟代理: {best_proxy['url']} ({best_proxy['latency_ms']:.2f}ms)")
+
+    return best_proxy["url"]
+
+
+def _print_transfer_summary(result):
+    """打印 Git 命令的传输统计"""
+    parts = [f"耗时 {result['duration']:.2f}秒"]
+    if result["refs_updated"]:
+        parts.append(f"更新引用 {len(result['refs_updated'])} 个")
+    if result["objects"] is not None:
+        parts.append(f"接收对象 {result['objects']} 个")
+    if result["bytes"] is not None:
+        parts.append(f"传输 {result['bytes']/(1024 * 1024):.2f} MB")
+    print("📊 " + "，".join(parts))
+
+
+def check_for_updates(git_path, branch="main"):
+    """
+    用 ls-remote 查询远程分支的最新提交并与本地比较，只需一次网络往返，不下载任何对象
+
+    返回:
+        字典: remote（远程提交）, head（本地 HEAD）, tracking（本地 origin/分支）,
+        up_to_date（远程提交已包含在本地 HEAD 中为 True，远程无法访问时为 None）
+    """
+    with metrics.span("check"):
+        result = run_git_command(git_path, ["ls-remote", "origin", f"refs/heads/{branch}"], timeout=30, echo=False)
+    match = re.search(r"^([0-9a-f]{40})\s", result["output"], re.M) if result["code"] == 0 else None
+    status = {
+        "remote": match.group(1) if match else None,
+        "head": _rev_parse(git_path, "HEAD"),
+        "tracking": _rev_parse(git_path, f"origin/{branch}"),
+        "up_to_date": None,
+    }
+    if status["remote"] is None:
+        print("\n⚠️ 无法获取远程仓库的最新提交，跳过更新检查")
+        return status
+
+    if status["remote"] == status["head"]:
+        status["up_to_date"] = True
+    else:
+        # 本地领先于远程时，远程提交是 HEAD 的祖先，拉取同样不会有新内容
+        ancestor = run_git_command(git_path, ["merge-base", "--is-ancestor", status["remote"], "HEAD"], echo=False)
+        status["up_to_date"] = ancestor["code"] == 0
+    print(f"\n远程最新提交: {status['remote'][:7]}，本地提交: {(status['head'] or '无')[:7]}")
+    return status
+
+
+def _rev_parse(git_path, ref):
+    """解析本地引用对应的提交，不存在时返回 None"""
+    result = run_git_command(git_path, ["rev-parse", "--verify", "-q", f"{ref}^{{commit}}"], echo=False)
+    output = result["output"].strip()
+    return output if result["code"] == 0 and re.fullmatch(r"[0-9a-f]{40}", output) else None
+
+
+def get_cache_source(git_path):
+    """
+    设置了 XIAOZHI_GIT_CACHE 时先刷新本机共享的Git缓存（缓存新鲜时不访问网络）
+
+    返回:
+        拉取使用的缓存位置，未启用缓存或缓存不可用时返回 None
+    """
+    cache = GitCache.from_env(git_path)
+    if cache is None:
+        return None
+    result = run_git_command(git_path, ["remote", "get-url", "origin"], echo=False)
+    if result["code"] != 0:
+        return None
+    return cache.prepare(result["output"].strip())
+
+
+def apply_proxy(git_path, proxy_url):
+    """把 origin 设置为经代理访问的地址，proxy_url 为 None 时重置为默认地址"""
+    if proxy_url:
+        # 拼接代理地址
+        new_url = f"{proxy_url.rstrip('/')}/{DEFAULT_REPO_URL}"
+        print(f"\n设置代理地址：{new_url}")
+    else:
+        new_url = DEFAULT_REPO_URL
+        print(f"\n重置为默认地址：{DEFAULT_REPO_URL}")
+    with metrics.span("remote_rewrite"):
+        run_git_command(git_path, ["remote", "set-url", "origin", new_url])
+
+
+def pull_normal(git_path):
+    """普通拉取，有本机Git缓存时先从缓存拉取，失败再从网络拉取，返回 git pull 的结果字典"""
+    source = get_cache_source(git_path)
+    if source:
+        with metrics.span("fetch"):
+            result = run_git_command(git_path, ["pull", "--progress", source, "+refs/heads/main:refs/remotes/origin/main"])
+        if result["code"] == 0:
+            metrics.count("bytes_downloaded", result["bytes"] or 0)
+            return result
+        print("\n⚠️ 从Git缓存拉取失败，改为从网络拉取")
+    with metrics.span("fetch"):
+        result = run_git_command(git_path, ["pull", "--progress"])
+    metrics.count("bytes_downloaded", result["bytes"] or 0)
+    return result
+
+
+def force_sync(git_path):
+    """
+    强制同步到 origin/main，返回 fetch_and_reset 的结果字典
+
+    只拉取 origin/main，按仓库状态和镜像速度选择单分支、浅拉取或部分拉取；
+    有本机Git缓存时从缓存拉取单个分支，失败再从网络拉取
+    """
+    source = get_cache_source(git_path)
+    if source:
+        result = fetch_and_reset(git_path, mode="single", source=source)
+        if result["code"] == 0:
+            return result
+        print("\n⚠️ 从Git缓存拉取失败，改为从网络拉取")
+    return fetch_and_reset(git_path)
 
 
 def get_pull_mode():
@@ -118,7 +197,12 @@ def get_pull_mode():
         print("输入无效，请重新输入！")
 
 def backup_config(script_dir):
-    """备份配置文件"""
+    """
+    备份配置文件
+
+    在 backup 目录下创建快照，未变化的文件硬链接到上一个快照，并按保留策略清理旧快照；
+    变化文件的压缩方式可用环境变量 XIAOZHI_BACKUP_CODEC 设置（none/gzip/zstd）
+    """
     data_dir = os.path.join(script_dir, "src", "main", "xiaozhi-server", "data")
     
     # 检查配置文件目录是否存在
@@ -130,25 +214,106 @@ def backup_config(script_dir):
         print("\n⚠️ 未找到配置文件，已取消备份")
         return False
     
-    backup_dir = os.path.join(script_dir, "backup", f"backup_{datetime.now().strftime('%Y%m%d%H%M%S')}")
-    
+    backup_root = os.path.join(script_dir, "backup")
+    # 备份模块会加载线程池等，只在备份时导入
+    from config_backup import create_snapshot, apply_retention, format_stats, DEFAULT_RETENTION
+
     try:
-        shutil.copytree(data_dir, backup_dir)
+        with metrics.span("backup"):
+            backup_dir, stats = create_snapshot(data_dir, backup_root, os.environ.get("XIAOZHI_BACKUP_CODEC", "none"))
+        metrics.count("files_written", stats["stored_files"])
         print(f"\n✅ 已帮你备份好配置文件：{backup_dir}")
+        print(f"📊 {format_stats(stats)}")
+        removed = apply_retention(backup_root, **DEFAULT_RETENTION)
+        if removed:
+            print(f"已按保留策略删除 {len(removed)} 个旧快照")
         return True
     except Exception as e:
         print(f"\n❌ 备份失败：{str(e)}")
         return False
 
-def main():
-    # 初始化路径
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    # 切换目录
-    grandparent_dir = os.path.dirname(os.path.dirname(script_dir))
-    os.chdir(grandparent_dir)
-    script_dir = os.getcwd()
+def _locate_paths(root=None):
+    """返回整合包根目录（默认为本脚本上两级目录）、Git 程序路径和源码目录"""
+    script_dir = os.path.abspath(root) if root else os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
     git_path = os.path.join(script_dir, "runtime", "git-2.48.1", "cmd", "git.exe")
     src_dir = os.path.join(script_dir, "src")
+    return script_dir, git_path, src_dir
+
+def check_main():
+    """
+    非交互的更新检查，供计划任务使用：python updater.py --check
+
+    返回:
+        退出码: 0 已是最新，1 有新提交，2 无法判断
+    """
+    _, git_path, src_dir = _locate_paths()
+    if not os.path.exists(git_path) or not os.path.isdir(src_dir):
+        print(f"[ERROR] 未找到Git程序或源码目录：{git_path}")
+        return 2
+    os.chdir(src_dir)
+    status = check_for_updates(git_path)
+    if status["up_to_date"] is None:
+        return 2
+    print("🎉 已是最新版本" if status["up_to_date"] else "✅ 远程仓库有新的提交")
+    return 0 if status["up_to_date"] else 1
+
+def update_install(root, mode="normal", proxy_url=None, reset_proxy=False, always=False):
+    """
+    非交互地更新一个整合包，由批量更新（fleet_update.py）在子进程中调用
+
+    参数:
+        root: 整合包根目录
+        mode: "normal" 普通拉取，"force" 备份配置后强制同步
+        proxy_url: 设置 origin 使用的代理
+        reset_proxy: 把 origin 重置为默认地址（proxy_url 为空时生效）
+        always: 远程没有新提交时也执行拉取
+
+    返回:
+        字典: root, status（updated/up_to_date/failed）, before, after, duration, message
+    """
+    start_time = time.time()
+    script_dir, git_path, src_dir = _locate_paths(root)
+    report = {"root": script_dir, "status": "failed", "before": None, "after": None,
+              "duration": 0.0, "message": ""}
+    if not os.path.exists(git_path) or not os.path.isdir(src_dir):
+        report["message"] = "未找到Git程序或源码目录"
+        print(f"[ERROR] {report['message']}：{git_path}")
+        return report
+
+    os.chdir(src_dir)
+    print(f"当前工作目录：{src_dir}")
+    if proxy_url or reset_proxy:
+        apply_proxy(git_path, proxy_url)
+
+    status = check_for_updates(git_path)
+    report["before"] = status["head"]
+    if status["up_to_date"] and not always:
+        report["status"] = "up_to_date"
+    elif mode == "force":
+        if not backup_config(script_dir):
+            print("\n⚠️ 注意：配置文件未备份，继续执行强制拉取！")
+        result = force_sync(git_path)
+        _print_transfer_summary(result)
+        if result["code"] != 0 or result["reset_code"] != 0:
+            report["message"] = "强制同步失败"
+    else:
+        result = pull_normal(git_path)
+        _print_transfer_summary(result)
+        if result["code"] != 0:
+            report["message"] = "拉取失败"
+
+    report["after"] = _rev_parse(git_path, "HEAD")
+    if not report["message"] and report["status"] != "up_to_date":
+        report["status"] = "updated" if report["after"] != report["before"] else "up_to_date"
+    report["duration"] = time.time() - start_time
+    metrics.set_field("result", report["status"])
+    metrics.set_status("failed" if report["status"] == "failed" else "ok")
+    return report
+
+def main():
+    # 初始化路径并切换目录
+    script_dir, git_path, src_dir = _locate_paths()
+    os.chdir(script_dir)
 
     # 环境检查
     if not os.path.exists(git_path):
@@ -172,41 +337,50 @@ def main():
         if use_proxy:
             proxy_url = select_proxy_url()
             if proxy_url:
-                # 拼接代理地址
-                new_url = f"{proxy_url.rstrip('/')}/{DEFAULT_REPO_URL}"
-                print(f"\n设置代理地址：{new_url}")
-                run_git_command(git_path, ["remote", "set-url", "origin", new_url])
+                apply_proxy(git_path, proxy_url)
             else:
                 reset = input("是否重置为默认地址？(y/n): ").lower() == 'y'
                 if reset:
-                    print(f"\n重置为默认地址：{DEFAULT_REPO_URL}")
-                    run_git_command(git_path, ["remote", "set-url", "origin", DEFAULT_REPO_URL])
+                    apply_proxy(git_path, None)
                 else:
                     print("未输入内容，已取消重置操作")
 
-        # 拉取操作
-        pull_mode = get_pull_mode()
-        
-        if pull_mode == 'normal':
-            code, output = run_git_command(git_path, ["pull"])
-            if code == 0:
-                print("\n✅ 拉取成功，建议同步完成后运行该目录下的一键更新依赖批处理进行依赖更新。" if "Already up" not in output else "\n🎉 恭喜，你本地的代码已经是最新版本！")
-            else:
-                print("\n❌ 拉取失败，请检查日志")
+        # 先比较远程和本地的提交，没有新提交时不必拉取
+        status = check_for_updates(git_path)
+        if status["up_to_date"]:
+            print("\n🎉 远程仓库没有新的提交，你本地的代码已经是最新版本！")
+        if status["up_to_date"] and input("是否仍要继续拉取？(y/n): ").lower() != 'y':
+            print("\n已跳过拉取")
         else:
-            print("\n警告⚠️： 强制拉取将覆盖所有本地修改！")
-            if input("你确认要强制拉取吗？请输入“确认强制拉取”确认操作：") == "确认强制拉取":
-                # 尝试备份并执行强制拉取
-                backup_success = backup_config(script_dir)
-                if not backup_success:
-                    print("\n⚠️ 注意：配置文件未备份，继续执行强制拉取！")
-                
-                print("\n正在强制同步...")
-                run_git_command(git_path, ["fetch", "--all"])
-                run_git_command(git_path, ["reset", "--hard", "origin/main"])
-                print("\n🎉 强制同步完成！建议同步完成后运行该目录下的一键更新依赖批处理进行依赖更新。")
+            # 拉取操作
+            pull_mode = get_pull_mode()
+            
+            if pull_mode == 'normal':
+                result = pull_normal(git_path)
+                if result["code"] == 0:
+                    print("\n✅ 拉取成功，建议同步完成后运行该目录下的一键更新依赖批处理进行依赖更新。" if not result["up_to_date"] else "\n🎉 恭喜，你本地的代码已经是最新版本！")
+                    _print_transfer_summary(result)
+                else:
+                    print("\n❌ 拉取失败，请检查日志")
             else:
-                print("\n⛔ 输入无效，已取消强制拉取操作")
+                print("\n警告⚠️： 强制拉取将覆盖所有本地修改！")
+                if input("你确认要强制拉取吗？请输入“确认强制拉取”确认操作：") == "确认强制拉取":
+                    # 尝试备份并执行强制拉取
+                    backup_success = backup_config(script_dir)
+                    if not backup_success:
+                        print("\n⚠️ 注意：配置文件未备份，继续执行强制拉取！")
+                    
+                    print("\n正在强制同步...")
+                    result = force_sync(git_path)
+                    _print_transfer_summary(result)
+                    if result["saved_bytes"] is not None:
+                        print(f"📉 与拉取全部分支相比节省 {result['saved_bytes']/(1024 * 1024):.2f} MB，{result['saved_seconds']:.2f}秒")
+                    if result["code"] != 0 or result["reset_code"] != 0:
+                        print("\n❌ 强制同步失败，请检查日志")
+                    else:
+                        print("\n🎉 强制同步完成！建议同步完成后运行该目录下的一键更新依赖批处理进行依赖更新。")
+                else:
+                    print("\n⛔ 输入无效，已取消强制拉取操作")
 
     finally:
         # 显示最终远程地址
@@ -215,5 +389,38 @@ def main():
 
     input("\n操作完成，按 Enter 退出...")
 
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="小智AI服务端更新脚本，不带参数时交互运行")
+    parser.add_argument("--check", action="store_true", help="只检查是否有新提交：0 已是最新，1 有更新，2 无法判断")
+    # 以下参数由 fleet_update.py 批量更新时使用
+    parser.add_argument("--unattended", metavar="ROOT", help="非交互地更新该整合包根目录")
+    parser.add_argument("--mode", choices=["normal", "force"], default="normal", help="普通拉取或强制同步")
+    parser.add_argument("--proxy-url", help="使用该代理地址")
+    parser.add_argument("--no-proxy", action="store_true", help="重置为默认地址")
+    parser.add_argument("--always", action="store_true", help="没有新提交时也执行拉取")
+    parser.add_argument("--result", metavar="FILE", help="把更新结果以 JSON 写入该文件")
+    return parser.parse_args(argv)
+
+def cli(argv=None):
+    """
+    命令行入口：python updater.py [参数] 或 python xiaozhi.py update [参数]
+
+    返回:
+        退出码
+    """
+    args = _parse_args(argv)
+    if args.check:
+        return check_main()
+    if args.unattended:
+        with metrics.run("updater", root=os.path.abspath(args.unattended)):
+            report = update_install(args.unattended, args.mode, args.proxy_url, args.no_proxy, args.always)
+        if args.result:
+            with open(args.result, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False)
+        return 0 if report["status"] != "failed" else 1
+    with metrics.run("updater", root=_locate_paths()[0]):
+        main()
+    return 0
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(cli())
\ No newline at end of file
@@ -0,0 +1,64 @@
+# coding=UTF-8
+# 本更新脚本以GPL v3.0开源
+# 统一入口：python xiaozhi.py <命令> [参数]，选中命令后才导入对应模块，检查更新等常用路径不加载下载相关的依赖
+import sys
+import importlib
+
+# 命令: (模块, 入口函数, 说明)，模块为 None 时入口函数在本文件中；入口函数接收剩余的命令行参数并返回退出码
+COMMANDS = {
+    "update": ("updater", "cli", "更新小智AI服务端，不带参数时交互运行，--unattended 非交互更新"),
+    "check": (None, "check", "只检查是否有更新：0 已是最新，1 有更新，2 无法判断，--music 检查音乐小智DLC"),
+    "install-music": ("init_music_xiaozhi_server", "cli", "下载音乐小智服务端DLC并复制配置文件和模型文件"),
+    "fleet": ("fleet_update", "main", "批量更新多个整合包"),
+    "bench": ("benchmark", "main", "运行性能基准，--import-budgets 检查启动时的导入耗时"),
+}
+
+
+def check(argv):
+    """检查更新并退出，不导入测速和下载模块（检查音乐小智DLC时除外）"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description=COMMANDS["check"][2])
+    parser.add_argument("--music", action="store_true", help="检查音乐小智服务端DLC，而不是小智AI服务端")
+    args = parser.parse_args(argv)
+    if args.music:
+        from get_music_xiaozhi_server import check_main
+    else:
+        from updater import check_main
+    return check_main()
+
+
+def print_usage():
+    print("用法: python xiaozhi.py <命令> [参数]\n\n命令:")
+    for name, (_, _, description) in COMMANDS.items():
+        print(f"  {name:<15}{description}")
+    print("\n各命令的参数见 python xiaozhi.py <命令> -h")
+
+
+def main(argv=None):
+    """
+    按第一个参数分派到对应命令
+
+    返回:
+        退出码
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+        if argv:
+            # 子命令的帮助信息显示为 xiaozhi.py update 等
+            sys.argv = [f"{sys.argv[0]} {argv[0]}"] + argv[1:]
+    if not argv or argv[0] in ("-h", "--help"):
+        print_usage()
+        return 0 if argv else 2
+    command = COMMANDS.get(argv[0])
+    if command is None:
+        print(f"❌ 未知的命令: {argv[0]}\n")
+        print_usage()
+        return 2
+    module_name, function_name, _ = command
+    module = sys.modules[__name__] if module_name is None else importlib.import_module(module_name)
+    return getattr(module, function_name)(argv[1:]) or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())